@@ -0,0 +1,53 @@
+"""
+Measures import time of the package and its entry points, each in a fresh
+interpreter, and lists the heavy dependencies each one loads.
+
+Run with: python benchmarks/bench_import.py
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+
+RUNS = 10
+
+# Modules that should only be imported by the code that needs them
+HEAVY_MODULES = ("asyncio", "iso639", "multiprocessing", "pymediainfo", "rich")
+
+STATEMENTS = (
+    "import video_utils",
+    "from video_utils import parse_episode",
+    "from video_utils import validators",
+    "from video_utils import Video",
+    "from video_utils import FileMap",
+)
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+loaded = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps([elapsed, loaded]))
+"""
+
+
+def measure(statement: str):
+    code = MEASURE.format(statement=statement, heavy=HEAVY_MODULES)
+    times = []
+    for _ in range(RUNS):
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+        elapsed, loaded = json.loads(output)
+        times.append(elapsed)
+    return statistics.median(times), loaded
+
+
+if __name__ == "__main__":
+    for statement in STATEMENTS:
+        elapsed, loaded = measure(statement)
+        print(
+            f"{statement:<40} {elapsed * 1000:7.1f} ms  loads: {', '.join(loaded) or '-'}"
+        )
@@ -0,0 +1,52 @@
+"""
+Compares looking up every cached video in a directory via the FileMap index with
+the previous list membership scan.
+
+Run with: python benchmarks/bench_index.py
+"""
+
+import time
+
+from video_utils import FileMap, Video
+
+DIR_PATH = "/library/show"
+
+
+def _list_scan(contents, video_names):
+    # Previous implementation: `video in list` followed by `next(...)`
+    for name in video_names:
+        video = Video(name=name, dir_path=DIR_PATH)
+        if video in contents[DIR_PATH]:
+            next(i for i in contents[DIR_PATH] if i == video)
+
+
+def _index_lookup(file_map, video_names):
+    for name in video_names:
+        file_map._get_video(DIR_PATH, name)
+
+
+def run(entries: int) -> None:
+    video_names = [f"show - 01x{i:05d} - episode.mkv" for i in range(entries)]
+    videos = [Video(name=name, dir_path=DIR_PATH) for name in video_names]
+
+    # The list scan is quadratic, so time a sample and extrapolate
+    sample = video_names[:: max(1, entries // 500)]
+    start = time.perf_counter()
+    _list_scan({DIR_PATH: videos}, sample)
+    list_time = (time.perf_counter() - start) * len(video_names) / len(sample)
+
+    file_map = FileMap(DIR_PATH)
+    file_map.contents = {DIR_PATH: videos}
+    start = time.perf_counter()
+    _index_lookup(file_map, video_names)
+    index_time = time.perf_counter() - start
+
+    print(
+        f"{entries:>7} entries: list scan {list_time:8.3f}s (extrapolated), "
+        f"index {index_time:8.4f}s, speedup {list_time / index_time:8.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    for entries in (1_000, 10_000, 20_000):
+        run(entries)
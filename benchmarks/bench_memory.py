@@ -0,0 +1,53 @@
+"""
+Measures the memory held by a library of cached videos, and the size of the
+library pickled, as built when the cache is loaded.
+
+Run with: python benchmarks/bench_memory.py
+"""
+
+import pickle
+import tracemalloc
+
+from video_utils import Codec, Resolution, Video
+
+SHOWS = 100
+EPISODES_PER_SHOW = 1_000
+
+
+def build_library():
+    videos = []
+    for show in range(SHOWS):
+        # Paths and values come from separate rows, so rebuild the strings per
+        # video like sqlite3 does
+        for episode in range(EPISODES_PER_SHOW):
+            videos.append(
+                Video(
+                    name=f"show {show} - 01x{episode:04d}.mkv",
+                    dir_path=f"/library/show {show}/season 1",
+                    codec=Codec("".join(["HE", "VC"])),
+                    quality="".join(["1080", "p"]),
+                    size_b=1_500_000_000,
+                    duration=1_436_031.0,
+                    resolution=Resolution.P1080,
+                )
+            )
+    return videos
+
+
+def run() -> None:
+    tracemalloc.start()
+    videos = build_library()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    pickled = len(pickle.dumps(videos))
+    count = len(videos)
+    print(
+        f"{count} videos: {current / 2**20:7.1f} MiB in memory "
+        f"({current / count:6.0f} B/video), {pickled / 2**20:7.1f} MiB pickled "
+        f"({pickled / count:5.0f} B/video)"
+    )
+
+
+if __name__ == "__main__":
+    run()
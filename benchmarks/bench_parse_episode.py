@@ -0,0 +1,69 @@
+"""
+Measures episode filename parsing throughput in names per second: one name at a
+time with the previous uncompiled pattern, then parse_episode, parse_episodes,
+and parse_episodes with the cache over a library where names repeat.
+
+Run with: python benchmarks/bench_parse_episode.py
+"""
+
+import logging
+import os
+import re
+import time
+
+from video_utils.parse_episode import parse_episode, parse_episodes
+
+log = logging.getLogger(__name__)
+
+PATTERN = (
+    r"(.*?)\ ?(?:\-\ ?)?\[?(?:[Ss](?=\d+[eE]\d+))?(\d+)[XxeE](\d+)\]?(?:\ ?\-)?\ ?(.*)"
+)
+
+
+def _previous_parse_episode(filename):
+    # Previous implementation: re.findall with a pattern string and eager logging
+    shortname = os.path.splitext(os.path.basename(filename))[0]
+    showName, season, episode, episodeName = re.findall(PATTERN, shortname)[0]
+    result = {
+        "showName": showName,
+        "episode": int(episode),
+        "season": int(season),
+        "episodeName": episodeName,
+    }
+    log.debug("Parsed %s from %s" % (filename, str(result)))
+    return result
+
+
+def _names(count, distinct):
+    return [
+        f"/library/Show {i % 50}/Show {i % 50} - s{i % 9 + 1:02d}e{i % distinct:02d} - Episode Title.mkv"
+        for i in range(count)
+    ]
+
+
+def _throughput(parse, names) -> float:
+    start = time.perf_counter()
+    parse(names)
+    return len(names) / (time.perf_counter() - start)
+
+
+def run(count: int) -> None:
+    names = _names(count, distinct=count)
+    repeated = _names(count, distinct=20)
+    results = {
+        "previous": _throughput(
+            lambda ns: [_previous_parse_episode(n) for n in ns], names
+        ),
+        "parse_episode": _throughput(lambda ns: [parse_episode(n) for n in ns], names),
+        "parse_episodes": _throughput(parse_episodes, names),
+        "parse_episodes(cache, repeated)": _throughput(
+            lambda ns: parse_episodes(ns, cache=True), repeated
+        ),
+    }
+    for name, names_per_second in results.items():
+        print(f"{count:>7} names, {name:<32} {names_per_second:>12,.0f} names/s")
+
+
+if __name__ == "__main__":
+    for count in (10_000, 100_000):
+        run(count)
@@ -0,0 +1,103 @@
+"""
+Compares filtering and totalling a 100k video cache with FileMap.query() and
+FileMap.totals() against loading every Video and filtering in Python. The cached
+paths don't exist, so videos are loaded the way load() reads them, without its
+pruning.
+
+Run with: python benchmarks/bench_query.py
+"""
+
+import os
+import random
+import tempfile
+import time
+
+from video_utils import Codec, FileMap, Resolution, Video
+from video_utils.fileMap import _FileMapStorage
+
+SHOWS = 1_000
+EPISODES_PER_SHOW = 100
+ROOT = "/library"
+CODECS = ("AVC", "HEVC", "AV1", "MPEG-4 Visual")
+QUALITIES = (
+    ("720p", Resolution.P720),
+    ("1080p", Resolution.P1080),
+    ("2160p", Resolution.P2160),
+    ("SD", Resolution.P576),
+)
+GB = 1024**3
+
+
+def populate() -> None:
+    rng = random.Random(0)
+    storage = _FileMapStorage(ROOT)
+    for show in range(SHOWS):
+        videos = []
+        for episode in range(EPISODES_PER_SHOW):
+            quality, resolution = rng.choice(QUALITIES)
+            videos.append(
+                Video(
+                    f"show {show} - 01x{episode:03d}.mkv",
+                    f"{ROOT}/show {show}",
+                    codec=Codec(rng.choice(CODECS)),
+                    quality=quality,
+                    resolution=resolution,
+                    size_b=rng.randint(GB // 10, 8 * GB),
+                    duration=rng.uniform(1e6, 3e6),
+                )
+            )
+        storage.save_videos(videos)
+    storage.close()
+
+
+def timed(description: str, function) -> None:
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{description:<46} {elapsed * 1000:9.2f}ms  ({len(result)} results)")
+
+
+def load_and_filter() -> list:
+    return [
+        video
+        for videos in _FileMapStorage(ROOT).load().values()
+        for video in videos
+        if video.codec == Codec("AVC")
+        and video.quality == "1080p"
+        and video.size_b >= 4 * GB
+    ]
+
+
+def load_and_total() -> dict:
+    totals: dict = {}
+    for videos in _FileMapStorage(ROOT).load().values():
+        for video in videos:
+            name = video.codec.format_name
+            totals[name] = totals.get(name, 0) + video.duration
+    return totals
+
+
+def run() -> None:
+    with tempfile.TemporaryDirectory() as home:
+        # The cache lives under ~/.cache, so point it at a scratch directory
+        os.environ["HOME"] = home
+        populate()
+        file_map = FileMap(ROOT)
+
+        timed("load + filter AVC 1080p >= 4GB", load_and_filter)
+        timed(
+            "query(codec, quality, min_size)",
+            lambda: file_map.query(codec="AVC", quality="1080p", min_size=4 * GB),
+        )
+        timed("query(min_size=7.9GB)", lambda: file_map.query(min_size=int(7.9 * GB)))
+        timed("load + total duration per codec", load_and_total)
+        timed("totals(by='codec')", lambda: file_map.totals(by="codec"))
+        timed(
+            "totals(by='quality', codec='AVC')",
+            lambda: file_map.totals(by="quality", codec="AVC"),
+        )
+        file_map.close()
+
+
+if __name__ == "__main__":
+    run()
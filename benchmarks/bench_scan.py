@@ -0,0 +1,194 @@
+"""
+Measures scans of a synthetic library with MediaInfo faked at a fixed latency:
+
+- load_cold: the first load, probing every file
+- load_warm: a load with nothing changed, skipping every directory
+- load_warm_force: load(force=True) with nothing changed, checking every file
+- load_partial: a load after changing, adding and deleting some of the files
+- load_partial_force: load(force=True) after that, which also finds files that
+  changed in place without touching their directory's mtime
+- storage_load: _FileMapStorage.load of the whole library
+- storage_save_videos: _FileMapStorage.save_videos of the whole library into an
+  empty cache
+
+Results are written as JSON. Pass an earlier result file with --compare to print
+how each measurement changed.
+
+Run with: python benchmarks/bench_scan.py [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+from os import path
+from typing import Callable, Dict, List, Optional
+from unittest.mock import patch
+
+from synthetic_library import FakeMediaInfo, LibraryShape, build_library, mutate_library
+
+from video_utils import FileMap
+from video_utils.fileMap import _FileMapStorage
+
+# Measurements slower than their baseline by more than this ratio are flagged
+REGRESSION_THRESHOLD = 1.1
+
+
+def parse_args() -> argparse.Namespace:
+    defaults = LibraryShape()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--fanout", type=int, default=defaults.fanout)
+    parser.add_argument("--files", type=int, default=defaults.files_per_directory)
+    parser.add_argument("--file-size", type=int, default=defaults.file_size)
+    parser.add_argument("--changed", type=float, default=0.05)
+    parser.add_argument("--added", type=float, default=0.02)
+    parser.add_argument("--deleted", type=float, default=0.02)
+    parser.add_argument(
+        "--latency", type=float, default=0.002, help="seconds per faked MediaInfo"
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="bench_scan.json")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    return parser.parse_args()
+
+
+def timed(function: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def run_once(args: argparse.Namespace, work_dir: str) -> Dict[str, dict]:
+    """Builds a library in work_dir and takes every measurement once"""
+    shape = LibraryShape(args.depth, args.fanout, args.files, args.file_size)
+    root = path.join(work_dir, "library")
+    file_paths = build_library(root, shape)
+    # The cache lives under ~/.cache, so point it at a scratch directory
+    os.environ["HOME"] = path.join(work_dir, "home")
+
+    results: Dict[str, dict] = {}
+    file_map = FileMap(root, progress_bar=False, workers=args.workers)
+
+    def measure_load(name: str, force: bool = False) -> None:
+        start = time.perf_counter()
+        stats = file_map.load(force=force)
+        results[name] = {
+            "seconds": time.perf_counter() - start,
+            "files": len(file_paths),
+            "stats": stats.to_dict(),
+        }
+
+    with patch("pymediainfo.MediaInfo.parse", FakeMediaInfo(args.latency)):
+        measure_load("load_cold")
+        measure_load("load_warm")
+        measure_load("load_warm_force", force=True)
+        mutation = mutate_library(
+            file_paths, args.changed, args.added, args.deleted, args.file_size
+        )
+        file_paths = sorted(set(file_paths) - set(mutation.deleted)) + mutation.added
+        measure_load("load_partial")
+        measure_load("load_partial_force", force=True)
+    file_map.close()
+
+    storage = _FileMapStorage(path.realpath(root))
+    videos: List = []
+    seconds = timed(
+        lambda: videos.extend(v for d in storage.load().values() for v in d)
+    )
+    results["storage_load"] = {"seconds": seconds, "files": len(videos)}
+    storage.close()
+
+    os.environ["HOME"] = path.join(work_dir, "empty home")
+    storage = _FileMapStorage(path.realpath(root))
+    for video in videos:
+        video.dirty = True
+
+    def save() -> None:
+        storage.save_videos(videos)
+        storage.flush()
+
+    results["storage_save_videos"] = {"seconds": timed(save), "files": len(videos)}
+    storage.close()
+    return results
+
+
+def summarise(runs: List[Dict[str, dict]]) -> Dict[str, dict]:
+    """Keeps the median time of each measurement, and the details of the last run"""
+    summary = {}
+    for name, last in runs[-1].items():
+        times = [run[name]["seconds"] for run in runs]
+        seconds = statistics.median(times)
+        summary[name] = {
+            **last,
+            "seconds": seconds,
+            "runs": times,
+            "files_per_second": last["files"] / seconds if seconds else None,
+        }
+    return summary
+
+
+def package_version() -> str:
+    try:
+        return metadata.version("video_utils")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def compare(results: Dict[str, dict], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline['version']}):")
+    for name, result in results.items():
+        previous: Optional[dict] = baseline["results"].get(name)
+        if not previous:
+            print(f"  {name:<22} new")
+            continue
+        ratio = result["seconds"] / previous["seconds"]
+        flag = "  REGRESSION" if ratio > REGRESSION_THRESHOLD else ""
+        print(f"  {name:<22} {ratio:6.2f}x{flag}")
+
+
+def run() -> None:
+    args = parse_args()
+    runs = []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as work_dir:
+            runs.append(run_once(args, work_dir))
+    results = summarise(runs)
+
+    for name, result in results.items():
+        print(
+            f"{name:<22} {result['seconds']:8.3f}s "
+            f"{result['files_per_second']:>10.0f} files/s"
+        )
+
+    output = {
+        "benchmark": "scan",
+        "version": package_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            name: value
+            for name, value in vars(args).items()
+            if name not in ("output", "compare")
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    run()
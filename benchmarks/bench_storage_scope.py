@@ -0,0 +1,56 @@
+"""
+Loads one library from a cache shared by ten libraries and prints the SQLite
+query plan used by _FileMapStorage.load.
+
+Run with: python benchmarks/bench_storage_scope.py
+"""
+
+import os
+import tempfile
+import time
+
+from video_utils import Video
+from video_utils.fileMap import _FileMapStorage
+
+LIBRARIES = 10
+DIRECTORIES = 50
+VIDEOS_PER_DIRECTORY = 40
+
+
+def populate(root: str) -> None:
+    for library in range(LIBRARIES):
+        storage = _FileMapStorage(f"{root}/library-{library}")
+        for directory in range(DIRECTORIES):
+            dir_path = f"{root}/library-{library}/show-{directory}"
+            storage.save_videos(
+                [
+                    Video(f"episode-{episode}.mkv", dir_path, size_b=episode)
+                    for episode in range(VIDEOS_PER_DIRECTORY)
+                ]
+            )
+        # Commits its writes so the next library's handle can write
+        storage.close()
+
+
+def run() -> None:
+    with tempfile.TemporaryDirectory() as home:
+        # The cache lives under ~/.cache, so point it at a scratch directory
+        os.environ["HOME"] = home
+        root = os.path.join(home, "media")
+        populate(root)
+
+        storage = _FileMapStorage(f"{root}/library-3")
+        print("Query plan:")
+        for detail in storage.query_plan():
+            print(f"  {detail}")
+
+        start = time.perf_counter()
+        videos = sum(len(v) for v in storage.load().values())
+        elapsed = time.perf_counter() - start
+        total = LIBRARIES * DIRECTORIES * VIDEOS_PER_DIRECTORY
+        print(f"Loaded {videos} of {total} cached videos in {elapsed:.4f}s")
+        storage.close()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,112 @@
+"""
+Builds synthetic video libraries for benchmarks, and fakes MediaInfo for them.
+
+Files are sparse, so large libraries take little disk space. Each one starts with
+its own path so that no two files share a fingerprint and none are mistaken for
+moves. None are valid containers, so every probe falls back to MediaInfo.parse,
+which FakeMediaInfo replaces.
+"""
+
+import os
+import random
+import time
+from os import path
+from typing import List, NamedTuple
+
+from video_utils.probe import Metadata, Track
+
+
+class LibraryShape(NamedTuple):
+    # Levels of directories above the ones holding files
+    depth: int = 2
+    # Sub-directories per directory
+    fanout: int = 10
+    files_per_directory: int = 20
+    file_size: int = 256 * 1024
+
+
+class Mutation(NamedTuple):
+    changed: List[str]
+    added: List[str]
+    deleted: List[str]
+
+
+def build_library(root: str, shape: LibraryShape) -> List[str]:
+    """Creates the library under root and returns the paths of its files"""
+    directories = [root]
+    for level in range(shape.depth):
+        directories = [
+            path.join(directory, f"{'show' if level == 0 else 'season'} {i:03d}")
+            for directory in directories
+            for i in range(shape.fanout)
+        ]
+
+    file_paths = []
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+        for episode in range(shape.files_per_directory):
+            file_path = path.join(directory, f"episode - 01x{episode:03d}.mkv")
+            write_file(file_path, shape.file_size)
+            file_paths.append(file_path)
+    return file_paths
+
+
+def write_file(file_path: str, size: int) -> None:
+    with open(file_path, "wb") as f:
+        f.write(file_path.encode()[:size])
+        f.truncate(size)
+
+
+def mutate_library(
+    file_paths: List[str],
+    changed: float,
+    added: float,
+    deleted: float,
+    file_size: int = LibraryShape().file_size,
+    seed: int = 0,
+) -> Mutation:
+    """
+    Appends to, deletes and adds alongside the given ratios of files, chosen
+    with a fixed seed so that every run changes the same files
+    """
+    rng = random.Random(seed)
+    shuffled = rng.sample(file_paths, len(file_paths))
+    changed_count = int(len(file_paths) * changed)
+    deleted_count = int(len(file_paths) * deleted)
+    mutation = Mutation(
+        changed=shuffled[:changed_count],
+        added=[
+            path.join(path.dirname(file_path), f"new - {i:06d}.mkv")
+            for i, file_path in enumerate(shuffled[: int(len(file_paths) * added)])
+        ],
+        deleted=shuffled[changed_count : changed_count + deleted_count],
+    )
+
+    for file_path in mutation.changed:
+        with open(file_path, "ab") as f:
+            f.write(b"\0" * 1024)
+    for file_path in mutation.deleted:
+        os.unlink(file_path)
+    for file_path in mutation.added:
+        write_file(file_path, file_size)
+    return mutation
+
+
+class FakeMediaInfo:
+    """
+    Stands in for MediaInfo.parse, returning 1080p AVC metadata after sleeping
+    for latency seconds to simulate reading the file
+    """
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+
+    def __call__(self, file_path: str) -> Metadata:
+        if self.latency:
+            time.sleep(self.latency)
+        return Metadata(
+            [
+                Track("Video", format="AVC", width=1920, height=1080, duration=1.4e6),
+                Track("Audio", format="AAC", language="en"),
+            ]
+        )
@@ -1,6 +1,64 @@
 # flake8: noqa: F401
-from .parse_episode import parse_episode
-from .fileMap import FileMap
-from . import validators
-from .codec import Codec
-from .video import Video, Resolution
+"""
+Public names are imported on first access (PEP 562), so importing the package
+for parse_episode or validators doesn't load the cache, MediaInfo or rich.
+"""
+
+import importlib
+from typing import TYPE_CHECKING
+
+# Imported eagerly as it's cheap, and because importing the parse_episode module
+# later would otherwise leave the module, not the function, as this attribute
+from .parse_episode import parse_episode, parse_episodes
+
+if TYPE_CHECKING:
+    from . import validators
+    from .codec import Codec
+    from .fileMap import FileMap, ScanEvent
+    from .scan_hooks import RichProgressHooks, ScanHooks
+    from .scan_stats import ScanStats
+    from .video import Resolution, Video
+
+# Public name -> module it's defined in
+_LAZY_ATTRIBUTES = {
+    "FileMap": ".fileMap",
+    "ScanEvent": ".fileMap",
+    "Codec": ".codec",
+    "ScanStats": ".scan_stats",
+    "ScanHooks": ".scan_hooks",
+    "RichProgressHooks": ".scan_hooks",
+    "Video": ".video",
+    "Resolution": ".video",
+}
+_LAZY_MODULES = ("validators",)
+
+__all__ = [
+    "Codec",
+    "FileMap",
+    "Resolution",
+    "RichProgressHooks",
+    "ScanEvent",
+    "ScanHooks",
+    "ScanStats",
+    "Video",
+    "parse_episode",
+    "parse_episodes",
+    "validators",
+]
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        value = getattr(module, name)
+    elif name in _LAZY_MODULES:
+        value = importlib.import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # Cache it so later lookups don't come through here
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted([*globals(), *__all__])
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Any, ClassVar, Dict, Optional, Self
 
 # TODO: Add automatic creation of additional info about codecs to here instead of validators?
 
@@ -25,18 +25,88 @@ CODEC_DATA = {
 }
 
 
+# Default format_name, only left in place by unpickling, which calls __new__
+# without arguments and then fills in the state
+_UNPICKLING: Any = object()
+
+
 class Codec:
+    __slots__ = ("_data", "_ffmpeg_name", "_frozen", "format_name", "pretty_name")
+
+    # Codecs created from just a format name are shared, as most videos in a
+    # library use one of a handful. They're read-only, as a change to one would
+    # change every video using it.
+    _shared: ClassVar[Dict[str, "Codec"]] = {}
+
+    def __new__(
+        cls,
+        format_name: Optional[str] = _UNPICKLING,
+        ffmpeg_name: Optional[str] = None,
+        pretty_name: Optional[str] = None,
+    ) -> Self:
+        if format_name is _UNPICKLING:
+            return super().__new__(cls)
+        if format_name is not None and ffmpeg_name is None and pretty_name is None:
+            shared = cls._shared.get(format_name)
+            if shared is None:
+                shared = cls._shared[format_name] = super().__new__(cls)
+                shared._setup(format_name, None, None)
+                object.__setattr__(shared, "_frozen", True)
+            return shared  # type: ignore[return-value]
+
+        codec = super().__new__(cls)
+        codec._setup(format_name, ffmpeg_name, pretty_name)
+        return codec
+
     def __init__(
         self,
-        format_name: str,
+        format_name: Optional[str] = _UNPICKLING,
         ffmpeg_name: Optional[str] = None,
         pretty_name: Optional[str] = None,
+    ) -> None:
+        # Set up by __new__, which can't tell Codec() apart from unpickling
+        if format_name is _UNPICKLING:
+            raise TypeError("Codec() missing required argument: 'format_name'")
+
+    def _setup(
+        self,
+        format_name: Optional[str],
+        ffmpeg_name: Optional[str],
+        pretty_name: Optional[str],
     ) -> None:
         self.format_name = format_name
         self._ffmpeg_name = ffmpeg_name
         self.pretty_name = pretty_name
+        self._data: Optional[dict] = None
         self._autodetect()
 
+    def __setattr__(self, name: str, value: object) -> None:
+        if getattr(self, "_frozen", False):
+            raise AttributeError(
+                f"{self!r} is shared and read-only; pass ffmpeg_name or "
+                "pretty_name to Codec() for a separate instance"
+            )
+        super().__setattr__(name, value)
+
+    def __delattr__(self, name: str) -> None:
+        if getattr(self, "_frozen", False):
+            raise AttributeError(f"{self!r} is shared and read-only")
+        super().__delattr__(name)
+
+    def __reduce__(self) -> tuple:
+        if self._shared.get(self.format_name) is self:
+            return type(self), (self.format_name,)
+        return type(self), (self.format_name, self._ffmpeg_name, self.pretty_name)
+
+    def __setstate__(self, state: dict) -> None:
+        # Pickles from before __slots__ hold the instance __dict__
+        self._setup(
+            state["format_name"], state.get("_ffmpeg_name"), state.get("pretty_name")
+        )
+
+    def __hash__(self) -> int:
+        return hash(self.format_name)
+
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Codec):
             # don't attempt to compare against unrelated types
@@ -1,7 +1,6 @@
-from colorama import Fore, Style
-
-
 def colour(colour: str, message: str) -> str:
+    from colorama import Fore, Style
+
     colours = {
         "green": Fore.GREEN,
         "blue": Fore.BLUE,
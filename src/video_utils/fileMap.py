@@ -1,20 +1,209 @@
+import copy
+import json
 import logging
 import os
 import pickle
 import sqlite3
+import threading
 import time
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from enum import Enum
+from functools import partial
+from collections.abc import Mapping
 from os import path
-from typing import Dict, List
-
-from rich.progress import track
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
+from .codec import Codec
 from .colour import colour
-from .validators import Filter
-from .video import Video
+from .parse_episode import parse_episode, parse_episodes
+from .probe import Track
+from .scan_hooks import RichProgressHooks, ScanHooks
+from .scan_stats import ScanStats
+from .validators import Filter, Validator
+from .video import Resolution, Video
+
+if TYPE_CHECKING:
+    import asyncio
+
+    from .probe_pool import ProbePool
+    from .watch import InotifySource, PollingSource
 
 log = logging.getLogger(__name__)
 
+# (mtime, entry count, sub-directory names) recorded for each scanned directory
+DirectoryState = Tuple[float, int, List[str]]
+
+# Version of the cache database layout, stored in SQLite's user_version.
+# Version 1 stored each Video as a pickle in video_cache.video_data.
+# Version 3 added video_cache.fingerprint, version 4 the probe_failures table and
+# version 5 video_cache.mtime and inode, version 6 the parsed episode columns and
+# version 7 the indexes used by queries.
+STORAGE_VERSION = 7
+
+# Number of cache writes grouped into a single transaction by default
+DEFAULT_BATCH_SIZE = 500
+
+# Seconds a write waits for another handle on the shared cache to commit
+BUSY_TIMEOUT = 30.0
+
+# Seconds before a file that failed to probe is retried, doubled on each failure
+FAILURE_RETRY_DELAY = 60 * 60
+MAX_FAILURE_RETRY_DELAY = 30 * 24 * 60 * 60
+
+# Seconds between checks of watch()'s stop event while nothing is changing
+WATCH_STOP_CHECK_INTERVAL = 1.0
+
+# Columns of video_cache that hold the Video itself, in _video_to_row order
+VIDEO_COLUMNS = (
+    "file_path",
+    "directory",
+    "name",
+    "codec",
+    "quality",
+    "resolution",
+    "size_b",
+    "duration",
+    "width",
+    "height",
+    "audio_languages",
+    "text_languages",
+    "schema_version",
+    "fingerprint",
+    "mtime",
+    "inode",
+)
+
+# Columns of video_cache parsed from the video's name, for episode lookups
+EPISODE_COLUMNS = ("show_name", "season", "episode")
+
+# Columns written for each video, in _video_to_row order
+ROW_COLUMNS = VIDEO_COLUMNS + EPISODE_COLUMNS
+
+# Columns added to video_cache since version 2, which older tables are altered to add
+ADDED_VIDEO_COLUMNS = {
+    "fingerprint": "TEXT",
+    "mtime": "REAL",
+    "inode": "INTEGER",
+    "show_name": "TEXT COLLATE NOCASE",
+    "season": "INTEGER",
+    "episode": "INTEGER",
+}
+
+# Columns FileMap.totals() can group by
+TOTALS_GROUPS = ("codec", "quality", "resolution", "directory", "show_name")
+
+# Upsert that keeps a row's original created_at
+UPSERT_VIDEO = f"""
+    INSERT INTO video_cache ({", ".join(ROW_COLUMNS)}, created_at, updated_at)
+    VALUES ({", ".join("?" * (len(ROW_COLUMNS) + 2))})
+    ON CONFLICT(file_path) DO UPDATE SET
+        {", ".join(f"{column} = excluded.{column}" for column in ROW_COLUMNS[1:])},
+        updated_at = excluded.updated_at
+"""
+
+
+class ScanEvent(Enum):
+    ADDED = "added"
+    UPDATED = "updated"
+    UNCHANGED = "unchanged"
+    REMOVED = "removed"
+    FAILED = "failed"
+    TIMED_OUT = "timed_out"
+
+
+class FileMapDiff(NamedTuple):
+    """Paths of the video files that differ between the filesystem and the cache"""
+
+    added: Set[str]
+    removed: Set[str]
+    modified: Set[str]
+
+
+class ProbeFailure(NamedTuple):
+    """
+    A file that couldn't be probed. It isn't probed again until its size or
+    mtime changes, or retry_at has passed.
+    """
+
+    size_b: int
+    mtime: float
+    error: str
+    attempts: int
+    retry_at: float
+
+
+class VideoRow(NamedTuple):
+    """
+    The cached columns of a video, as returned by FileMap.query(). Fields match
+    VIDEO_COLUMNS; resolution holds a Resolution value and the languages JSON.
+    """
+
+    file_path: str
+    directory: str
+    name: str
+    codec: Optional[str]
+    quality: Optional[str]
+    resolution: Optional[str]
+    size_b: Optional[int]
+    duration: Optional[float]
+    width: Optional[int]
+    height: Optional[int]
+    audio_languages: Optional[str]
+    text_languages: Optional[str]
+    schema_version: int
+    fingerprint: Optional[str]
+    mtime: Optional[float]
+    inode: Optional[int]
+
+    def to_video(self) -> Video:
+        """Builds the Video for this row, as loading it from the cache would"""
+        return _FileMapStorage._row_to_video(self)
+
+
+class VideoTotals(NamedTuple):
+    """Aggregates of a group of cached videos, as returned by FileMap.totals()"""
+
+    count: int
+    size_b: int
+    duration: float
+
+
+class _ContentsView(Mapping):
+    """
+    Read-only view of a FileMap's video index, exposing each directory as a tuple
+    of videos in insertion order. Lazily loaded directories are read from the
+    cache on first access.
+    """
+
+    def __init__(self, file_map: "FileMap") -> None:
+        self._file_map = file_map
+
+    def __getitem__(self, dir_path: str) -> Tuple[Video, ...]:
+        # A tuple, as the index isn't changed through the view
+        return tuple(self._file_map._directory_index(dir_path).values())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._file_map._index)
+
+    def __len__(self) -> int:
+        return len(self._file_map._index)
+
+    def __repr__(self) -> str:
+        return f"<Contents directories={len(self)}>"
+
 
 class FileMap:
     def __init__(
@@ -22,14 +211,58 @@ class FileMap:
         directory: str,
         update: bool = True,
         progress_bar: bool = True,
+        workers: Optional[int] = None,
+        lazy: bool = False,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        probe_timeout: Optional[float] = None,
+        stats_path: Optional[str] = None,
+        hooks: Optional[Iterable[ScanHooks]] = None,
     ):
         """
         update value is only honoured on object initialization
+        workers sets the number of threads used to probe videos; None probes serially
+        lazy makes load() only list the cached directories; each directory's videos
+        are read from the cache when first accessed. A lazy load doesn't prune or
+        update the cache, regardless of update.
+        batch_size is the most cache writes committed per transaction. Each
+        directory is also committed once saved, so no transaction is held while
+        files are probed and other FileMaps can write to the shared cache.
+        probe_timeout runs MediaInfo in worker processes, killing any that take
+        longer than this many seconds on a file; None runs it in-process
+        stats_path appends the ScanStats of each scan to this file as a line of JSON
+        hooks are ScanHooks called as each scan progresses; progress_bar adds a
+        RichProgressHooks bar to them
         """
+        self._storage: Optional[_FileMapStorage] = None
+        self._probe_pool: Optional["ProbePool"] = None
+        if probe_timeout:
+            from .probe_pool import ProbePool
+
+            self._probe_pool = ProbePool(probe_timeout)
+        self.batch_size: int = batch_size
         self.directory: str = directory
         self._update: bool = update
         self._progress_bar: bool = progress_bar
-        self.contents: Dict[str, List[Video]] = {}
+        self.workers: Optional[int] = workers
+        self.lazy: bool = lazy
+        self.stats_path: Optional[str] = stats_path
+        # Stats of the last scan, and of the scan in progress
+        self.scan_stats: Optional[ScanStats] = None
+        self._stats: Optional[ScanStats] = None
+        self.hooks: List[ScanHooks] = list(hooks or [])
+        # Hooks of the scan in progress, including any progress bar
+        self._hooks: List[ScanHooks] = []
+        # Keyed by directory, then by file name, so lookups and removals are O(1).
+        # Directories that haven't been read from the cache yet map to None.
+        self._index: Dict[str, Optional[Dict[str, Video]]] = {}
+        self._directories: Dict[str, DirectoryState] = {}
+        self._scanned_directories: Dict[str, DirectoryState] = {}
+        # Videos pruned during this scan, keyed by size, that a new path can adopt
+        self._orphans: Dict[int, List[Video]] = {}
+        # Files that failed to probe, keyed by directory then file name
+        self._failures: Dict[str, Dict[str, ProbeFailure]] = {}
+        # Names per directory whose failure was recorded or cleared but not saved
+        self._failure_changes: Dict[str, Set[str]] = {}
 
     @property
     def directory(self) -> str:
@@ -38,6 +271,35 @@ class FileMap:
     @directory.setter
     def directory(self, value: str) -> None:
         self._directory = path.realpath(value)
+        # The storage handle is scoped to the old directory
+        self.close()
+
+    @property
+    def contents(self) -> Mapping:
+        """
+        Read-only mapping of directory path to a tuple of the videos in it.
+        Assign a new dict to replace the contents.
+        """
+        return _ContentsView(self)
+
+    @contents.setter
+    def contents(self, value: Dict[str, List[Video]]) -> None:
+        self._index = {
+            dir_path: {video.name: video for video in videos}
+            for dir_path, videos in value.items()
+        }
+
+    @property
+    def failures(self) -> Dict[str, ProbeFailure]:
+        """
+        Mapping of file path to the recorded failure, for files that couldn't be
+        probed and are skipped by scans
+        """
+        return {
+            path.join(dir_path, name): failure
+            for dir_path, failures in self._failures.items()
+            for name, failure in failures.items()
+        }
 
     @property
     def update(self) -> bool:
@@ -47,64 +309,822 @@ class FileMap:
     def update(self, value: bool) -> None:
         self._update = value
 
-    def load(self) -> None:
-        storage = _FileMapStorage(self.directory)
-        self.contents = storage.load()
-        self._prune_missing_files()
-        if self.update:
-            self._update_content()
+    def load(self, force: bool = False) -> ScanStats:
+        """
+        Loads the cache and updates it from the filesystem. Directories whose mtime
+        hasn't changed since the last scan are skipped unless force is set.
+        Returns the scan's stats, which are also kept as scan_stats.
+        """
+        storage = self._get_storage()
+        stats = self._start_scan()
+        try:
+            with self._phase("cache_load"):
+                self._index = dict.fromkeys(storage.list_directories())
+                if self.lazy:
+                    return stats
+                self._directories = {} if force else storage.load_directories()
+                self._failures = storage.load_failures()
+            self._keep_orphans(self._prune_missing_files())
+            if self.update:
+                self._update_content()
+        finally:
+            self._orphans = {}
+            storage.flush()
+            self._finish_scan()
+        return stats
+
+    def iter_scan(
+        self, force: bool = False, keep_contents: bool = True
+    ) -> Iterator[Tuple[ScanEvent, Video]]:
+        """
+        Same as load(), but yields (event, video) as soon as each file is pruned or
+        processed. Each directory is saved to the cache once all of its videos have
+        been yielded. With keep_contents=False, videos are released from contents
+        once saved (they're re-read from the cache on access), bounding memory.
+        The scan's stats are kept as scan_stats once it finishes.
+        """
+        storage = self._get_storage()
+        self._start_scan()
+        try:
+            with self._phase("cache_load"):
+                self._index = dict.fromkeys(storage.list_directories())
+                self._directories = {} if force else storage.load_directories()
+                self._failures = storage.load_failures()
+            removed = self._prune_missing_files()
+            self._keep_orphans(removed)
+            for video in removed:
+                yield ScanEvent.REMOVED, video
+            if not keep_contents:
+                self._index = dict.fromkeys(self._index)
+            if self.update:
+                yield from self._scan_content(keep_contents)
+        finally:
+            self._orphans = {}
+            storage.flush()
+            self._finish_scan()
+
+    async def aload(self, force: bool = False, concurrency: int = 4) -> ScanStats:
+        """
+        asyncio version of load(). Directory walks, cache access and probes run on
+        the event loop's default executor, so many FileMaps can share one loop
+        without each starting its own thread pool. At most concurrency probes run
+        at once; cache writes are made by a single writer task, in directory order.
+        With hooks attached, each directory is saved before the next one starts,
+        so that they're called in scan order.
+        Returns the scan's stats, which are also kept as scan_stats.
+        """
+        import asyncio
+
+        storage = self._get_storage()
+        stats = self._start_scan()
+        try:
+            with self._phase("cache_load"):
+                directories = await asyncio.to_thread(storage.list_directories)
+                self._index = dict.fromkeys(directories)
+                if self.lazy:
+                    return stats
+                if force:
+                    self._directories = {}
+                else:
+                    self._directories = await asyncio.to_thread(
+                        storage.load_directories
+                    )
+                self._failures = await asyncio.to_thread(storage.load_failures)
+            self._keep_orphans(await asyncio.to_thread(self._prune_missing_files))
+            if self.update:
+                await self._aupdate_content(concurrency)
+        finally:
+            self._orphans = {}
+            await asyncio.to_thread(storage.flush)
+            self._finish_scan()
+        return stats
+
+    async def _aupdate_content(self, concurrency: int) -> None:
+        import asyncio
+
+        # The connection is shared with the writer task, so reads and writes take
+        # turns rather than running on two threads at once
+        storage_lock = asyncio.Lock()
+        semaphore = asyncio.Semaphore(concurrency)
+        queue: asyncio.Queue = asyncio.Queue()
+        writer = asyncio.create_task(self._awrite_directories(queue, storage_lock))
+
+        filter = Filter()
+        file_tree = iter(self._file_tree())
+        try:
+            while True:
+                entry = await asyncio.to_thread(next, file_tree, None)
+                if entry is None:
+                    break
+                dir_path, _, file_names = entry
+                log.info(colour("green", "Working in directory: %s" % dir_path))
+
+                video_files = filter.only_videos(file_names)
+                if self._hooks:
+                    # Hooks see the previous directory saved before this one starts
+                    await queue.join()
+                    if writer.done():
+                        # Raises the error that stopped it
+                        writer.result()
+                    self._call_hooks("directory_started", dir_path, video_files)
+                video_files = self._without_failures(dir_path, video_files)
+                async with storage_lock:
+                    cached, videos = await asyncio.to_thread(
+                        self._get_videos, dir_path, video_files
+                    )
+                results = await asyncio.gather(
+                    *(self._arefresh(semaphore, video) for video in videos)
+                )
+                for was_cached, video, result in zip(cached, videos, results):
+                    self._scan_result(dir_path, was_cached, video, *result)
+                queue.put_nowait(dir_path)
+        finally:
+            # Directories already probed are still saved if the scan fails
+            queue.put_nowait(None)
+            await writer
+
+    async def _arefresh(
+        self, semaphore: "asyncio.Semaphore", video: Video
+    ) -> Tuple[Union[bool, Exception], float]:
+        import asyncio
+
+        async with semaphore:
+            return await asyncio.to_thread(self._refresh, video)
+
+    async def _awrite_directories(
+        self, queue: "asyncio.Queue", storage_lock: "asyncio.Lock"
+    ) -> None:
+        import asyncio
+
+        while (dir_path := await queue.get()) is not None:
+            try:
+                async with storage_lock:
+                    await asyncio.to_thread(self._save_directory, dir_path)
+                # Called here rather than in _save_directory to stay on the
+                # loop's thread, like every other hook
+                if self._hooks:
+                    self._call_hooks("directory_saved", dir_path)
+            finally:
+                queue.task_done()
+
+    def diff(self) -> FileMapDiff:
+        """
+        Compares the filesystem against the cache using only directory listings
+        and stat, without probing or building any videos. A file is modified if
+        its size, mtime or inode differ from when it was last refreshed. Files
+        skipped after failing to probe aren't reported until they change.
+        The scan state of directories with modified files is cleared, so that
+        the next load() refreshes them too.
+        """
+        storage = self._get_storage()
+        cached = storage.load_stats()
+        failures = storage.load_failures()
+        added, modified = set(), set()
+
+        for file_path, stat in self._stat_videos():
+            stats = cached.pop(file_path, None)
+            if stats is None:
+                dir_path, name = path.split(file_path)
+                failure = failures.get(dir_path, {}).get(name)
+                if not failure or (failure.size_b, failure.mtime) != (
+                    stat.st_size,
+                    stat.st_mtime,
+                ):
+                    added.add(file_path)
+                continue
+
+            size_b, mtime, inode = stats
+            # Rows cached before mtime and inode were recorded only have a size
+            if (
+                size_b != stat.st_size
+                or mtime not in (None, stat.st_mtime)
+                or inode not in (None, stat.st_ino)
+            ):
+                modified.add(file_path)
+
+        if modified:
+            # Editing a file in place doesn't change its directory's mtime, which
+            # is all a scan checks before skipping the directory
+            stale = {path.dirname(file_path) for file_path in modified}
+            for dir_path in stale:
+                self._directories.pop(dir_path, None)
+            storage.remove_directories(stale)
+            storage.flush()
+        return FileMapDiff(added=added, removed=set(cached), modified=modified)
+
+    def episodes(self, show_name: str, season: Optional[int] = None) -> List[Video]:
+        """
+        The cached episodes of a show, optionally of one season, ordered by season
+        and episode. Read from the cache's episode index rather than contents.
+        """
+        return self._get_storage().load_episodes(show_name, season)
+
+    def duplicate_episodes(self) -> Dict[Tuple[str, int, int], List[Video]]:
+        """
+        The cached episodes that appear more than once, e.g. in several qualities,
+        keyed by (show name, season, episode)
+        """
+        return self._get_storage().load_duplicate_episodes()
+
+    def query(
+        self,
+        codec: Optional[Union[str, Codec]] = None,
+        quality: Optional[str] = None,
+        resolution: Optional[Union[str, Resolution]] = None,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+    ) -> List[VideoRow]:
+        """
+        The cached videos matching every given filter, ordered by path. Runs as
+        a query against the cache's indexes without building any Videos; call
+        to_video() on a row when one is needed. Sizes are in bytes, inclusive.
+        """
+        filters = self._query_filters(codec, quality, resolution, min_size, max_size)
+        return self._get_storage().query_videos(filters)
+
+    def totals(
+        self,
+        by: str = "codec",
+        codec: Optional[Union[str, Codec]] = None,
+        quality: Optional[str] = None,
+        resolution: Optional[Union[str, Resolution]] = None,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+    ) -> Dict[Optional[str], VideoTotals]:
+        """
+        The count, total size and total duration of the cached videos matching
+        the filters, grouped by one of TOTALS_GROUPS and keyed by that column's
+        value, e.g. the codec's format name
+        """
+        if by not in TOTALS_GROUPS:
+            raise ValueError(f"Can't group by {by}, only by one of {TOTALS_GROUPS}")
+        filters = self._query_filters(codec, quality, resolution, min_size, max_size)
+        return self._get_storage().load_totals(by, filters)
+
+    @staticmethod
+    def _query_filters(
+        codec: Optional[Union[str, Codec]],
+        quality: Optional[str],
+        resolution: Optional[Union[str, Resolution]],
+        min_size: Optional[int],
+        max_size: Optional[int],
+    ) -> Dict[str, object]:
+        """Converts query() filters to the values stored in the cache"""
+        if isinstance(codec, Codec):
+            codec = codec.format_name
+        if quality is not None:
+            Validator().quality(quality)
+        if resolution is not None:
+            resolution = Resolution(resolution).value
+        return {
+            "codec": codec,
+            "quality": quality,
+            "resolution": resolution,
+            "min_size": min_size,
+            "max_size": max_size,
+        }
+
+    def _stat_videos(
+        self, root: Optional[str] = None
+    ) -> Iterator[Tuple[str, os.stat_result]]:
+        """
+        Yields the path and stat of every video file under root, which defaults
+        to the directory
+        """
+        root = root or self.directory
+        filter = Filter()
+        if path.isfile(root):
+            if filter.only_videos([path.basename(root)]):
+                yield root, os.stat(root)
+            return
+
+        pending = [root]
+        while pending:
+            dir_path = pending.pop()
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = list(it)
+            except OSError as e:
+                log.debug(f"Unable to list {dir_path}: {e}")
+                continue
+
+            files = {}
+            for entry in entries:
+                if entry.is_dir():
+                    pending.append(entry.path)
+                else:
+                    files[entry.name] = entry
+            for name in filter.only_videos(list(files)):
+                try:
+                    yield files[name].path, files[name].stat()
+                except OSError as e:
+                    log.debug(f"Unable to stat {files[name].path}: {e}")
+
+    def watch(
+        self,
+        callback: Callable[[ScanEvent, Video], None],
+        stop: Optional[threading.Event] = None,
+        settle: float = 2.0,
+        use_inotify: bool = True,
+        poll_interval: float = 60.0,
+    ) -> None:
+        """
+        Loads the cache, then keeps it up to date until stop is set, calling
+        callback with each (event, video) as changes are applied.
+
+        On Linux changes are read from inotify; elsewhere, or with
+        use_inotify=False, a stat-only diff() is polled every poll_interval
+        seconds. Changes are applied once nothing has changed for settle
+        seconds, so a file is only probed after it has finished being written.
+        When polling, settle is at least poll_interval.
+        Only the changed files are refreshed, saved or removed.
+        """
+        from .watch import InotifySource, PollingSource
+
+        stop = stop or threading.Event()
+
+        # Watching starts before the initial load so that nothing changed while
+        # it runs is missed. The first poll only runs once the load is done.
+        source: Union["InotifySource", "PollingSource"]
+        try:
+            if not use_inotify or path.isfile(self.directory):
+                raise OSError("inotify not requested")
+            source = InotifySource(self.directory)
+        except (OSError, AttributeError) as e:
+            log.info(f"Polling for changes every {poll_interval}s: {e}")
+            source = PollingSource(self._diff_paths, poll_interval)
+            # A file still being written only shows as changed at the next poll
+            settle = max(settle, poll_interval)
+
+        pending: Set[str] = set()
+        try:
+            self.load()
+            while not stop.is_set():
+                changed = source.wait(settle if pending else WATCH_STOP_CHECK_INTERVAL)
+                if changed:
+                    pending |= changed
+                    continue
+                if pending:
+                    for event, video in self._refresh_paths(pending):
+                        callback(event, video)
+                    pending = set()
+        finally:
+            source.close()
+            self._get_storage().flush()
+
+    def _diff_paths(self) -> Set[str]:
+        diff = self.diff()
+        return diff.added | diff.removed | diff.modified
+
+    def _refresh_paths(self, paths: Iterable[str]) -> List[Tuple[ScanEvent, Video]]:
+        """
+        Applies changes to the given files and directories. Removals are applied
+        first so that files moved within the batch reuse their metadata.
+        """
+        filter = Filter()
+        removed: List[Video] = []
+        present: Dict[str, List[str]] = {}
+        for changed_path in sorted(paths):
+            if path.isdir(changed_path):
+                # Everything under a new or moved-in directory
+                for file_path, _ in self._stat_videos(changed_path):
+                    dir_path, name = path.split(file_path)
+                    present.setdefault(dir_path, []).append(name)
+                # The directory may also have replaced a cached one
+                removed.extend(self._forget_missing(changed_path))
+            elif path.exists(changed_path):
+                dir_path, name = path.split(changed_path)
+                if filter.only_videos([name]):
+                    present.setdefault(dir_path, []).append(name)
+            else:
+                removed.extend(self._forget_missing(changed_path))
+
+        events = [(ScanEvent.REMOVED, video) for video in removed]
+        if removed:
+            self._get_storage().remove_existing_files(
+                {video.full_path for video in removed}
+            )
+        self._keep_orphans(removed)
+        try:
+            for dir_path, names in present.items():
+                for name in self._without_failures(dir_path, sorted(set(names))):
+                    events.append(self._update_video(dir_path, name))
+                self._save_directory(dir_path)
+            # Failures of removed files are forgotten in directories not refreshed
+            for dir_path in list(self._failure_changes):
+                self._save_directory(dir_path)
+        finally:
+            self._orphans = {}
+            self._get_storage().flush()
+        return events
+
+    def _forget_missing(self, changed_path: str) -> List[Video]:
+        """
+        Drops the cached videos and failures whose files are gone, for a file or
+        for everything under a directory
+        """
+        prefix = changed_path.rstrip("/") + "/"
+        removed = []
+        for dir_path in dict.fromkeys([*self._index, *self._failures]):
+            if dir_path == changed_path or dir_path.startswith(prefix):
+                removed.extend(self._forget_files(dir_path))
+        dir_path, name = path.split(changed_path)
+        removed.extend(self._forget_files(dir_path, {name}))
+        return removed
+
+    def _forget_files(
+        self, dir_path: str, names: Optional[Set[str]] = None
+    ) -> List[Video]:
+        """
+        Drops the cached videos and failures in a directory, or just the given
+        names, whose files no longer exist
+        """
+        removed = []
+        if dir_path in self._index:
+            videos = self._directory_index(dir_path)
+            for name in list(videos if names is None else names & videos.keys()):
+                if not path.exists(path.join(dir_path, name)):
+                    removed.append(videos.pop(name))
+
+        failures = self._failures.get(dir_path, {})
+        for name in list(failures if names is None else names & failures.keys()):
+            if not path.exists(path.join(dir_path, name)):
+                self._clear_failure(dir_path, name)
+        return removed
+
+    def close(self) -> None:
+        """
+        Commits pending cache writes, closes the cache database and stops any
+        probe worker processes
+        """
+        if self._storage is not None:
+            self._storage.close()
+            self._storage = None
+        if self._probe_pool is not None:
+            self._probe_pool.close()
+
+    def _start_scan(self) -> ScanStats:
+        """Starts the stats and hooks of a scan"""
+        self._stats = ScanStats(self.directory)
+        self._get_storage().scan_stats = self._stats
+        self._hooks = list(self.hooks)
+        if self._progress_bar:
+            self._hooks.append(RichProgressHooks())
+        if self._hooks:
+            self._call_hooks("scan_started", self.directory)
+        return self._stats
+
+    def _finish_scan(self) -> None:
+        """Completes the stats of the scan in progress and writes them out"""
+        stats, self._stats = self._stats, None
+        hooks, self._hooks = self._hooks, []
+        if self._storage is not None:
+            self._storage.scan_stats = None
+        for hook in hooks:
+            hook.scan_finished(self.directory)
+        if stats is None:
+            return
+        stats.finish()
+        self.scan_stats = stats
+        log.debug(f"Scan stats: {stats.to_json()}")
+        if self.stats_path:
+            try:
+                with open(self.stats_path, "a") as f:
+                    f.write(stats.to_json() + "\n")
+            except OSError as e:
+                log.error(f"Failed to write scan stats to {self.stats_path}: {e}")
+
+    def _phase(self, name: str):
+        """Times a phase of the scan in progress, if there is one"""
+        return self._stats.phase(name) if self._stats else nullcontext()
+
+    def _call_hooks(self, name: str, *args) -> None:
+        """Calls a method of every hook of the scan in progress"""
+        for hook in self._hooks:
+            getattr(hook, name)(*args)
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        if self._stats:
+            self._stats.count(name, amount)
+
+    def _get_storage(self) -> "_FileMapStorage":
+        if self._storage is None:
+            self._storage = _FileMapStorage(self.directory, batch_size=self.batch_size)
+        return self._storage
+
+    def _directory_index(self, dir_path: str) -> Dict[str, Video]:
+        """
+        Returns the videos in a directory keyed by name, reading them from the cache
+        if the directory was lazily loaded
+        """
+        videos = self._index[dir_path]
+        if videos is None:
+            storage = self._get_storage()
+            with self._phase("cache_load"):
+                videos = {
+                    video.name: video for video in storage.load_directory(dir_path)
+                }
+            self._index[dir_path] = videos
+        return videos
 
     def _update_content(self) -> None:
         """
         Update the contents of this filemap
         """
+        for _ in self._scan_content():
+            pass
+
+    def _scan_content(
+        self, keep_contents: bool = True
+    ) -> Iterator[Tuple[ScanEvent, Video]]:
         log.debug("Updating contents...")
         filter = Filter()
-        for dir_path, dir_names, file_names in self._file_tree():
-            log.info(colour("green", "Working in directory: %s" % dir_path))
+        executor = ThreadPoolExecutor(self.workers) if self.workers else None
+        try:
+            for dir_path, dir_names, file_names in self._file_tree():
+                log.info(colour("green", "Working in directory: %s" % dir_path))
+
+                video_files = filter.only_videos(file_names)
+                if self._hooks:
+                    self._call_hooks("directory_started", dir_path, video_files)
+                video_files = self._without_failures(dir_path, video_files)
+                log.debug("Total videos in %s: %s" % (dir_path, len(video_files)))
+
+                if executor:
+                    yield from self._update_videos_parallel(
+                        executor, dir_path, video_files
+                    )
+                else:
+                    for video_file in video_files:
+                        yield self._update_video(dir_path, video_file)
 
-            video_files = filter.only_videos(file_names)
-            log.debug("Total videos in %s: %s" % (dir_path, len(video_files)))
+                self._save_directory(dir_path)
+                if self._hooks:
+                    self._call_hooks("directory_saved", dir_path)
 
-            if self._progress_bar:
-                video_files = track(video_files, f"Processing {dir_path}...")
+                if not keep_contents and dir_path in self._index:
+                    self._index[dir_path] = None
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
 
-            for video_file in video_files:
-                self._update_video(dir_path, video_file)
+    def _save_directory(self, dir_path: str) -> None:
+        """
+        Saves the videos of a processed directory, then its scan state
+        """
+        with self._phase("save"):
+            saved = True
+            if dir_path in self._index:
+                saved = self._get_storage().save_videos(self.contents[dir_path])
 
-            # Save videos for this directory after processing
-            if dir_path in self.contents:
-                storage = _FileMapStorage(self.directory)
-                storage.save_videos(self.contents[dir_path])
+            names = self._failure_changes.pop(dir_path, None)
+            if names:
+                self._save_failures(dir_path, names)
 
-    def _update_video(self, dir_path: str, video_name: str) -> None:
-        if dir_path not in self.contents:
-            self.contents[dir_path] = []
+            # Only record the directory as scanned once its videos are saved, so
+            # that a failed save is retried by the next scan
+            state = self._scanned_directories.pop(dir_path, None)
+            if state and saved:
+                self._get_storage().save_directory(dir_path, *state)
+                self._directories[dir_path] = state
+            # Other handles on the shared cache can't write while this is open
+            self._get_storage().flush()
 
-        video = Video(name=video_name, dir_path=dir_path)
-        if video in self.contents[dir_path]:
-            log.debug(
-                f"Video ({video.full_path} already in cache. Checking for updates and replacing...)"
-            )
-            cached_video = next(i for i in self.contents[dir_path] if i == video)
+    def _update_videos_parallel(
+        self, executor: ThreadPoolExecutor, dir_path: str, video_files: List[str]
+    ) -> Iterator[Tuple[ScanEvent, Video]]:
+        """
+        Registers every video in contents first so ordering matches the serial scan,
+        then runs the (I/O bound) metadata probes concurrently on the executor
+        """
+        cached, videos = self._get_videos(dir_path, video_files)
+        refreshed = executor.map(self._refresh, videos)
+        for was_cached, video, result in zip(cached, videos, refreshed):
+            yield self._scan_result(dir_path, was_cached, video, *result)
 
-            # Check if cached video has outdated schema
-            schema_version = getattr(cached_video, "schema_version", 1)
+    def _get_videos(
+        self, dir_path: str, video_files: List[str]
+    ) -> Tuple[List[bool], List[Video]]:
+        """Whether each file was cached, and the videos to refresh for them"""
+        cached = [self._is_cached(dir_path, video_file) for video_file in video_files]
+        videos = [self._get_video(dir_path, video_file) for video_file in video_files]
+        return cached, videos
 
-            if schema_version < Video.SCHEMA_VERSION:
-                log.debug(
-                    f"Cached video has outdated schema, forcing refresh: {video.full_path}"
-                )
-                self.contents[dir_path].remove(cached_video)
-                video.refresh()
-                self.contents[dir_path].append(video)
+    def _update_video(self, dir_path: str, video_name: str) -> Tuple[ScanEvent, Video]:
+        was_cached = self._is_cached(dir_path, video_name)
+        video = self._get_video(dir_path, video_name)
+        return self._scan_result(dir_path, was_cached, video, *self._refresh(video))
+
+    def _refresh(self, video: Video) -> Tuple[Union[bool, Exception], float]:
+        """
+        Refreshes the video, returning the error rather than raising it so that
+        one broken file doesn't stop a scan, along with the seconds it took
+        """
+        start = time.perf_counter()
+        with self._phase("probe"):
+            try:
+                result = video.refresh(self._probe_pool)
+            except Exception as e:
+                result = e
+        return result, time.perf_counter() - start
+
+    def _scan_result(
+        self,
+        dir_path: str,
+        was_cached: bool,
+        video: Video,
+        result: Union[bool, Exception],
+        seconds: float,
+    ) -> Tuple[ScanEvent, Video]:
+        if isinstance(result, Exception):
+            self._record_failure(dir_path, video, result)
+            from .probe_pool import ProbeTimeout
+
+            if isinstance(result, ProbeTimeout):
+                event = ScanEvent.TIMED_OUT
             else:
-                # Use cached video and check if it needs refresh
-                video = cached_video
-                video.refresh()
+                event = ScanEvent.FAILED
         else:
-            video.refresh()
-            self.contents[dir_path].append(video)
+            self._clear_failure(dir_path, video.name)
+            event = self._scan_event(was_cached, result)
+
+        if self._stats:
+            self._stats.count(event.value)
+            if result is not False:
+                self._stats.record_probe(video.full_path, seconds, video.size_b)
+        if self._hooks:
+            if isinstance(result, Exception):
+                self._call_hooks("file_failed", event, video, result, seconds)
+            elif result:
+                self._call_hooks("file_probed", event, video, seconds)
+            else:
+                self._call_hooks("file_skipped", video.full_path, "unchanged")
+        return event, video
+
+    def _is_cached(self, dir_path: str, video_name: str) -> bool:
+        return dir_path in self._index and video_name in self._directory_index(dir_path)
+
+    @staticmethod
+    def _scan_event(was_cached: bool, refreshed: bool) -> ScanEvent:
+        if not was_cached:
+            return ScanEvent.ADDED
+        return ScanEvent.UPDATED if refreshed else ScanEvent.UNCHANGED
+
+    def _get_video(self, dir_path: str, video_name: str) -> Video:
+        """
+        Returns the cached video for this path, or a fresh one if it is new or its
+        cached schema is outdated. The returned video still needs refreshing.
+        """
+        if dir_path not in self._index:
+            self._index[dir_path] = {}
+        directory = self._directory_index(dir_path)
+
+        cached_video = directory.get(video_name)
+        if cached_video is None:
+            video = self._adopt_orphan(dir_path, video_name) or Video(
+                name=video_name, dir_path=dir_path
+            )
+            directory[video_name] = video
+            return video
+
+        log.debug(
+            f"Video ({cached_video.full_path} already in cache. Checking for updates and replacing...)"
+        )
+        # Check if cached video has outdated schema
+        schema_version = getattr(cached_video, "schema_version", 1)
+
+        if schema_version < Video.SCHEMA_VERSION:
+            log.debug(
+                f"Cached video has outdated schema, forcing refresh: {cached_video.full_path}"
+            )
+            # Re-insert so the replacement keeps the ordering of a newly found video
+            del directory[video_name]
+            video = Video(name=video_name, dir_path=dir_path)
+            directory[video_name] = video
+            return video
+
+        # Use cached video and check if it needs refresh
+        return cached_video
+
+    def _without_failures(self, dir_path: str, video_files: List[str]) -> List[str]:
+        """
+        Drops files that failed to probe and haven't changed or reached their
+        retry time since
+        """
+        failures = self._failures.get(dir_path)
+        if not failures:
+            return video_files
+        now = time.time()
+        remaining = []
+        for video_file in video_files:
+            file_path = path.join(dir_path, video_file)
+            if not self._skip_failure(file_path, failures.get(video_file), now):
+                remaining.append(video_file)
+                continue
+            self._count("skipped_failures")
+            if self._hooks:
+                self._call_hooks("file_skipped", file_path, "failed")
+        return remaining
+
+    @staticmethod
+    def _skip_failure(
+        file_path: str, failure: Optional[ProbeFailure], now: float
+    ) -> bool:
+        if failure is None or failure.retry_at <= now:
+            return False
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        if (stat.st_size, stat.st_mtime) != (failure.size_b, failure.mtime):
+            return False
+        log.debug(f"Skipping {file_path}, which failed to probe: {failure.error}")
+        return True
+
+    def _record_failure(self, dir_path: str, video: Video, error: Exception) -> None:
+        log.error(f"Failed to probe {video.full_path}: {error!r}")
+        # A broken file isn't kept as a video, even if an older version was cached
+        self._index.get(dir_path, {}).pop(video.name, None)
+        try:
+            stat = os.stat(video.full_path)
+        except OSError:
+            return
+
+        failures = self._failures.setdefault(dir_path, {})
+        previous = failures.get(video.name)
+        attempts = 1
+        if previous and (previous.size_b, previous.mtime) == (
+            stat.st_size,
+            stat.st_mtime,
+        ):
+            attempts = previous.attempts + 1
+        delay = min(FAILURE_RETRY_DELAY * 2 ** (attempts - 1), MAX_FAILURE_RETRY_DELAY)
+        failures[video.name] = ProbeFailure(
+            size_b=stat.st_size,
+            mtime=stat.st_mtime,
+            error=str(error) or type(error).__name__,
+            attempts=attempts,
+            retry_at=time.time() + delay,
+        )
+        self._failure_changes.setdefault(dir_path, set()).add(video.name)
+
+    def _clear_failure(self, dir_path: str, video_name: str) -> None:
+        failures = self._failures.get(dir_path)
+        if failures and failures.pop(video_name, None):
+            self._failure_changes.setdefault(dir_path, set()).add(video_name)
+
+    def _save_failures(self, dir_path: str, names: Set[str]) -> None:
+        storage = self._get_storage()
+        failures = self._failures.get(dir_path, {})
+        failed = {name: failures[name] for name in names if name in failures}
+        if failed:
+            storage.save_failures(dir_path, failed)
+            storage.remove_existing_files(
+                {path.join(dir_path, name) for name in failed}
+            )
+        cleared = {path.join(dir_path, name) for name in names - failed.keys()}
+        if cleared:
+            storage.remove_failures(cleared)
+
+    def _keep_orphans(self, removed: List[Video]) -> None:
+        """
+        Holds on to pruned videos so that new paths with the same content can
+        reuse their metadata instead of being probed
+        """
+        self._orphans = {}
+        for video in removed:
+            if video.fingerprint and video.size_b is not None:
+                self._orphans.setdefault(video.size_b, []).append(video)
+
+    def _adopt_orphan(self, dir_path: str, video_name: str) -> Optional[Video]:
+        """
+        Returns the pruned video this new path was moved or renamed from, if any.
+        Only files whose size matches an orphan are fingerprinted.
+        """
+        if not self._orphans:
+            return None
+
+        video = Video(name=video_name, dir_path=dir_path)
+        try:
+            candidates = self._orphans.get(video.get_current_size())
+        except OSError:
+            return None
+        if not candidates:
+            return None
+
+        fingerprint = video.get_current_fingerprint()
+        for orphan in candidates:
+            if orphan.fingerprint == fingerprint:
+                candidates.remove(orphan)
+                log.debug(f"{orphan.full_path} was moved to {video.full_path}")
+                # Copied so the pruned video still reports its old path
+                moved = copy.copy(orphan)
+                moved.name = video_name
+                moved.dir_path = dir_path
+                moved.dirty = True
+                self._count("moved")
+                return moved
+        return None
 
     def _video_needs_refreshing(self, video: Video) -> None:
         pass
@@ -116,138 +1136,799 @@ class FileMap:
                 (path.dirname(self.directory), [], [path.basename(self.directory)])
             ]
         else:
-            file_tree = os.walk(self.directory, followlinks=True)
+            file_tree = self._walk()
         return file_tree
 
-    def _prune_missing_files(self) -> None:
-        log.info(colour("blue", "Checking for missing/deleted files..."))
-        missing_files = set()
+    def _walk(self):
+        """
+        Top-down walk of the directory tree like os.walk(followlinks=True), except
+        directories with an unchanged mtime are not listed or yielded; their
+        cached sub-directories are still descended into.
+        """
+        pending = [self.directory]
+        while pending:
+            dir_path = pending.pop()
+            with self._phase("walk"):
+                listing = self._list_directory(dir_path)
+            if listing is None:
+                continue
 
-        # Can't mutate the original while we iterate through it
-        contents_copy = deepcopy(self.contents)
-        for dir_path in contents_copy:
-            log.info(colour("blue", f"Processing directory {dir_path}"))
+            dir_names, file_names = listing
+            if file_names is not None:
+                yield dir_path, dir_names, file_names
+            pending.extend(path.join(dir_path, name) for name in reversed(dir_names))
 
-            if not path.exists(dir_path):
-                log.debug("Removing %s from cache" % dir_path)
-                del self.contents[dir_path]
-                continue
+    def _list_directory(
+        self, dir_path: str
+    ) -> Optional[Tuple[List[str], Optional[List[str]]]]:
+        """
+        Returns a directory's (sub-directory names, file names) for _walk. File
+        names are None for an unchanged directory, and the result is None if it
+        can't be read.
+        """
+        try:
+            mtime = os.stat(dir_path).st_mtime
+        except OSError as e:
+            log.debug(f"Unable to stat {dir_path}: {e}")
+            return None
+
+        cached = self._directories.get(dir_path)
+        if cached and cached[0] == mtime and not self._retry_due(dir_path):
+            log.debug(f"Skipping unchanged directory {dir_path}")
+            self._count("directories_skipped")
+            return cached[2], None
+
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError as e:
+            log.debug(f"Unable to list {dir_path}: {e}")
+            return None
+
+        dir_names, file_names = [], []
+        for entry in entries:
+            if entry.is_dir():
+                dir_names.append(entry.name)
+            else:
+                file_names.append(entry.name)
+        self._scanned_directories[dir_path] = (mtime, len(entries), dir_names)
+        self._count("directories_scanned")
+        return dir_names, file_names
+
+    def _retry_due(self, dir_path: str) -> bool:
+        """Whether a file in this directory is due to be probed again"""
+        now = time.time()
+        failures = self._failures.get(dir_path, {})
+        return any(failure.retry_at <= now for failure in failures.values())
+
+    def _directory_unchanged(self, dir_path: str) -> bool:
+        cached = self._directories.get(dir_path)
+        if not cached:
+            return False
+        try:
+            return os.stat(dir_path).st_mtime == cached[0]
+        except OSError:
+            return False
+
+    def _prune_missing_files(self) -> List[Video]:
+        """
+        Drops cached videos whose files are gone and returns them. Each changed
+        directory is listed once and compared against the cached names, and the
+        missing rows are deleted in a single batch.
+        """
+        with self._phase("prune"):
+            log.info(colour("blue", "Checking for missing/deleted files..."))
+            removed: List[Video] = []
+            missing_directories = set()
+            stale_failures = set()
+
+            # The index is mutated below, so iterate over a snapshot of its keys.
+            # Directories holding only failed files aren't in the index.
+            dir_paths = list(dict.fromkeys([*self._index, *self._failures]))
 
-            sub_directory = contents_copy[dir_path]
-            if self._progress_bar:
-                sub_directory = track(sub_directory)
+            for dir_path in dir_paths:
+                log.debug(f"Processing directory {dir_path}")
+                if self._directory_unchanged(dir_path):
+                    log.debug(f"Skipping unchanged directory {dir_path}")
+                    continue
 
-            for video in sub_directory:
-                if not path.exists(video.full_path):
-                    log.debug("Removing %s from cache" % video.full_path)
-                    self.contents[dir_path].remove(video)
-                    missing_files.add(video.full_path)
+                try:
+                    with os.scandir(dir_path) as entries:
+                        file_names = {entry.name for entry in entries}
+                except (FileNotFoundError, NotADirectoryError):
+                    log.debug("Removing %s from cache" % dir_path)
+                    if dir_path in self._index:
+                        removed.extend(self._directory_index(dir_path).values())
+                        del self._index[dir_path]
+                    failures = self._failures.pop(dir_path, {})
+                    stale_failures.update(
+                        path.join(dir_path, name) for name in failures
+                    )
+                    missing_directories.add(dir_path)
+                    continue
+                except OSError as e:
+                    log.warning(f"Unable to list {dir_path}, keeping its cache: {e}")
+                    continue
+
+                if dir_path in self._index:
+                    videos = self._directory_index(dir_path)
+                    for name in videos.keys() - file_names:
+                        log.debug("Removing %s from cache" % path.join(dir_path, name))
+                        removed.append(videos.pop(name))
 
-        # Update database to remove missing files
-        if missing_files:
-            storage = _FileMapStorage(self.directory)
-            storage.remove_existing_files(missing_files)
+                failures = self._failures.get(dir_path, {})
+                for name in failures.keys() - file_names:
+                    del failures[name]
+                    stale_failures.add(path.join(dir_path, name))
+
+            # Update database to remove missing files
+            if missing_directories:
+                self._get_storage().remove_directories(missing_directories)
+            if removed:
+                self._get_storage().remove_existing_files(
+                    {video.full_path for video in removed}
+                )
+            if stale_failures:
+                self._get_storage().remove_failures(stale_failures)
+            # Committed before any files are probed
+            self._get_storage().flush()
+        self._count("removed", len(removed))
+        return removed
 
 
 class _FileMapStorage:
-    def __init__(self, directory: str) -> None:
+    def __init__(self, directory: str, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        """
+        Writes are grouped into transactions of batch_size rows; call flush() or
+        close() to commit the remainder. The cache is shared by every library, so
+        callers should flush rather than leave a transaction open.
+        """
         self.directory = directory
+        self.batch_size = batch_size
+        self._storage_path = self._default_storage_path()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending_writes = 0
+        # Stats of the FileMap scan in progress, which commits are timed towards
+        self.scan_stats: Optional[ScanStats] = None
         self._init_database()
 
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # Shared with probe worker threads, but only ever used by one at a time
+            conn = sqlite3.connect(
+                self.storage_path, timeout=BUSY_TIMEOUT, check_same_thread=False
+            )
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    def _written(self, count: int) -> None:
+        """Counts writes in the open transaction, committing once a batch is full"""
+        self._pending_writes += count
+        if self._pending_writes >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Commit any writes that are still pending"""
+        if self._conn is not None and self._conn.in_transaction:
+            stats = self.scan_stats
+            try:
+                with stats.phase("commit") if stats else nullcontext():
+                    self._conn.commit()
+            except sqlite3.Error as e:
+                log.error(f"Failed to commit cache changes: {e}")
+        self._pending_writes = 0
+
+    def close(self) -> None:
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
     def _init_database(self) -> None:
         """Initialize SQLite database with required schema"""
-        with sqlite3.connect(self.storage_path) as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS video_cache (
-                    file_path TEXT PRIMARY KEY,
-                    directory TEXT NOT NULL,
-                    last_modified REAL NOT NULL,
-                    video_data BLOB NOT NULL,
-                    created_at REAL NOT NULL,
-                    updated_at REAL NOT NULL
-                )
-            """)
+        conn = self._connection()
+        if conn.execute("PRAGMA user_version").fetchone()[0] == STORAGE_VERSION:
+            # Already current; avoid taking a write lock another handle may hold
+            return
+
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(video_cache)")]
+        if "video_data" in columns:
+            conn.execute("ALTER TABLE video_cache RENAME TO video_cache_pickled")
+            conn.execute("DROP INDEX IF EXISTS idx_directory")
+
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS video_cache (
+                file_path TEXT PRIMARY KEY,
+                directory TEXT NOT NULL,
+                name TEXT NOT NULL,
+                codec TEXT,
+                quality TEXT,
+                resolution TEXT,
+                size_b INTEGER,
+                duration REAL,
+                width INTEGER,
+                height INTEGER,
+                audio_languages TEXT,
+                text_languages TEXT,
+                schema_version INTEGER NOT NULL,
+                fingerprint TEXT,
+                mtime REAL,
+                inode INTEGER,
+                show_name TEXT COLLATE NOCASE,
+                season INTEGER,
+                episode INTEGER,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        if columns and "video_data" not in columns:
+            for column, column_type in ADDED_VIDEO_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(
+                        f"ALTER TABLE video_cache ADD COLUMN {column} {column_type}"
+                    )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_directory ON video_cache(directory)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_episode ON video_cache(show_name, season, episode)"
+        )
+        # Covers the filters and aggregates of queries, including their scope
+        conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_query ON video_cache(
+                codec, quality, size_b, resolution, duration, directory
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_size ON video_cache(size_b)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS directory_cache (
+                directory TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                entry_count INTEGER NOT NULL,
+                sub_directories TEXT NOT NULL
+            )
+        """)
+
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS probe_failures (
+                file_path TEXT PRIMARY KEY,
+                directory TEXT NOT NULL,
+                size_b INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                error TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                retry_at REAL NOT NULL
+            )
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_failure_directory ON probe_failures(directory)"
+        )
+
+        if "video_data" in columns:
+            self._migrate_pickled_videos(conn)
+        self._backfill_episodes(conn)
+        conn.execute(f"PRAGMA user_version = {STORAGE_VERSION}")
+        conn.commit()
+
+    def _migrate_pickled_videos(self, conn: sqlite3.Connection) -> None:
+        """
+        Converts rows from the version 1 layout, which pickled whole Video objects,
+        into structured columns. Rows that can't be unpickled are dropped and will
+        be probed again on the next scan.
+        """
+        log.info("Migrating video cache to the compact format...")
+        cursor = conn.execute(
+            "SELECT video_data, created_at, updated_at FROM video_cache_pickled"
+        )
+        for video_data, created_at, updated_at in cursor.fetchall():
+            try:
+                video = pickle.loads(video_data)
+                row = self._video_to_row(video)
+            except Exception as e:
+                log.debug(f"Dropping unreadable cache entry: {e}")
+                continue
             conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_directory ON video_cache(directory)"
+                f"""
+                INSERT OR REPLACE INTO video_cache ({", ".join(ROW_COLUMNS)}, created_at, updated_at)
+                VALUES ({", ".join("?" * (len(ROW_COLUMNS) + 2))})
+                """,
+                (*row, created_at, updated_at),
+            )
+        conn.execute("DROP TABLE video_cache_pickled")
+
+    def _backfill_episodes(self, conn: sqlite3.Connection) -> None:
+        """Parses the episode columns of rows saved before they existed"""
+        rows = conn.execute(
+            "SELECT file_path, name FROM video_cache WHERE show_name IS NULL"
+        ).fetchall()
+        episodes = parse_episodes(name for _, name in rows)
+        conn.executemany(
+            "UPDATE video_cache SET show_name = ?, season = ?, episode = ? WHERE file_path = ?",
+            [
+                (episode["showName"], episode["season"], episode["episode"], file_path)
+                for (file_path, _), episode in zip(rows, episodes)
+                if episode
+            ],
+        )
+
+    @staticmethod
+    def _video_to_row(video: Video) -> tuple:
+        video_track = video.video_track
+        return (
+            video.full_path,
+            video.dir_path,
+            video.name,
+            video.codec.format_name if video.codec else None,
+            video.quality,
+            video.resolution.value if video.resolution else None,
+            video.size_b,
+            video.duration,
+            int(video_track.width) if video_track and video_track.width else None,
+            int(video_track.height) if video_track and video_track.height else None,
+            _languages_to_json(video.audio_tracks),
+            _languages_to_json(video.text_tracks),
+            getattr(video, "schema_version", 1),
+            getattr(video, "fingerprint", None),
+            getattr(video, "mtime", None),
+            getattr(video, "inode", None),
+            *_episode_columns(video.name),
+        )
+
+    @staticmethod
+    def _row_to_video(row: tuple) -> Video:
+        (
+            _,
+            directory,
+            name,
+            codec,
+            quality,
+            resolution,
+            size_b,
+            duration,
+            width,
+            height,
+            audio_languages,
+            text_languages,
+            schema_version,
+            fingerprint,
+            mtime,
+            inode,
+        ) = row
+        video = Video(
+            name=name,
+            dir_path=directory,
+            codec=Codec(codec) if codec else None,
+            quality=quality,
+            size_b=size_b,
+            duration=duration,
+            resolution=Resolution(resolution) if resolution else None,
+            schema_version=schema_version,
+            fingerprint=fingerprint,
+            mtime=mtime,
+            inode=inode,
+        )
+        video.dirty = False
+        # Track objects are only needed by a few callers, so build them on demand
+        video.defer_tracks(
+            partial(
+                _tracks_from_columns,
+                codec,
+                width,
+                height,
+                duration,
+                audio_languages,
+                text_languages,
             )
-            conn.commit()
+        )
+        return video
+
+    def _directory_scope(self, column: str = "directory") -> Tuple[str, tuple]:
+        """
+        WHERE clause matching this directory and everything below it. It's an
+        equality plus a range on the indexed directory column so SQLite can seek
+        instead of scanning, and unlike a LIKE prefix it doesn't match siblings
+        that share a prefix (/tv/show and /tv/show-extras).
+        """
+        prefix = self.directory.rstrip("/") + "/"
+        # "0" sorts directly after "/", so this range covers every sub-directory
+        upper_bound = prefix[:-1] + "0"
+        return (
+            f"({column} = ? OR ({column} >= ? AND {column} < ?))",
+            (self.directory, prefix, upper_bound),
+        )
+
+    def _scope(self, use_index: bool = True) -> Tuple[str, tuple]:
+        """
+        WHERE clause matching the videos under this storage's directory. Without
+        use_index, the directory index can't be used for it, leaving SQLite to
+        pick an index for the query's other terms.
+        """
+        if path.isfile(self.directory):
+            return "file_path = ?", (self.directory,)
+        # A unary + stops SQLite from using an index for a term
+        return self._directory_scope("directory" if use_index else "+directory")
+
+    def _filtered_scope(self, filters: Dict[str, object]) -> Tuple[str, tuple]:
+        """WHERE clause for query() filters within this storage's directory"""
+        terms, params = [], []
+        for column in ("codec", "quality", "resolution"):
+            if filters.get(column) is not None:
+                terms.append(f"{column} = ?")
+                params.append(filters[column])
+        if filters.get("min_size") is not None:
+            terms.append("size_b >= ?")
+            params.append(filters["min_size"])
+        if filters.get("max_size") is not None:
+            terms.append("size_b <= ?")
+            params.append(filters["max_size"])
+
+        # A codec or size range narrows the shared cache faster through idx_query
+        # or idx_size. Without one, the directory index finds only this library.
+        selective = any(
+            filters.get(name) is not None for name in ("codec", "min_size", "max_size")
+        )
+        where, scope_params = self._scope(use_index=not selective)
+        return " AND ".join([*terms, where]), (*params, *scope_params)
+
+    def _videos_query(self, filters: Dict[str, object]) -> Tuple[str, tuple]:
+        where, params = self._filtered_scope(filters)
+        return (
+            f"SELECT {', '.join(VIDEO_COLUMNS)} FROM video_cache WHERE {where}",
+            params,
+        )
+
+    def _totals_query(self, by: str, filters: Dict[str, object]) -> Tuple[str, tuple]:
+        where, params = self._filtered_scope(filters)
+        return (
+            f"""
+            SELECT {by}, COUNT(*), COALESCE(SUM(size_b), 0), COALESCE(SUM(duration), 0.0)
+            FROM video_cache WHERE {where} GROUP BY {by} ORDER BY {by}
+            """,
+            params,
+        )
+
+    def _load_query(self) -> Tuple[str, tuple]:
+        where, params = self._scope()
+        return (
+            f"SELECT {', '.join(VIDEO_COLUMNS)} FROM video_cache WHERE {where}",
+            params,
+        )
+
+    def query_plan(self) -> List[str]:
+        """
+        Returns SQLite's query plan for load(), to check it seeks the directory
+        index rather than scanning the whole shared cache
+        """
+        query, params = self._load_query()
+        cursor = self._connection().execute(f"EXPLAIN QUERY PLAN {query}", params)
+        return [detail for _, _, _, detail in cursor]
 
     def load(self) -> Dict[str, List[Video]]:
         data = {}
         log.debug("Loading from cache...")
         try:
-            with sqlite3.connect(self.storage_path) as conn:
-                cursor = conn.execute(
-                    "SELECT directory, video_data FROM video_cache WHERE file_path LIKE ?",
-                    (f"{self.directory}%",),
+            cursor = self._connection().execute(*self._load_query())
+            for row in cursor:
+                video = self._row_to_video(row)
+                data.setdefault(video.dir_path, []).append(video)
+
+        except (sqlite3.Error, ValueError) as e:
+            log.error(f"Failed to load cache from database: {e}. Ignoring cache...")
+
+        return data
+
+    def load_stats(
+        self,
+    ) -> Dict[str, Tuple[Optional[int], Optional[float], Optional[int]]]:
+        """Load the size, mtime and inode of each cached video, keyed by path"""
+        try:
+            where, params = self._scope()
+            cursor = self._connection().execute(
+                f"SELECT file_path, size_b, mtime, inode FROM video_cache WHERE {where}",
+                params,
+            )
+            return {file_path: stats for file_path, *stats in cursor}
+
+        except sqlite3.Error as e:
+            log.error(f"Failed to load file stats from database: {e}. Ignoring...")
+            return {}
+
+    def load_episodes(
+        self, show_name: str, season: Optional[int] = None
+    ) -> List[Video]:
+        """
+        Load the cached episodes of a show, ordered by season and episode. Show
+        names are matched case-insensitively.
+        """
+        where, params = self._scope()
+        query = f"SELECT {', '.join(VIDEO_COLUMNS)} FROM video_cache WHERE show_name = ? AND {where}"
+        params = (show_name, *params)
+        if season is not None:
+            query += " AND season = ?"
+            params += (season,)
+        try:
+            cursor = self._connection().execute(
+                f"{query} ORDER BY season, episode, file_path", params
+            )
+            return [self._row_to_video(row) for row in cursor]
+
+        except (sqlite3.Error, ValueError) as e:
+            log.error(f"Failed to load episodes from database: {e}. Ignoring...")
+            return []
+
+    def load_duplicate_episodes(self) -> Dict[Tuple[str, int, int], List[Video]]:
+        """
+        Load the episodes cached more than once, e.g. in different qualities,
+        keyed by (show name, season, episode). Show names that differ only in
+        case are grouped together under one of them.
+        """
+        data: Dict[Tuple[str, int, int], List[Video]] = {}
+        where, params = self._scope()
+        try:
+            cursor = self._connection().execute(
+                f"""
+                WITH scoped AS (
+                    SELECT * FROM video_cache WHERE show_name IS NOT NULL AND {where}
+                ), duplicates AS (
+                    SELECT show_name, season, episode FROM scoped
+                    GROUP BY show_name, season, episode HAVING COUNT(*) > 1
                 )
+                SELECT {", ".join(f"scoped.{column}" for column in VIDEO_COLUMNS)},
+                    duplicates.show_name, duplicates.season, duplicates.episode
+                FROM scoped JOIN duplicates USING (show_name, season, episode)
+                ORDER BY scoped.show_name, scoped.season, scoped.episode, scoped.file_path
+                """,
+                params,
+            )
+            for row in cursor:
+                video = self._row_to_video(row[: len(VIDEO_COLUMNS)])
+                data.setdefault(row[len(VIDEO_COLUMNS) :], []).append(video)
 
-                for directory, video_data_blob in cursor:
-                    if directory not in data:
-                        data[directory] = []
-                    video = pickle.loads(video_data_blob)
-                    data[directory].append(video)
+        except (sqlite3.Error, ValueError) as e:
+            log.error(
+                f"Failed to load duplicate episodes from database: {e}. Ignoring..."
+            )
 
-        except (sqlite3.Error, pickle.PickleError) as e:
-            log.error(f"Failed to load cache from database: {e}. Ignoring cache...")
+        return data
+
+    def query_videos(self, filters: Dict[str, object]) -> List[VideoRow]:
+        """Load the columns of the cached videos matching query() filters"""
+        try:
+            cursor = self._connection().execute(*self._videos_query(filters))
+            # Sorted here, as ORDER BY makes SQLite walk the primary key instead
+            # of seeking the query indexes. Rows start with their unique path.
+            return sorted(map(VideoRow._make, cursor))
+
+        except sqlite3.Error as e:
+            log.error(f"Failed to query videos from database: {e}. Ignoring...")
+            return []
+
+    def load_totals(
+        self, by: str, filters: Dict[str, object]
+    ) -> Dict[Optional[str], VideoTotals]:
+        """Load the totals of the videos matching query() filters, grouped by a column"""
+        try:
+            cursor = self._connection().execute(*self._totals_query(by, filters))
+            return {group: VideoTotals(*totals) for group, *totals in cursor}
+
+        except sqlite3.Error as e:
+            log.error(f"Failed to load totals from database: {e}. Ignoring...")
+            return {}
+
+    def list_directories(self) -> List[str]:
+        """List the cached directories without reading any videos"""
+        try:
+            where, params = self._scope()
+            cursor = self._connection().execute(
+                f"SELECT DISTINCT directory FROM video_cache WHERE {where}", params
+            )
+            return [directory for (directory,) in cursor]
+
+        except sqlite3.Error as e:
+            log.error(f"Failed to list directories from database: {e}. Ignoring...")
+            return []
+
+    def load_directory(self, directory: str) -> List[Video]:
+        """Load the cached videos of a single directory"""
+        try:
+            cursor = self._connection().execute(
+                f"SELECT {', '.join(VIDEO_COLUMNS)} FROM video_cache WHERE directory = ?",
+                (directory,),
+            )
+            return [self._row_to_video(row) for row in cursor]
+
+        except (sqlite3.Error, ValueError) as e:
+            log.error(f"Failed to load {directory} from database: {e}. Ignoring...")
+            return []
+
+    def load_directories(self) -> Dict[str, DirectoryState]:
+        """Load the mtime, entry count and sub-directories recorded per directory"""
+        data = {}
+        try:
+            where, params = self._directory_scope()
+            cursor = self._connection().execute(
+                f"SELECT directory, mtime, entry_count, sub_directories FROM directory_cache WHERE {where}",
+                params,
+            )
+            for directory, mtime, entry_count, sub_directories in cursor:
+                sub_directories = sub_directories.split("\n") if sub_directories else []
+                data[directory] = (mtime, entry_count, sub_directories)
+
+        except sqlite3.Error as e:
+            log.error(f"Failed to load directories from database: {e}. Ignoring...")
 
         return data
 
-    def save_videos(self, videos: List[Video]) -> None:
-        log.debug("Saving videos to cache...")
-        current_time = time.time()
+    def save_directory(
+        self,
+        directory: str,
+        mtime: float,
+        entry_count: int,
+        sub_directories: List[str],
+    ) -> None:
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO directory_cache VALUES (?, ?, ?, ?)",
+                (directory, mtime, entry_count, "\n".join(sub_directories)),
+            )
+            self._written(1)
+
+        except sqlite3.Error as e:
+            log.error(f"Failed to save directory to database: {e}")
 
+    def remove_directories(self, directories: set) -> None:
+        """Remove specified directories from the directory cache"""
         try:
-            with sqlite3.connect(self.storage_path) as conn:
-                for video in videos:
-                    file_path = video.full_path
-                    directory = video.dir_path
-                    last_modified = (
-                        video.get_current_size() if path.exists(file_path) else 0
-                    )
-                    video_data = pickle.dumps(video)
+            placeholders = ",".join("?" * len(directories))
+            self._connection().execute(
+                f"DELETE FROM directory_cache WHERE directory IN ({placeholders})",
+                list(directories),
+            )
+            self._written(len(directories))
 
-                    conn.execute(
-                        """
-                        INSERT OR REPLACE INTO video_cache 
-                        (file_path, directory, last_modified, video_data, created_at, updated_at)
-                        VALUES (?, ?, ?, ?, 
-                            COALESCE((SELECT created_at FROM video_cache WHERE file_path = ?), ?),
-                            ?)
-                    """,
-                        (
-                            file_path,
-                            directory,
-                            last_modified,
-                            video_data,
-                            file_path,
-                            current_time,
-                            current_time,
-                        ),
-                    )
+        except sqlite3.Error as e:
+            log.error(f"Failed to remove directories from cache: {e}")
+
+    def load_failures(self) -> Dict[str, Dict[str, ProbeFailure]]:
+        """Load the recorded probe failures, keyed by directory then file name"""
+        data: Dict[str, Dict[str, ProbeFailure]] = {}
+        try:
+            where, params = self._scope()
+            cursor = self._connection().execute(
+                f"SELECT file_path, directory, size_b, mtime, error, attempts, retry_at FROM probe_failures WHERE {where}",
+                params,
+            )
+            for file_path, directory, *failure in cursor:
+                name = path.basename(file_path)
+                data.setdefault(directory, {})[name] = ProbeFailure(*failure)
+
+        except sqlite3.Error as e:
+            log.error(f"Failed to load probe failures from database: {e}. Ignoring...")
+
+        return data
+
+    def save_failures(self, directory: str, failures: Dict[str, ProbeFailure]) -> None:
+        try:
+            self._connection().executemany(
+                "INSERT OR REPLACE INTO probe_failures VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (path.join(directory, name), directory, *failure)
+                    for name, failure in failures.items()
+                ],
+            )
+            self._written(len(failures))
+
+        except sqlite3.Error as e:
+            log.error(f"Failed to save probe failures to database: {e}")
+
+    def remove_failures(self, file_paths: set) -> None:
+        """Forget the failures of files that have changed, recovered or gone"""
+        try:
+            placeholders = ",".join("?" * len(file_paths))
+            self._connection().execute(
+                f"DELETE FROM probe_failures WHERE file_path IN ({placeholders})",
+                list(file_paths),
+            )
+            self._written(len(file_paths))
+
+        except sqlite3.Error as e:
+            log.error(f"Failed to remove probe failures from cache: {e}")
 
-                conn.commit()
+    def save_videos(self, videos: Iterable[Video]) -> bool:
+        """
+        Write the videos that have changed since they were loaded or saved.
+        Returns whether they were all written.
+        """
+        videos = [video for video in videos if video.dirty]
+        if not videos:
+            return True
 
-        except (sqlite3.Error, pickle.PickleError) as e:
+        log.debug(f"Saving {len(videos)} videos to cache...")
+        current_time = time.time()
+
+        try:
+            rows = [
+                (*self._video_to_row(video), current_time, current_time)
+                for video in videos
+            ]
+            self._connection().executemany(UPSERT_VIDEO, rows)
+            self._written(len(rows))
+            for video in videos:
+                video.dirty = False
+
+        except (sqlite3.Error, ValueError) as e:
             log.error(f"Failed to save videos to database: {e}")
+            return False
+        return True
 
     def remove_existing_files(self, files_to_remove: set) -> None:
         """Remove specified files from cache"""
         try:
-            with sqlite3.connect(self.storage_path) as conn:
-                if files_to_remove:
-                    placeholders = ",".join("?" * len(files_to_remove))
-                    conn.execute(
-                        f"DELETE FROM video_cache WHERE file_path IN ({placeholders})",
-                        list(files_to_remove),
-                    )
-                conn.commit()
+            if files_to_remove:
+                placeholders = ",".join("?" * len(files_to_remove))
+                self._connection().execute(
+                    f"DELETE FROM video_cache WHERE file_path IN ({placeholders})",
+                    list(files_to_remove),
+                )
+                self._written(len(files_to_remove))
 
         except sqlite3.Error as e:
             log.error(f"Failed to remove files from cache: {e}")
 
     @property
     def storage_path(self) -> str:
+        return self._storage_path
+
+    @staticmethod
+    def _default_storage_path() -> str:
         storage_path = path.join(path.expanduser("~"), ".cache", "video_utils")
         os.makedirs(storage_path, exist_ok=True)
         return path.join(storage_path, "cache.db")
+
+
+def _episode_columns(name: str) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    try:
+        episode = parse_episode(name, cache=True)
+    except ValueError:
+        return None, None, None
+    return episode["showName"], episode["season"], episode["episode"]  # type: ignore
+
+
+def _languages_to_json(tracks: Optional[List[object]]) -> Optional[str]:
+    if tracks is None:
+        return None
+    return json.dumps([getattr(track, "language", None) for track in tracks])
+
+
+def _tracks_from_columns(
+    codec: Optional[str],
+    width: Optional[int],
+    height: Optional[int],
+    duration: Optional[float],
+    audio_languages: Optional[str],
+    text_languages: Optional[str],
+) -> Tuple[Optional[Track], Optional[List[Track]], Optional[List[Track]]]:
+    video_track = None
+    if codec or width:
+        video_track = Track(
+            "Video", format=codec, width=width, height=height, duration=duration
+        )
+    return (
+        video_track,
+        _json_to_tracks("Audio", audio_languages),
+        _json_to_tracks("Text", text_languages),
+    )
+
+
+def _json_to_tracks(track_type: str, languages: Optional[str]) -> Optional[List[Track]]:
+    if languages is None:
+        return None
+    return [Track(track_type, language=language) for language in json.loads(languages)]
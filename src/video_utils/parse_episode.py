@@ -1,22 +1,30 @@
 import os
 import re
 import logging
-from typing import Optional, Tuple, Dict
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple, Dict
 
 log = logging.getLogger(__name__)
 
+EPISODE_PATTERN = re.compile(
+    r"(.*?)\ ?(?:\-\ ?)?\[?(?:[Ss](?=\d+[eE]\d+))?(\d+)[XxeE](\d+)\]?(?:\ ?\-)?\ ?(.*)"
+)
+
+# Keys of a parsed episode, in _parse_fields order
+EPISODE_FIELDS = ("showName", "episode", "season", "episodeName")
+
+# Number of filenames remembered when parsing with cache=True
+EPISODE_CACHE_SIZE = 4096
+
 
 def _split_data(filename: str) -> Tuple[str, str, str, str]:
-    results = re.findall(
-        r"(.*?)\ ?(?:\-\ ?)?\[?(?:[Ss](?=\d+[eE]\d+))?(\d+)[XxeE](\d+)\]?(?:\ ?\-)?\ ?(.*)",
-        filename,
-    )
-    if results:
-        return results[0]
+    match = EPISODE_PATTERN.search(filename)
+    if match:
+        return match.groups()  # type: ignore
     raise ValueError
 
 
-def parse_episode(filename: str) -> Dict[str, Optional[str]]:
+def _parse_fields(filename: str) -> tuple:
     shortname = os.path.basename(filename)
     shortname = os.path.splitext(shortname)[0]
     showName, season, episode, episodeName = _split_data(shortname)
@@ -26,11 +34,37 @@ def parse_episode(filename: str) -> Dict[str, Optional[str]]:
         episode = int(episode)
     except TypeError:
         log.debug("Failed to parse season or episode number")
-    result = {
-        "showName": showName,
-        "episode": episode,
-        "season": season,
-        "episodeName": episodeName,
-    }
-    log.debug("Parsed %s from %s" % (filename, str(result)))
-    return result
+    return showName, episode, season, episodeName
+
+
+# Holds tuples rather than dicts so callers can't modify a cached result
+_parse_fields_cached = lru_cache(maxsize=EPISODE_CACHE_SIZE)(_parse_fields)
+
+
+def parse_episode(filename: str, cache: bool = False) -> Dict[str, Optional[str]]:
+    """
+    cache remembers recently parsed filenames, for callers that parse the same
+    names repeatedly
+    """
+    fields = (_parse_fields_cached if cache else _parse_fields)(filename)
+    result = dict(zip(EPISODE_FIELDS, fields))
+    log.debug("Parsed %s from %s", filename, result)
+    return result  # type: ignore
+
+
+def parse_episodes(
+    filenames: Iterable[str], cache: bool = False
+) -> List[Optional[Dict[str, Optional[str]]]]:
+    """
+    Parses many filenames at once, in order. Filenames that don't look like an
+    episode give None instead of raising ValueError.
+    """
+    parse = _parse_fields_cached if cache else _parse_fields
+    results: List[Optional[Dict[str, Optional[str]]]] = []
+    for filename in filenames:
+        try:
+            results.append(dict(zip(EPISODE_FIELDS, parse(filename))))
+        except ValueError:
+            log.debug("Unable to parse an episode from %s", filename)
+            results.append(None)
+    return results
@@ -0,0 +1,454 @@
+"""
+Fast metadata probing that only reads container headers.
+
+Matroska/WebM files are probed from the EBML Segment Info and Tracks elements and
+MP4/MOV files from the moov box. Anything that can't be fully decided returns None
+so the caller can fall back to MediaInfo.
+"""
+
+import logging
+import struct
+from os import path
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# Largest element/box body we're willing to read into memory from a header
+MAX_HEADER_READ = 4 * 1024 * 1024
+
+MKV_EXTENSIONS = (".mkv", ".webm")
+MP4_EXTENSIONS = (".mp4", ".m4v", ".mov")
+
+# Matroska CodecID -> CODEC_DATA key
+MKV_CODECS = {
+    "V_MPEGH/ISO/HEVC": "HEVC",
+    "V_MPEG4/ISO/AVC": "AVC",
+    "V_AV1": "AV1",
+}
+
+# MP4 sample entry type -> CODEC_DATA key
+MP4_CODECS = {
+    b"hvc1": "HEVC",
+    b"hev1": "HEVC",
+    b"avc1": "AVC",
+    b"avc3": "AVC",
+    b"av01": "AV1",
+}
+
+# EBML element IDs
+EBML = 0x1A45DFA3
+DOC_TYPE = 0x4282
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+LANGUAGE = 0x22B59C
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+CLUSTER = 0x1F43B675
+
+MKV_TRACK_TYPES = {1: "Video", 2: "Audio", 0x11: "Text"}
+MP4_HANDLERS = {
+    b"vide": "Video",
+    b"soun": "Audio",
+    b"sbtl": "Text",
+    b"subt": "Text",
+    b"text": "Text",
+}
+
+
+class Track:
+    """
+    Minimal stand-in for a pymediainfo Track, holding only the fields Video uses
+    """
+
+    def __init__(
+        self,
+        track_type: str,
+        format: Optional[str] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        duration: Optional[float] = None,
+        language: Optional[str] = None,
+    ) -> None:
+        self.track_type = track_type
+        self.format = format
+        self.width = width
+        self.height = height
+        self.duration = duration
+        self.language = language
+
+    def __repr__(self) -> str:
+        return f"<Track track_type={self.track_type} format={self.format}>"
+
+
+class Metadata:
+    """
+    Minimal stand-in for pymediainfo's MediaInfo result
+    """
+
+    def __init__(self, tracks: List[Track]) -> None:
+        self.tracks = tracks
+
+    def _tracks(self, track_type: str) -> List[Track]:
+        return [track for track in self.tracks if track.track_type == track_type]
+
+    @property
+    def video_tracks(self) -> List[Track]:
+        return self._tracks("Video")
+
+    @property
+    def audio_tracks(self) -> List[Track]:
+        return self._tracks("Audio")
+
+    @property
+    def text_tracks(self) -> List[Track]:
+        return self._tracks("Text")
+
+
+def probe(file_path: str) -> Optional[Metadata]:
+    """
+    Reads the container header of a Matroska or MP4/MOV file. Returns None if the
+    file isn't supported or the header doesn't contain everything Video needs.
+    """
+    extension = path.splitext(file_path)[1].lower()
+    if extension in MKV_EXTENSIONS:
+        parser = _probe_mkv
+    elif extension in MP4_EXTENSIONS:
+        parser = _probe_mp4
+    else:
+        return None
+
+    try:
+        with open(file_path, "rb") as f:
+            metadata = parser(f)
+    except (OSError, EOFError, IndexError, ValueError, struct.error) as e:
+        log.debug(f"Fast probe failed for {file_path}: {e}")
+        return None
+
+    if metadata is None or not _complete(metadata):
+        log.debug(f"Fast probe couldn't decide on {file_path}")
+        return None
+    return metadata
+
+
+def _complete(metadata: Metadata) -> bool:
+    video_tracks = metadata.video_tracks
+    if not video_tracks:
+        return False
+    video_track = video_tracks[0]
+    # MediaInfo works out a duration from the media when the header has none,
+    # as with fragmented MP4s
+    return bool(
+        video_track.format
+        and video_track.width
+        and video_track.height
+        and video_track.duration
+    )
+
+
+# Matroska
+
+
+def _read_vint(f: BinaryIO, keep_marker: bool) -> Tuple[int, int]:
+    """
+    Reads an EBML variable length integer, returning (value, length). Unknown
+    sizes (all value bits set) are returned as -1.
+    """
+    first = f.read(1)
+    if not first:
+        raise EOFError
+    first_byte = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first_byte & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("Invalid EBML variable length integer")
+
+    rest = f.read(length - 1)
+    if len(rest) != length - 1:
+        raise EOFError
+    value = first_byte if keep_marker else first_byte & (mask - 1)
+    for byte in rest:
+        value = (value << 8) | byte
+
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return -1, length
+    return value, length
+
+
+def _ebml_elements(f: BinaryIO, end: Optional[int]) -> Iterator[Tuple[int, int, int]]:
+    """
+    Yields (element id, body offset, body size) for each element up to end, leaving
+    the file positioned at the start of each body. Callers that don't consume a
+    body are moved past it automatically.
+    """
+    while end is None or f.tell() < end:
+        try:
+            element_id, _ = _read_vint(f, keep_marker=True)
+            size, _ = _read_vint(f, keep_marker=False)
+        except EOFError:
+            return
+        start = f.tell()
+        yield element_id, start, size
+        if size < 0:
+            # Unknown sized elements (live streams) can't be skipped
+            return
+        f.seek(start + size)
+
+
+def _read_body(f: BinaryIO, size: int) -> bytes:
+    if size < 0 or size > MAX_HEADER_READ:
+        raise ValueError("Header element too large")
+    data = f.read(size)
+    if len(data) != size:
+        raise EOFError
+    return data
+
+
+def _ebml_uint(data: bytes) -> int:
+    return int.from_bytes(data, "big")
+
+
+def _ebml_float(data: bytes) -> float:
+    if len(data) == 4:
+        return struct.unpack(">f", data)[0]
+    if len(data) == 8:
+        return struct.unpack(">d", data)[0]
+    raise ValueError("Invalid EBML float")
+
+
+def _ebml_string(data: bytes) -> str:
+    return data.rstrip(b"\x00").decode("utf-8", "replace")
+
+
+def _probe_mkv(f: BinaryIO) -> Optional[Metadata]:
+    elements = _ebml_elements(f, None)
+    element_id, _, size = next(elements, (None, 0, 0))
+    if element_id != EBML:
+        return None
+    header = _read_body(f, size)
+    doc_type = _child_values(header).get(DOC_TYPE)
+    if doc_type is None or _ebml_string(doc_type) not in ("matroska", "webm"):
+        return None
+
+    element_id, start, size = next(elements, (None, 0, 0))
+    if element_id != SEGMENT:
+        return None
+
+    duration = None
+    tracks = None
+    segment_end = None if size < 0 else start + size
+    for element_id, _, size in _ebml_elements(f, segment_end):
+        if element_id == INFO:
+            duration = _mkv_duration(_read_body(f, size))
+        elif element_id == TRACKS:
+            tracks = _mkv_tracks(_read_body(f, size))
+        elif element_id == CLUSTER:
+            # Media data has started; anything after this isn't header
+            break
+        if tracks is not None and duration is not None:
+            break
+
+    if tracks is None:
+        return None
+    for track in tracks:
+        if track.track_type == "Video":
+            track.duration = duration
+    return Metadata(tracks)
+
+
+def _children(data: bytes) -> Iterator[Tuple[int, bytes]]:
+    """Yields (element id, body) for the child elements of an in-memory body"""
+    offset = 0
+    while offset < len(data):
+        first_byte = data[offset]
+        id_length = 8 - first_byte.bit_length() + 1
+        element_id = _ebml_uint(data[offset : offset + id_length])
+        offset += id_length
+
+        size_byte = data[offset]
+        size_length = 8 - size_byte.bit_length() + 1
+        if size_length > 8:
+            raise ValueError("Invalid EBML variable length integer")
+        size = size_byte & ((1 << (8 - size_length)) - 1)
+        for byte in data[offset + 1 : offset + size_length]:
+            size = (size << 8) | byte
+        offset += size_length
+
+        yield element_id, data[offset : offset + size]
+        offset += size
+
+
+def _child_values(data: bytes) -> dict:
+    return {element_id: body for element_id, body in _children(data)}
+
+
+def _mkv_duration(info: bytes) -> Optional[float]:
+    values = _child_values(info)
+    if DURATION not in values:
+        return None
+    timecode_scale = _ebml_uint(values.get(TIMECODE_SCALE, b"\x0f\x42\x40"))
+    # Duration is in timecode ticks (nanoseconds * scale); MediaInfo reports ms
+    return _ebml_float(values[DURATION]) * timecode_scale / 1_000_000
+
+
+def _mkv_tracks(tracks: bytes) -> List[Track]:
+    result = []
+    for element_id, entry in _children(tracks):
+        if element_id != TRACK_ENTRY:
+            continue
+        values = _child_values(entry)
+        track_type = MKV_TRACK_TYPES.get(_ebml_uint(values.get(TRACK_TYPE, b"")))
+        if track_type is None:
+            continue
+
+        # Matroska's default language is English when the element is absent
+        language = _ebml_string(values.get(LANGUAGE, b"eng"))
+        track = Track(track_type=track_type, language=language)
+        if track_type == "Video":
+            codec_id = _ebml_string(values.get(CODEC_ID, b""))
+            track.format = MKV_CODECS.get(codec_id)
+            video = _child_values(values.get(VIDEO, b""))
+            if PIXEL_WIDTH in video and PIXEL_HEIGHT in video:
+                track.width = _ebml_uint(video[PIXEL_WIDTH])
+                track.height = _ebml_uint(video[PIXEL_HEIGHT])
+        result.append(track)
+    return result
+
+
+# MP4 / QuickTime
+
+
+def _mp4_boxes(f: BinaryIO, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    Yields (box type, body offset, body end) for each box up to end, leaving the
+    file positioned at the start of each body
+    """
+    offset = f.tell()
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) != 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            raise ValueError("Invalid MP4 box size")
+
+        yield box_type, offset + header_size, min(offset + size, end)
+        offset += size
+
+
+def _find_box(
+    f: BinaryIO, start: int, end: int, box_type: bytes
+) -> Optional[Tuple[int, int]]:
+    f.seek(start)
+    for found_type, body_start, body_end in _mp4_boxes(f, end):
+        if found_type == box_type:
+            return body_start, body_end
+    return None
+
+
+def _read_box(f: BinaryIO, box: Tuple[int, int]) -> bytes:
+    f.seek(box[0])
+    return _read_body(f, box[1] - box[0])
+
+
+def _probe_mp4(f: BinaryIO) -> Optional[Metadata]:
+    f.seek(0, 2)
+    file_size = f.tell()
+    f.seek(0)
+    first = f.read(8)
+    if len(first) != 8 or first[4:8] not in (b"ftyp", b"moov", b"wide", b"free"):
+        return None
+
+    # moov may follow mdat at the end of the file; boxes are skipped, not read
+    moov = _find_box(f, 0, file_size, b"moov")
+    if moov is None:
+        return None
+
+    duration = None
+    mvhd = _find_box(f, moov[0], moov[1], b"mvhd")
+    if mvhd:
+        duration = _mp4_duration(_read_box(f, mvhd))
+
+    tracks = []
+    f.seek(moov[0])
+    traks = [
+        (start, end)
+        for box_type, start, end in _mp4_boxes(f, moov[1])
+        if box_type == b"trak"
+    ]
+    for trak in traks:
+        track = _mp4_track(f, trak)
+        if track:
+            if track.track_type == "Video" and track.duration is None:
+                track.duration = duration
+            tracks.append(track)
+    return Metadata(tracks)
+
+
+def _mp4_duration(data: bytes) -> Optional[float]:
+    """Parses the timescale and duration shared by the mvhd and mdhd layouts"""
+    if data[0] == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, 12)
+    # Fragmented files leave it 0, with the duration only in their fragments
+    if not timescale or not duration:
+        return None
+    return duration * 1000 / timescale
+
+
+def _mp4_language(data: bytes) -> Optional[str]:
+    """Unpacks the ISO 639-2/T code stored after the mdhd duration"""
+    offset = 32 if data[0] == 1 else 20
+    packed = struct.unpack_from(">H", data, offset)[0]
+    language = "".join(chr(((packed >> shift) & 0x1F) + 0x60) for shift in (10, 5, 0))
+    return language if language.isalpha() else None
+
+
+def _mp4_track(f: BinaryIO, trak: Tuple[int, int]) -> Optional[Track]:
+    mdia = _find_box(f, trak[0], trak[1], b"mdia")
+    if mdia is None:
+        return None
+    hdlr = _find_box(f, mdia[0], mdia[1], b"hdlr")
+    if hdlr is None:
+        return None
+    track_type = MP4_HANDLERS.get(_read_box(f, hdlr)[8:12])
+    if track_type is None:
+        return None
+
+    track = Track(track_type=track_type)
+    mdhd = _find_box(f, mdia[0], mdia[1], b"mdhd")
+    if mdhd:
+        data = _read_box(f, mdhd)
+        track.language = _mp4_language(data)
+        track.duration = _mp4_duration(data)
+
+    if track_type == "Video":
+        minf = _find_box(f, mdia[0], mdia[1], b"minf")
+        stbl = minf and _find_box(f, minf[0], minf[1], b"stbl")
+        stsd = stbl and _find_box(f, stbl[0], stbl[1], b"stsd")
+        if stsd:
+            # Only the first sample entry header is needed, not the codec config
+            f.seek(stsd[0])
+            data = f.read(8 + 8 + 32)
+            if len(data) == 48:
+                sample_type = data[12:16]
+                track.format = MP4_CODECS.get(sample_type)
+                track.width, track.height = struct.unpack_from(">HH", data, 16 + 24)
+    return track
@@ -0,0 +1,130 @@
+"""
+Runs MediaInfo in worker processes so a probe that hangs can be killed.
+
+Each worker handles one file at a time over a pipe. When a probe takes longer
+than the timeout its worker is killed and replaced, and ProbeTimeout is raised
+for that file only.
+"""
+
+import logging
+import multiprocessing
+import threading
+from multiprocessing.connection import Connection
+from typing import Any, Callable, List, Tuple
+
+from .probe import Metadata, Track
+
+log = logging.getLogger(__name__)
+
+
+class ProbeTimeout(Exception):
+    pass
+
+
+def media_info_metadata(file_path: str) -> Metadata:
+    """
+    Parses a file with MediaInfo, keeping only the track fields Video uses so the
+    result is cheap to send back from a worker
+    """
+    from pymediainfo import MediaInfo
+
+    media_info = MediaInfo.parse(file_path)
+    return Metadata(
+        [
+            Track(
+                track.track_type,
+                format=track.format,
+                width=track.width,
+                height=track.height,
+                duration=track.duration,
+                language=track.language,
+            )
+            for track in media_info.tracks
+        ]
+    )
+
+
+def _serve(conn: Connection, parse: Callable[[str], Any]) -> None:
+    while True:
+        try:
+            file_path = conn.recv()
+        except EOFError:
+            return
+        try:
+            result = (True, parse(file_path))
+        except Exception as e:
+            # The exception itself may not be picklable
+            result = (False, f"{type(e).__name__}: {e}")
+        conn.send(result)
+
+
+class _Worker:
+    def __init__(self, context, parse: Callable[[str], Any]) -> None:
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_serve, args=(child_conn, parse), daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+
+    def parse(self, file_path: str, timeout: float) -> Tuple[bool, Any]:
+        """Returns (True, result), or (False, error message) if parsing failed"""
+        self._conn.send(file_path)
+        if not self._conn.poll(timeout):
+            raise ProbeTimeout(f"Probing {file_path} took more than {timeout}s")
+        return self._conn.recv()
+
+    def close(self) -> None:
+        self._conn.close()
+        if self._process.is_alive():
+            self._process.kill()
+        self._process.join()
+
+
+class ProbePool:
+    """
+    Callable that parses a file in an idle worker process, starting one if none
+    is free, so there's a worker per concurrent caller
+    """
+
+    def __init__(
+        self, timeout: float, parse: Callable[[str], Any] = media_info_metadata
+    ) -> None:
+        self.timeout = timeout
+        self._parse = parse
+        # Forking a process that runs probe threads can deadlock the child
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn"
+        )
+        self._idle: List[_Worker] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, file_path: str) -> Any:
+        with self._lock:
+            worker = self._idle.pop() if self._idle else None
+        if worker is None:
+            worker = _Worker(self._context, self._parse)
+
+        try:
+            ok, result = worker.parse(file_path, self.timeout)
+        except ProbeTimeout:
+            log.error(f"Killing probe worker stuck on {file_path}")
+            worker.close()
+            raise
+        except (OSError, EOFError) as e:
+            # The worker died, e.g. MediaInfo crashed on the file
+            worker.close()
+            raise RuntimeError(f"Probe worker failed on {file_path}: {e}")
+
+        with self._lock:
+            self._idle.append(worker)
+        if not ok:
+            raise RuntimeError(result)
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.close()
@@ -0,0 +1,107 @@
+"""
+Callbacks for following a FileMap scan as it runs.
+
+Subclass ScanHooks, override the methods you need and pass instances to
+FileMap(hooks=[...]). Hooks are called from the thread running the scan, or
+the event loop's thread for aload(), in scan order, even when probes run on
+workers. A FileMap with no hooks attached doesn't build any of their
+arguments.
+"""
+
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    from rich.progress import Progress, TaskID
+
+    from .fileMap import ScanEvent
+    from .video import Video
+
+
+class ScanHooks:
+    """Does nothing for every event"""
+
+    def scan_started(self, directory: str) -> None:
+        """The scan of directory started, before missing files are pruned"""
+
+    def directory_started(self, dir_path: str, file_names: List[str]) -> None:
+        """A changed directory is about to be processed; file_names are its videos"""
+
+    def file_probed(self, event: "ScanEvent", video: "Video", seconds: float) -> None:
+        """A file's metadata was read, for a new (ADDED) or changed (UPDATED) file"""
+
+    def file_skipped(self, file_path: str, reason: str) -> None:
+        """
+        A file wasn't probed, either because its cached metadata is still current
+        (reason "unchanged", which includes moved files) or because it failed to
+        probe before and hasn't changed since (reason "failed")
+        """
+
+    def file_failed(
+        self, event: "ScanEvent", video: "Video", error: Exception, seconds: float
+    ) -> None:
+        """A file couldn't be probed (FAILED), or its probe timed out (TIMED_OUT)"""
+
+    def directory_saved(self, dir_path: str) -> None:
+        """A directory's videos and scan state were written to the cache"""
+
+    def scan_finished(self, directory: str) -> None:
+        """The scan ended, whether it completed or not"""
+
+
+class RichProgressHooks(ScanHooks):
+    """
+    A single rich progress bar for the whole scan. Its total grows as changed
+    directories are found, since they aren't listed up front.
+    """
+
+    def __init__(self) -> None:
+        self._progress: Optional["Progress"] = None
+        self._task: Optional["TaskID"] = None
+        self._total = 0
+
+    def scan_started(self, directory: str) -> None:
+        # Deferred as it's slow to import and not needed without a bar
+        from rich.progress import (
+            BarColumn,
+            MofNCompleteColumn,
+            Progress,
+            TextColumn,
+            TimeElapsedColumn,
+        )
+
+        progress = Progress(
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            MofNCompleteColumn(),
+            TimeElapsedColumn(),
+        )
+        self._total = 0
+        self._task = progress.add_task(f"Scanning {directory}...", total=None)
+        progress.start()
+        self._progress = progress
+
+    def directory_started(self, dir_path: str, file_names: List[str]) -> None:
+        self._total += len(file_names)
+        self._progress.update(  # type: ignore
+            self._task, total=self._total, description=f"Processing {dir_path}..."
+        )
+
+    def file_probed(self, event: "ScanEvent", video: "Video", seconds: float) -> None:
+        self._progress.advance(self._task)  # type: ignore
+
+    def file_skipped(self, file_path: str, reason: str) -> None:
+        self._progress.advance(self._task)  # type: ignore
+
+    def file_failed(
+        self, event: "ScanEvent", video: "Video", error: Exception, seconds: float
+    ) -> None:
+        self._progress.advance(self._task)  # type: ignore
+
+    def scan_finished(self, directory: str) -> None:
+        if self._progress is None:
+            return
+        self._progress.update(
+            self._task, total=self._total, description=f"Scanned {directory}"
+        )
+        self._progress.stop()
+        self._progress = None
@@ -0,0 +1,159 @@
+"""
+Timings and counts collected while a FileMap scans its directory.
+
+Phase times are exclusive: time spent in a phase nested inside another, such as
+a commit made while saving a directory, is only counted towards the inner one.
+"""
+
+import heapq
+import json
+import threading
+import time
+from contextlib import contextmanager
+from os import path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Phases reported by every scan, in the order they usually run
+PHASES = ("cache_load", "prune", "walk", "probe", "save", "commit")
+
+# Counters reported by every scan. The first six are the ScanEvent values.
+COUNTS = (
+    "added",
+    "updated",
+    "unchanged",
+    "removed",
+    "failed",
+    "timed_out",
+    "moved",
+    "skipped_failures",
+    "probes",
+    "directories_scanned",
+    "directories_skipped",
+)
+
+# Number of slowest files kept
+SLOWEST_FILES = 10
+
+PROC_IO = "/proc/self/io"
+
+
+class ScanStats:
+    """
+    Per-phase wall time, counts and slowest files of one scan. Probe time is
+    summed over all files, so with workers it can exceed the scan's total time.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.started_at = time.time()
+        self.total_time = 0.0
+        self.phases: Dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        self.counts: Dict[str, int] = dict.fromkeys(COUNTS, 0)
+        # Size of the files that were probed
+        self.bytes_probed = 0
+        # Bytes read by this process, from /proc/self/io; None where unavailable
+        self.bytes_read: Optional[int] = None
+        # (seconds, path) of the slowest probes, as a min-heap
+        self._slowest: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._start = time.perf_counter()
+        self._start_read = _read_bytes()
+
+    @property
+    def cache_hits(self) -> int:
+        return self.counts["unchanged"]
+
+    @property
+    def cache_misses(self) -> int:
+        return self.counts["added"]
+
+    @property
+    def cache_refreshes(self) -> int:
+        return self.counts["updated"]
+
+    @property
+    def slowest_files(self) -> List[Tuple[str, float]]:
+        """(path, seconds) of the slowest probes, slowest first"""
+        return [
+            (file_path, seconds) for seconds, file_path in sorted(self._slowest)[::-1]
+        ]
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        nested: List[float] = self._local.__dict__.setdefault("nested", [])
+        nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            inner = nested.pop()
+            with self._lock:
+                self.phases[name] += elapsed - inner
+            if nested:
+                nested[-1] += elapsed
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += amount
+
+    def record_probe(
+        self, file_path: str, seconds: float, size_b: Optional[int]
+    ) -> None:
+        with self._lock:
+            self.counts["probes"] += 1
+            self.bytes_probed += size_b or 0
+            entry = (seconds, file_path)
+            if len(self._slowest) < SLOWEST_FILES:
+                heapq.heappush(self._slowest, entry)
+            elif entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def finish(self) -> None:
+        self.total_time = time.perf_counter() - self._start
+        read = _read_bytes()
+        if read is not None and self._start_read is not None:
+            self.bytes_read = read - self._start_read
+
+    def to_dict(self) -> dict:
+        return {
+            "directory": self.directory,
+            "started_at": self.started_at,
+            "total_time": self.total_time,
+            "phases": dict(self.phases),
+            "counts": dict(self.counts),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_refreshes": self.cache_refreshes,
+            "bytes_probed": self.bytes_probed,
+            "bytes_read": self.bytes_read,
+            "slowest_files": [
+                {"path": file_path, "seconds": seconds}
+                for file_path, seconds in self.slowest_files
+            ],
+        }
+
+    def to_json(self) -> str:
+        """The stats as a single line of JSON"""
+        return json.dumps(self.to_dict())
+
+    def __repr__(self) -> str:
+        return (
+            f"<ScanStats {self.directory} total={self.total_time:.3f}s "
+            f"probes={self.counts['probes']}>"
+        )
+
+
+def _read_bytes() -> Optional[int]:
+    """Bytes this process has read so far (rchar), on Linux"""
+    if not path.exists(PROC_IO):
+        return None
+    try:
+        with open(PROC_IO) as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
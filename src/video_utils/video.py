@@ -1,13 +1,13 @@
+import hashlib
 import logging
 import os
+import sys
 from enum import Enum
 from os import path
-from typing import List, Optional
-
-from iso639 import to_iso639_2
-from pymediainfo import MediaInfo
+from typing import Callable, List, Optional, Tuple
 
 from .codec import Codec
+from .probe import probe
 from .validators import Validator
 
 log = logging.getLogger(__name__)
@@ -21,10 +21,36 @@ class Resolution(Enum):
     OTHER = "other"
 
 
+# Bytes hashed from each end of a file to fingerprint it
+FINGERPRINT_BLOCK = 64 * 1024
+
+# Builds (video_track, audio_tracks, text_tracks) on demand
+TrackLoader = Callable[[], Tuple[Optional[object], Optional[list], Optional[list]]]
+
+
 class Video:
     # Increment this when adding new fields or changing the structure
     SCHEMA_VERSION = 2
 
+    __slots__ = (
+        "_audio_tracks",
+        "_codec",
+        "_dir_path",
+        "_quality",
+        "_text_tracks",
+        "_track_loader",
+        "_video_track",
+        "dirty",
+        "duration",
+        "fingerprint",
+        "inode",
+        "mtime",
+        "name",
+        "resolution",
+        "schema_version",
+        "size_b",
+    )
+
     def __init__(
         self,
         name: str,
@@ -38,7 +64,11 @@ class Video:
         text_tracks: Optional[List[object]] = None,
         resolution: Optional[Resolution] = None,
         schema_version: Optional[int] = None,
+        fingerprint: Optional[str] = None,
+        mtime: Optional[float] = None,
+        inode: Optional[int] = None,
     ):
+        self._track_loader: Optional[TrackLoader] = None
         self.name = name
         self.dir_path = dir_path
         self.codec = codec
@@ -50,6 +80,13 @@ class Video:
         self.text_tracks = text_tracks
         self.resolution = resolution
         self.schema_version = schema_version or self.SCHEMA_VERSION
+        # Hash of the file's first and last blocks, used to recognise moved files
+        self.fingerprint = fingerprint
+        # The file's mtime and inode when last refreshed, for stat-only change checks
+        self.mtime = mtime
+        self.inode = inode
+        # Set when this video has changes that haven't been written to the cache
+        self.dirty = True
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Video):
@@ -64,15 +101,79 @@ class Video:
     def __str__(self) -> str:
         return self.__repr__()
 
+    def __getstate__(self) -> dict:
+        return {key: getattr(self, key) for key in self.__slots__ if hasattr(self, key)}
+
+    def __setstate__(self, state: dict) -> None:
+        # Pickles from before tracks were properties store them under public names
+        for key in ("video_track", "audio_tracks", "text_tracks"):
+            if key in state:
+                state[f"_{key}"] = state.pop(key)
+        state.setdefault("dirty", True)
+        state.setdefault("fingerprint", None)
+        state.setdefault("mtime", None)
+        state.setdefault("inode", None)
+        state.setdefault("_track_loader", None)
+        for key, value in state.items():
+            # Pickles from before __slots__ may hold attributes that were dropped
+            if key in self.__slots__:
+                setattr(self, key, value)
+
+    def defer_tracks(self, loader: TrackLoader) -> None:
+        """
+        Defers building the track objects until one of them is first accessed
+        """
+        self._track_loader = loader
+
+    def _load_tracks(self) -> None:
+        if self._track_loader:
+            loader = self._track_loader
+            self._track_loader = None
+            self._video_track, self._audio_tracks, self._text_tracks = loader()
+
+    @property
+    def video_track(self) -> Optional[object]:
+        self._load_tracks()
+        return self._video_track
+
+    @video_track.setter
+    def video_track(self, value: Optional[object]) -> None:
+        self._load_tracks()
+        self._video_track = value
+
+    @property
+    def audio_tracks(self) -> Optional[List[object]]:
+        self._load_tracks()
+        return self._audio_tracks
+
+    @audio_tracks.setter
+    def audio_tracks(self, value: Optional[List[object]]) -> None:
+        self._load_tracks()
+        self._audio_tracks = value
+
+    @property
+    def text_tracks(self) -> Optional[List[object]]:
+        self._load_tracks()
+        return self._text_tracks
+
+    @text_tracks.setter
+    def text_tracks(self, value: Optional[List[object]]) -> None:
+        self._load_tracks()
+        self._text_tracks = value
+
     @property
     def subtitle_languages(self) -> List[str]:
         if self.text_tracks:
+            from iso639 import to_iso639_2
+
             return [to_iso639_2(x.language) for x in self.text_tracks]
         return []
 
     @property
     def audio_languages(self) -> List[str]:
         if self.audio_tracks:
+            from iso639 import to_iso639_2
+
             return [to_iso639_2(x.language) for x in self.audio_tracks]
         return []
 
@@ -82,7 +183,8 @@ class Video:
 
     @dir_path.setter
     def dir_path(self, value: str) -> None:
-        self._dir_path = path.realpath(value)
+        # Interned, as every video in a directory holds the same path
+        self._dir_path = sys.intern(path.realpath(value))
 
     @property
     def full_path(self) -> str:
@@ -107,7 +209,7 @@ class Video:
         if value is None:
             value = "Unknown"
         Validator().quality(value)
-        self._quality = value
+        self._quality = sys.intern(value)
 
     def _determine_resolution(self, width: int) -> Resolution:
         """Determine resolution based on video width with 10% tolerance"""
@@ -133,14 +235,46 @@ class Video:
     def get_current_size(self) -> int:
         return os.stat(self.full_path).st_size
 
-    def refresh(self) -> None:
+    def get_current_fingerprint(self) -> Optional[str]:
+        """
+        Hashes the first and last FINGERPRINT_BLOCK bytes of the file. Together with
+        the size this identifies a file after it is renamed or moved, without
+        reading all of it. Returns None if the file can't be read.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        try:
+            with open(self.full_path, "rb") as f:
+                digest.update(f.read(FINGERPRINT_BLOCK))
+                size = os.fstat(f.fileno()).st_size
+                if size > FINGERPRINT_BLOCK:
+                    f.seek(max(FINGERPRINT_BLOCK, size - FINGERPRINT_BLOCK))
+                    digest.update(f.read(FINGERPRINT_BLOCK))
+        except OSError as e:
+            log.debug(f"Unable to fingerprint {self.full_path}: {e}")
+            return None
+        return digest.hexdigest()
+
+    def refresh(self, parse: Optional[Callable[[str], object]] = None) -> bool:
         """
         Reads the metadata for the given filename and path from the filesystem and saves it to this instance
+        Returns whether the metadata was re-read, which also marks the video dirty
+        parse replaces MediaInfo.parse for files the header probe can't read
         """
         if self._needs_refresh():
             log.debug(f"Refreshing data for video: {self.full_path}")
+            self.dirty = True
             self.size_b = self.get_current_size()
-            metadata = MediaInfo.parse(self.full_path)
+            self.fingerprint = self.get_current_fingerprint()
+            self._update_stat()
+            # Only read the container header when possible; MediaInfo reads far more
+            metadata = probe(self.full_path)
+            if metadata is None:
+                if parse is None:
+                    # Deferred as it's slow to import and often not needed
+                    from pymediainfo import MediaInfo
+
+                    parse = MediaInfo.parse
+                metadata = parse(self.full_path)
             self.audio_tracks = metadata.audio_tracks  # type: ignore
             self.text_tracks = metadata.text_tracks  # type: ignore
             try:
@@ -163,3 +297,23 @@ class Video:
                 error_message = f"Failed to parse track metadata from {self.full_path}"
                 log.error(error_message)
                 raise RuntimeError(error_message)
+            return True
+
+        if self.fingerprint is None:
+            # Cached before fingerprints were recorded
+            self.fingerprint = self.get_current_fingerprint()
+            if self.fingerprint is not None:
+                self.dirty = True
+        self._update_stat()
+        return False
+
+    def _update_stat(self) -> None:
+        """Records the file's mtime and inode, marking the video dirty if they moved"""
+        try:
+            stat = os.stat(self.full_path)
+        except OSError:
+            return
+        if (self.mtime, self.inode) != (stat.st_mtime, stat.st_ino):
+            self.mtime = stat.st_mtime
+            self.inode = stat.st_ino
+            self.dirty = True
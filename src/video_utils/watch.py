@@ -0,0 +1,206 @@
+"""
+Sources of filesystem changes for FileMap.watch().
+
+InotifySource uses Linux inotify through ctypes and costs nothing while idle.
+PollingSource is the fallback elsewhere; it polls a stat-only diff of the cache.
+Both report the paths that changed, which may be files or directories.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+from os import path
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# IN_MODIFY keeps a burst going for as long as a file is being written
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+# struct inotify_event without its variable length name
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+
+class InotifySource:
+    """
+    Watches a directory tree with one inotify watch per directory, adding
+    watches as directories are created or moved in
+    """
+
+    def __init__(self, root: str) -> None:
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        # Raises AttributeError where libc has no inotify
+        self._libc.inotify_init1.argtypes = [ctypes.c_int]
+        self._libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        self._libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+
+        self.root = root
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._paths: Dict[int, str] = {}
+        self._watches: Dict[str, int] = {}
+        self._add_tree(root)
+
+    def _add_watch(self, dir_path: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                log.warning(
+                    "Out of inotify watches; raise fs.inotify.max_user_watches "
+                    f"to watch {dir_path}"
+                )
+            else:
+                log.debug(f"Unable to watch {dir_path}: {os.strerror(error)}")
+            return
+        self._paths[wd] = dir_path
+        self._watches[dir_path] = wd
+
+    def _add_tree(self, root: str) -> None:
+        self._add_watch(root)
+        for dir_path, dir_names, _ in os.walk(root, followlinks=True):
+            for dir_name in dir_names:
+                self._add_watch(path.join(dir_path, dir_name))
+
+    def _remove_tree(self, root: str) -> None:
+        prefix = root.rstrip("/") + "/"
+        for dir_path in [d for d in self._watches if d == root or d.startswith(prefix)]:
+            wd = self._watches.pop(dir_path)
+            self._paths.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def wait(self, timeout: float) -> Set[str]:
+        """
+        Waits up to timeout seconds for changes, returning the changed paths or
+        an empty set if there were none
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return set()
+        return self._parse(data)
+
+    def _parse(self, data: bytes) -> Set[str]:
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                log.warning("inotify queue overflowed, rescanning everything")
+                changed.add(self.root)
+                continue
+            if mask & IN_IGNORED:
+                dir_path = self._paths.pop(wd, None)
+                if dir_path is not None and self._watches.get(dir_path) == wd:
+                    del self._watches[dir_path]
+                continue
+
+            dir_path = self._paths.get(wd)
+            if dir_path is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                changed.add(dir_path)
+                continue
+
+            file_path = path.join(dir_path, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(file_path)
+                elif mask & IN_MOVED_FROM:
+                    self._remove_tree(file_path)
+            changed.add(file_path)
+        return changed
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingSource:
+    """
+    Polls a stat-only diff every interval seconds. Paths are reported when they
+    first appear in the diff and again whenever their size or mtime changes, so
+    a file that is still being written keeps its burst going, provided the
+    caller waits at least interval for it to settle, as FileMap.watch() does.
+    """
+
+    def __init__(self, diff: Callable[[], Iterable[str]], interval: float) -> None:
+        self._diff = diff
+        self.interval = interval
+        self._next_poll = time.monotonic()
+        self._states: Dict[str, Optional[Tuple[int, float]]] = {}
+
+    def wait(self, timeout: float) -> Set[str]:
+        delay = self._next_poll - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_poll = time.monotonic() + self.interval
+
+        states = {}
+        for changed_path in self._diff():
+            try:
+                stat = os.stat(changed_path)
+                states[changed_path] = (stat.st_size, stat.st_mtime)
+            except OSError:
+                states[changed_path] = None
+        changed = {
+            changed_path
+            for changed_path, state in states.items()
+            if changed_path not in self._states or self._states[changed_path] != state
+        }
+        self._states = states
+        return changed
+
+    def close(self) -> None:
+        pass
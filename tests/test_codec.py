@@ -1,3 +1,5 @@
+import pickle
+
 import pytest
 
 from video_utils import Codec
@@ -55,3 +57,52 @@ def test_codec_equality():
     assert dummy_codec != different_codec
     with pytest.raises(AssertionError):
         assert dummy_codec == not_a_codec
+
+
+def test_codec_shared():
+    assert Codec("HEVC") is Codec(format_name="HEVC")
+    assert Codec("HEVC", "hevc_nvenc") is not Codec("HEVC")
+    assert Codec("HEVC", "hevc_nvenc") == Codec("HEVC")
+    assert len({Codec("HEVC"), Codec("HEVC", "hevc_nvenc"), Codec("AVC")}) == 2
+
+
+def test_codec_shared_read_only():
+    with pytest.raises(AttributeError):
+        Codec("HEVC").pretty_name = "x265"
+    with pytest.raises(AttributeError):
+        del Codec("HEVC").format_name
+    assert Codec("HEVC").pretty_name == "HEVC"
+
+    codec = Codec("HEVC", pretty_name="HEVC")
+    codec.pretty_name = "x265"
+    assert codec.pretty_name == "x265"
+
+
+def test_codec_slots():
+    with pytest.raises(AttributeError):
+        _ = Codec("HEVC").__dict__
+
+
+def test_codec_without_format():
+    codec = Codec(None)
+    assert codec.format_name is None
+    assert codec.pretty_name is None
+    assert codec.get_ffmpeg_name() is None
+    assert codec is not Codec(None)
+    assert pickle.loads(pickle.dumps(codec)) == codec
+    with pytest.raises(TypeError):
+        Codec()
+
+
+def test_codec_pickle():
+    assert pickle.loads(pickle.dumps(Codec("HEVC"))) is Codec("HEVC")
+    c = pickle.loads(pickle.dumps(Codec("AVC", "h264_qsv")))
+    assert c.get_ffmpeg_name() == "h264_qsv"
+    assert c is not Codec("AVC")
+
+
+def test_codec_unpickle_legacy():
+    c = Codec.__new__(Codec)
+    c.__setstate__({"format_name": "HEVC", "_ffmpeg_name": None, "pretty_name": None})
+    assert c.get_ffmpeg_name() == "libx265"
+    assert c.pretty_name == "HEVC"
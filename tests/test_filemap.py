@@ -1,11 +1,20 @@
+import asyncio
+import json
 import os
 import pickle
+import shutil
+import threading
+import time
+from contextlib import nullcontext
 from os import path
+from types import SimpleNamespace
 
 import pytest
 from mock import patch
 
-from video_utils import fileMap
+from video_utils import fileMap, scan_stats
+from video_utils.probe import Metadata, Track
+from video_utils.scan_hooks import ScanHooks
 
 
 @pytest.fixture
@@ -85,7 +94,7 @@ def test_load(mock_update_content, mock_storage, target):
     target.load()
     assert mock_update_content.called
     assert mock_storage.called
-    assert mock_storage().load.called
+    assert mock_storage().list_directories.called
 
 
 @patch("video_utils.fileMap._FileMapStorage")
@@ -95,7 +104,39 @@ def test_load_skips_update(mock_update_content, mock_storage, target):
     target.load()
     assert not mock_update_content.called
     assert mock_storage.called
-    assert mock_storage().load.called
+    assert mock_storage().list_directories.called
+
+
+@patch("video_utils.fileMap._FileMapStorage")
+@patch.object(fileMap.FileMap, "_update_content")
+def test_load_reuses_storage(mock_update_content, mock_storage, target):
+    storage = mock_storage.return_value
+    target.load()
+    target.load()
+    assert mock_storage.call_count == 1
+    # Once after pruning and once at the end of each load
+    assert storage.flush.call_count == 4
+
+    target.close()
+    assert storage.close.called
+    target.load()
+    assert mock_storage.call_count == 2
+
+
+@patch("video_utils.fileMap._FileMapStorage")
+def test_directory_change_closes_storage(mock_storage, target):
+    storage = target._get_storage()
+    target.directory = "/bar"
+    assert storage.close.called
+    assert target._storage is None
+
+
+@patch("video_utils.fileMap._FileMapStorage")
+@patch.object(fileMap.FileMap, "_update_content")
+def test_load_force_ignores_directory_cache(mock_update_content, mock_storage, target):
+    target.load(force=True)
+    assert not mock_storage().load_directories.called
+    assert target._directories == {}
 
 
 @patch.object(fileMap.FileMap, "_prune_missing_files")
@@ -142,22 +183,129 @@ def test_update_content(mock_filter, mock_update_video, mock_prune, target, os_w
         mock_update_video.assert_any_call("/tmp/foo", f)
 
 
+@patch("video_utils.fileMap._FileMapStorage")
+@patch("video_utils.fileMap.Video.refresh", autospec=True)
+def test_update_content_parallel(mock_refresh, mock_storage, os_walk):
+    target = fileMap.FileMap("/foo", progress_bar=False, workers=4)
+    target._file_tree = lambda: os_walk
+    target._update_content()
+
+    assert mock_refresh.call_count == 12
+    assert [v.name for v in target.contents["/tmp/bar"]] == sorted(os_walk[2][2])
+    assert mock_storage().save_videos.call_count == 2
+
+
+@patch("video_utils.fileMap._FileMapStorage")
+@patch("video_utils.fileMap.Video.refresh", autospec=True)
+def test_update_content_parallel_failures(mock_refresh, mock_storage, os_walk):
+    mock_refresh.side_effect = RuntimeError
+    target = fileMap.FileMap("/foo", progress_bar=False, workers=2)
+    target._file_tree = lambda: os_walk
+    events = [event for event, _ in target._scan_content()]
+    assert events == [fileMap.ScanEvent.FAILED] * 12
+    assert all(not target.contents[dir_path] for dir_path in target.contents)
+
+
 @patch.object(fileMap, "Video")
 def test_update_video(mock_video, target):
-    target._update_video("/tmp", "foo.mkv")
+    event, video = target._update_video("/tmp", "foo.mkv")
+    assert event == fileMap.ScanEvent.ADDED
+    assert video is mock_video()
     assert mock_video().refresh.called
     assert target.contents["/tmp"]
     assert len(target.contents["/tmp"]) == 1
     assert len(target.contents) == 1
 
 
-@patch("os.walk")
-@patch("os.path.isfile")
-def test_file_tree_directory(mock_isfile, mock_walk, target, os_walk):
-    mock_walk.return_value = os_walk
-    mock_isfile.return_value = False
-    target._file_tree()
-    assert target._file_tree() == os_walk
+def test_contents_view(target):
+    videos = [fileMap.Video("a.mkv", "/tmp"), fileMap.Video("b.mkv", "/tmp")]
+    target.contents = {"/tmp": videos}
+    assert list(target.contents) == ["/tmp"]
+    assert target.contents["/tmp"] == tuple(videos)
+    assert target.contents == {"/tmp": tuple(videos)}
+    with pytest.raises(TypeError):
+        target.contents["/tmp"] = []
+    with pytest.raises(AttributeError):
+        target.contents["/tmp"].append(videos[0])
+
+
+def test_lazy_load(tmp_path):
+    season_1 = str(tmp_path / "season 1")
+    season_2 = str(tmp_path / "season 2")
+    storage = fileMap._FileMapStorage(str(tmp_path))
+    storage.save_videos([fileMap.Video("a.mkv", season_1)])
+    storage.save_videos([fileMap.Video("b.mkv", season_2)])
+    storage.close()
+
+    target = fileMap.FileMap(str(tmp_path), lazy=True)
+    with patch.object(fileMap.FileMap, "_prune_missing_files") as mock_prune:
+        target.load()
+    assert not mock_prune.called
+    assert sorted(target.contents) == [season_1, season_2]
+    assert target._index[season_1] is None
+
+    assert [video.name for video in target.contents[season_1]] == ["a.mkv"]
+    assert target._index[season_1] is not None
+    assert target._index[season_2] is None
+
+
+def test_get_video_uses_cache(target):
+    cached = fileMap.Video("a.mkv", "/tmp")
+    target.contents = {"/tmp": [cached]}
+    assert target._get_video("/tmp", "a.mkv") is cached
+    assert len(target.contents["/tmp"]) == 1
+
+
+def test_get_video_replaces_outdated_schema(target):
+    cached = fileMap.Video("a.mkv", "/tmp", schema_version=1)
+    other = fileMap.Video("b.mkv", "/tmp")
+    target.contents = {"/tmp": [cached, other]}
+    video = target._get_video("/tmp", "a.mkv")
+    assert video is not cached
+    assert video.schema_version == fileMap.Video.SCHEMA_VERSION
+    assert target.contents["/tmp"] == (other, video)
+
+
+@pytest.fixture
+def video_tree(tmp_path):
+    (tmp_path / "show" / "season 1").mkdir(parents=True)
+    (tmp_path / "show" / "season 1" / "a.mkv").write_bytes(b"")
+    (tmp_path / "show" / "b.mkv").write_bytes(b"")
+    return tmp_path
+
+
+def test_file_tree_directory(video_tree):
+    target = fileMap.FileMap(str(video_tree))
+    tree = list(target._file_tree())
+    root = str(video_tree)
+    assert tree == [
+        (root, ["show"], []),
+        (f"{root}/show", ["season 1"], ["b.mkv"]),
+        (f"{root}/show/season 1", [], ["a.mkv"]),
+    ]
+    assert target._scanned_directories[f"{root}/show"][1:] == (2, ["season 1"])
+
+
+def test_file_tree_skips_unchanged_directories(video_tree):
+    target = fileMap.FileMap(str(video_tree))
+    list(target._file_tree())
+    target._directories = target._scanned_directories
+    target._scanned_directories = {}
+
+    (video_tree / "show" / "season 1" / "c.mkv").write_bytes(b"")
+    season_dir = f"{video_tree}/show/season 1"
+    os.utime(season_dir, (0, 1))
+    assert [dir_path for dir_path, _, _ in target._file_tree()] == [season_dir]
+
+
+def test_directory_unchanged(video_tree):
+    target = fileMap.FileMap(str(video_tree))
+    show_dir = f"{video_tree}/show"
+    assert not target._directory_unchanged(show_dir)
+    target._directories = {show_dir: (os.stat(show_dir).st_mtime, 2, [])}
+    assert target._directory_unchanged(show_dir)
+    os.utime(show_dir, (0, 1))
+    assert not target._directory_unchanged(show_dir)
 
 
 @patch("os.walk")
@@ -169,51 +317,81 @@ def test_file_tree_file(mock_isfile, mock_walk, target, os_walk):
     assert target._file_tree() == [("/", [], ["foo"])]
 
 
-@patch("os.path.exists")
-def test_prune_missing_files_no_directory(mock_exists, target, mock_contents):
-    def isexists_return(file_path):
-        if file_path == "/home/justin/git/video_utils/tests/testData/bar":
-            return False
-        return True
+TEST_DATA_FOO = "/home/justin/git/video_utils/tests/testData/foo"
+TEST_DATA_BAR = "/home/justin/git/video_utils/tests/testData/bar"
+
+
+def fake_scandir(listings):
+    """Returns an os.scandir replacement serving directory listings from a dict"""
+
+    def scandir(dir_path):
+        if dir_path not in listings:
+            raise FileNotFoundError(dir_path)
+        entries = [SimpleNamespace(name=name) for name in listings[dir_path]]
+        return nullcontext(entries)
+
+    return scandir
 
+
+@pytest.fixture
+def listings(os_walk):
+    return {TEST_DATA_FOO: os_walk[1][2], TEST_DATA_BAR: os_walk[2][2]}
+
+
+@patch("video_utils.fileMap._FileMapStorage")
+def test_prune_missing_files_no_directory(
+    mock_storage, target, mock_contents, listings
+):
+    del listings[TEST_DATA_BAR]
     target.contents = mock_contents
-    mock_exists.side_effect = isexists_return
-    target._prune_missing_files()
-    assert "/home/justin/git/video_utils/tests/testData/foo" in target.contents.keys()
-    assert (
-        "/home/justin/git/video_utils/tests/testData/bar" not in target.contents.keys()
-    )
+    with patch("os.scandir", side_effect=fake_scandir(listings)):
+        target._prune_missing_files()
+    assert TEST_DATA_FOO in target.contents.keys()
+    assert TEST_DATA_BAR not in target.contents.keys()
     assert len(target.contents.keys()) == 1
-    assert len(target.contents["/home/justin/git/video_utils/tests/testData/foo"]) == 18
+    # The fixture lists every video three times; the index keeps one per path
+    assert len(target.contents[TEST_DATA_FOO]) == 6
 
+    storage = mock_storage.return_value
+    storage.remove_directories.assert_called_once_with({TEST_DATA_BAR})
+    removed = storage.remove_existing_files.call_args[0][0]
+    assert len(removed) == 6
+    assert all(file_path.startswith(TEST_DATA_BAR) for file_path in removed)
 
-@patch("os.path.exists")
-@patch(
-    "video_utils.fileMap._FileMapStorage.storage_path",
-    new_callable=lambda: property(lambda self: "/tmp/test_cache.db"),
-)
-def test_prune_missing_files_no_file(
-    mock_storage_path, mock_exists, target, mock_contents
-):
-    missing_file = "/home/justin/git/video_utils/tests/testData/bar/test episode - 01x01 - another in 1080p.mkv"
 
-    def isexists_return(file_path):
-        if file_path == missing_file:
-            return False
-        return True
+@patch("video_utils.fileMap._FileMapStorage")
+def test_prune_missing_files_no_file(mock_storage, target, mock_contents, listings):
+    missing_file = f"{TEST_DATA_BAR}/test episode - 01x01 - another in 1080p.mkv"
+    listings[TEST_DATA_BAR].remove(path.basename(missing_file))
 
     target.contents = mock_contents
-    mock_exists.side_effect = isexists_return
-    target._prune_missing_files()
-    assert "/home/justin/git/video_utils/tests/testData/foo" in target.contents.keys()
-    assert "/home/justin/git/video_utils/tests/testData/bar" in target.contents.keys()
+    with patch("os.scandir", side_effect=fake_scandir(listings)):
+        target._prune_missing_files()
+    assert TEST_DATA_FOO in target.contents.keys()
+    assert TEST_DATA_BAR in target.contents.keys()
     assert len(target.contents.keys()) == 2
-    assert (
-        missing_file
-        not in target.contents["/home/justin/git/video_utils/tests/testData/bar"]
-    )
-    assert len(target.contents["/home/justin/git/video_utils/tests/testData/foo"]) == 18
-    assert len(target.contents["/home/justin/git/video_utils/tests/testData/bar"]) == 15
+    assert missing_file not in [
+        video.full_path for video in target.contents[TEST_DATA_BAR]
+    ]
+    # The fixture lists every video three times; the index keeps one per path
+    assert len(target.contents[TEST_DATA_FOO]) == 6
+    assert len(target.contents[TEST_DATA_BAR]) == 5
+
+    storage = mock_storage.return_value
+    storage.remove_existing_files.assert_called_once_with({missing_file})
+    assert not storage.remove_directories.called
+
+
+@patch("video_utils.fileMap._FileMapStorage")
+def test_prune_missing_files_unreadable_directory(
+    mock_storage, target, mock_contents, listings
+):
+    target.contents = mock_contents
+    with patch("os.scandir", side_effect=PermissionError):
+        target._prune_missing_files()
+    assert len(target.contents[TEST_DATA_FOO]) == 6
+    assert len(target.contents[TEST_DATA_BAR]) == 6
+    assert not mock_storage.return_value.remove_existing_files.called
 
 
 def test_subdirectory_filtering():
@@ -240,3 +418,547 @@ def test_subdirectory_filtering():
         assert directory.startswith(foo_dir)
         for video in videos:
             assert video.full_path.startswith(foo_dir)
+
+
+def test_rescan_writes_only_changed_videos():
+    current_dir = path.dirname(path.abspath(__file__))
+    foo_dir = path.join(current_dir, "testData", "foo")
+    target = fileMap.FileMap(foo_dir, progress_bar=False)
+    target.load(force=True)
+
+    with patch.object(
+        fileMap._FileMapStorage, "_video_to_row", autospec=True
+    ) as mock_video_to_row:
+        target.load(force=True)
+    assert not mock_video_to_row.called
+    target.close()
+
+
+@pytest.fixture
+def episodes(tmp_path):
+    current_dir = path.dirname(path.abspath(__file__))
+    source_dir = path.join(current_dir, "testData", "foo")
+    show_dir = tmp_path / "show"
+    show_dir.mkdir()
+    for episode in ("01x01", "01x02"):
+        shutil.copy(
+            path.join(source_dir, f"test episode - {episode} - another in 1080p.mkv"),
+            show_dir / f"show - {episode}.mkv",
+        )
+    return show_dir
+
+
+def test_iter_scan(episodes):
+    target = fileMap.FileMap(str(episodes.parent), progress_bar=False)
+    events = [(event, video.name) for event, video in target.iter_scan()]
+    assert events == [
+        (fileMap.ScanEvent.ADDED, "show - 01x01.mkv"),
+        (fileMap.ScanEvent.ADDED, "show - 01x02.mkv"),
+    ]
+
+    (episodes / "show - 01x01.mkv").unlink()
+    with open(episodes / "show - 01x02.mkv", "ab") as f:
+        f.write(b"\x00")
+    shutil.copy(episodes / "show - 01x02.mkv", episodes / "show - 01x03.mkv")
+
+    events = [(event, video.name) for event, video in target.iter_scan(force=True)]
+    assert events == [
+        (fileMap.ScanEvent.REMOVED, "show - 01x01.mkv"),
+        (fileMap.ScanEvent.UPDATED, "show - 01x02.mkv"),
+        (fileMap.ScanEvent.ADDED, "show - 01x03.mkv"),
+    ]
+
+    events = [event for event, _ in target.iter_scan(force=True)]
+    assert events == [fileMap.ScanEvent.UNCHANGED] * 2
+    assert [video.name for video in target.contents[str(episodes)]] == [
+        "show - 01x02.mkv",
+        "show - 01x03.mkv",
+    ]
+    target.close()
+
+
+def test_iter_scan_release_contents(episodes):
+    target = fileMap.FileMap(str(episodes), progress_bar=False)
+    assert len(list(target.iter_scan(keep_contents=False))) == 2
+    assert target._index == {str(episodes): None}
+    assert len(target.contents[str(episodes)]) == 2
+    target.close()
+
+
+def test_aload(episodes):
+    target = fileMap.FileMap(str(episodes.parent), progress_bar=False)
+    asyncio.run(target.aload())
+    assert [video.name for video in target.contents[str(episodes)]] == [
+        "show - 01x01.mkv",
+        "show - 01x02.mkv",
+    ]
+    target.close()
+
+    cached = fileMap.FileMap(str(episodes.parent), update=False)
+    cached.load()
+    assert len(cached.contents[str(episodes)]) == 2
+    cached.close()
+
+
+def test_aload_bounds_concurrency(episodes):
+    for episode in ("01x03", "01x04", "01x05"):
+        shutil.copy(episodes / "show - 01x01.mkv", episodes / f"show - {episode}.mkv")
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def refresh(video, parse=None):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return True
+
+    target = fileMap.FileMap(str(episodes), progress_bar=False)
+    with patch.object(fileMap.Video, "refresh", refresh):
+        asyncio.run(target.aload(concurrency=2))
+    assert peak == 2
+    assert len(target.contents[str(episodes)]) == 5
+    target.close()
+
+
+def test_concurrent_aloads_share_cache(two_seasons, episodes):
+    refresh = fileMap.Video.refresh
+
+    def slow_refresh(video, *args, **kwargs):
+        # Keeps both scans probing at the same time
+        time.sleep(0.05)
+        return refresh(video, *args, **kwargs)
+
+    async def load_both(*targets):
+        return await asyncio.gather(*(target.aload() for target in targets))
+
+    targets = [
+        fileMap.FileMap(str(library), progress_bar=False)
+        for library in (two_seasons, episodes)
+    ]
+    with (
+        patch.object(fileMap, "BUSY_TIMEOUT", 0.5),
+        patch.object(fileMap.Video, "refresh", slow_refresh),
+    ):
+        stats = asyncio.run(load_both(*targets))
+    assert [s.counts["added"] for s in stats] == [4, 2]
+    for target in targets:
+        target.close()
+
+    for library, directories, files in ((two_seasons, 3, 4), (episodes, 1, 2)):
+        storage = fileMap._FileMapStorage(str(library))
+        assert len(storage.load_directories()) == directories
+        assert sum(len(videos) for videos in storage.load().values()) == files
+        storage.close()
+
+
+def test_load_reuses_metadata_of_moved_files(episodes):
+    target = fileMap.FileMap(str(episodes.parent), progress_bar=False)
+    target.load()
+    original = target.contents[str(episodes)][0]
+
+    season_dir = episodes / "season 1"
+    season_dir.mkdir()
+    os.rename(episodes / "show - 01x01.mkv", season_dir / "renamed.mkv")
+    with (
+        patch("video_utils.video.probe") as mock_probe,
+        patch("pymediainfo.MediaInfo") as mock_media_info,
+    ):
+        events = [(event, video.name) for event, video in target.iter_scan()]
+    mock_probe.assert_not_called()
+    mock_media_info.parse.assert_not_called()
+
+    assert (fileMap.ScanEvent.REMOVED, "show - 01x01.mkv") in events
+    assert (fileMap.ScanEvent.ADDED, "renamed.mkv") in events
+    moved = target.contents[str(season_dir)][0]
+    assert moved.full_path == str(season_dir / "renamed.mkv")
+    assert moved.fingerprint == original.fingerprint
+    assert (moved.codec, moved.quality) == (original.codec, original.quality)
+    target.close()
+
+    cached = fileMap.FileMap(str(episodes.parent), update=False)
+    cached.load()
+    assert [video.name for video in cached.contents[str(season_dir)]] == ["renamed.mkv"]
+    cached.close()
+
+
+def test_failures_are_recorded_and_skipped(episodes):
+    broken = episodes / "show - 01x03.mkv"
+    broken.write_bytes(b"not a video")
+    target = fileMap.FileMap(str(episodes), progress_bar=False)
+    events = {video.name: event for event, video in target.iter_scan()}
+    assert events["show - 01x03.mkv"] == fileMap.ScanEvent.FAILED
+    assert events["show - 01x02.mkv"] == fileMap.ScanEvent.ADDED
+    failure = target.failures[str(broken)]
+    assert failure.attempts == 1
+    assert failure.size_b == len(b"not a video")
+    assert "show - 01x03.mkv" not in target._index[str(episodes)]
+    target.close()
+
+    target = fileMap.FileMap(str(episodes), progress_bar=False)
+    with patch.object(fileMap.Video, "refresh", autospec=True) as mock_refresh:
+        target.load(force=True)
+    assert sorted(call.args[0].name for call in mock_refresh.call_args_list) == [
+        "show - 01x01.mkv",
+        "show - 01x02.mkv",
+    ]
+    assert list(target.failures) == [str(broken)]
+    target.close()
+
+
+def test_failures_backoff(episodes):
+    broken = episodes / "show - 01x03.mkv"
+    broken.write_bytes(b"not a video")
+    target = fileMap.FileMap(str(episodes), progress_bar=False)
+    target.load()
+    first = target.failures[str(broken)]
+    assert first.retry_at - time.time() == pytest.approx(
+        fileMap.FAILURE_RETRY_DELAY, abs=60
+    )
+
+    target._get_storage().save_failures(
+        str(episodes), {broken.name: first._replace(retry_at=0)}
+    )
+    target.load()
+    second = target.failures[str(broken)]
+    assert second.attempts == 2
+    assert second.retry_at - time.time() == pytest.approx(
+        2 * fileMap.FAILURE_RETRY_DELAY, abs=60
+    )
+
+    # Replacing the file retries it straight away
+    shutil.copy(episodes / "show - 01x01.mkv", broken)
+    events = {video.name: event for event, video in target.iter_scan(force=True)}
+    assert events["show - 01x03.mkv"] == fileMap.ScanEvent.ADDED
+    assert target.failures == {}
+    target.close()
+
+
+def test_failures_pruned_with_missing_files(episodes):
+    broken = episodes / "show - 01x03.mkv"
+    broken.write_bytes(b"not a video")
+    target = fileMap.FileMap(str(episodes), progress_bar=False)
+    target.load()
+    assert target.failures
+
+    broken.unlink()
+    target.load()
+    assert target.failures == {}
+    assert target._get_storage().load_failures() == {}
+    target.close()
+
+
+def test_diff(episodes):
+    target = fileMap.FileMap(str(episodes.parent), progress_bar=False)
+    assert target.diff() == fileMap.FileMapDiff(
+        added={str(episodes / "show - 01x01.mkv"), str(episodes / "show - 01x02.mkv")},
+        removed=set(),
+        modified=set(),
+    )
+    target.load()
+    assert target.diff() == fileMap.FileMapDiff(set(), set(), set())
+
+    (episodes / "show - 01x01.mkv").unlink()
+    with open(episodes / "show - 01x02.mkv", "ab") as f:
+        f.write(b"\x00")
+    shutil.copy(episodes / "show - 01x02.mkv", episodes / "show - 01x03.mkv")
+    (episodes / "notes.txt").write_text("not a video")
+    with (
+        patch("pymediainfo.MediaInfo") as mock_media_info,
+        patch("video_utils.video.probe") as mock_probe,
+    ):
+        diff = target.diff()
+    mock_media_info.parse.assert_not_called()
+    mock_probe.assert_not_called()
+    assert diff == fileMap.FileMapDiff(
+        added={str(episodes / "show - 01x03.mkv")},
+        removed={str(episodes / "show - 01x01.mkv")},
+        modified={str(episodes / "show - 01x02.mkv")},
+    )
+    target.close()
+
+
+def test_load_settles_diff(episodes):
+    target = fileMap.FileMap(str(episodes), progress_bar=False)
+    target.load()
+    edited = episodes / "show - 01x02.mkv"
+    mtime = os.stat(episodes).st_mtime
+    with open(edited, "ab") as f:
+        f.write(b"\x00")
+    assert os.stat(episodes).st_mtime == mtime
+    assert target.diff().modified == {str(edited)}
+
+    # Also settled by another FileMap over the same cache
+    other = fileMap.FileMap(str(episodes), progress_bar=False)
+    stats = other.load()
+    assert stats.counts["updated"] == 1
+    assert other.diff() == fileMap.FileMapDiff(set(), set(), set())
+    assert target.diff() == fileMap.FileMapDiff(set(), set(), set())
+    other.close()
+    target.close()
+
+
+def test_diff_ignores_unchanged_failures(episodes):
+    broken = episodes / "show - 01x03.mkv"
+    broken.write_bytes(b"not a video")
+    target = fileMap.FileMap(str(episodes), progress_bar=False)
+    target.load()
+    assert target.diff() == fileMap.FileMapDiff(set(), set(), set())
+
+    broken.write_bytes(b"still not a video")
+    assert target.diff().added == {str(broken)}
+    target.close()
+
+
+def test_episode_lookups(episodes):
+    shutil.copy(episodes / "show - 01x01.mkv", episodes / "show - 01x01 - copy.mkv")
+    target = fileMap.FileMap(str(episodes.parent), progress_bar=False)
+    target.load()
+    assert [video.name for video in target.episodes("Show", season=1)] == [
+        "show - 01x01 - copy.mkv",
+        "show - 01x01.mkv",
+        "show - 01x02.mkv",
+    ]
+    duplicates = target.duplicate_episodes()
+    assert list(duplicates) == [("show", 1, 1)]
+    assert len(duplicates[("show", 1, 1)]) == 2
+    target.close()
+
+
+def test_load_video_track_without_format(episodes):
+    # Not a container the header probe reads, so MediaInfo is used
+    (episodes / "show - 01x03.avi").write_bytes(b"\0" * 1024)
+    metadata = Metadata([Track("Video", format=None, width=1920, height=1080)])
+    target = fileMap.FileMap(str(episodes), progress_bar=False)
+    with patch("pymediainfo.MediaInfo.parse", return_value=metadata):
+        target.load()
+    video = target._index[str(episodes)]["show - 01x03.avi"]
+    assert video.codec.format_name is None
+    assert target.query(quality="1080p")[-1].codec is None
+    target.close()
+
+
+def test_load_returns_scan_stats(episodes):
+    broken = episodes / "show - 01x03.mkv"
+    broken.write_bytes(b"not a video")
+    target = fileMap.FileMap(str(episodes.parent), progress_bar=False)
+    stats = target.load()
+    assert target.scan_stats is stats
+    assert stats.counts["added"] == 2
+    assert stats.counts["failed"] == 1
+    assert stats.counts["probes"] == 3
+    assert stats.counts["directories_scanned"] == 2
+    assert stats.bytes_probed == sum(
+        (episodes / name).stat().st_size
+        for name in ("show - 01x01.mkv", "show - 01x02.mkv", "show - 01x03.mkv")
+    )
+    assert len(stats.slowest_files) == 3
+    assert stats.phases["probe"] > 0
+    assert stats.phases["save"] > 0
+    assert stats.total_time >= sum(stats.phases.values())
+
+    (episodes / "show - 01x01.mkv").unlink()
+    stats = target.load(force=True)
+    assert (stats.cache_hits, stats.cache_misses, stats.cache_refreshes) == (1, 0, 0)
+    assert stats.counts["removed"] == 1
+    assert stats.counts["skipped_failures"] == 1
+    assert stats.counts["probes"] == 0
+
+    stats = target.load()
+    assert stats.counts["directories_skipped"] == 2
+    target.close()
+
+
+def test_scan_stats_written_as_json_lines(episodes, tmp_path):
+    stats_path = tmp_path / "stats.jsonl"
+    target = fileMap.FileMap(
+        str(episodes), progress_bar=False, stats_path=str(stats_path)
+    )
+    target.load()
+    list(target.iter_scan())
+    target.close()
+
+    lines = [json.loads(line) for line in stats_path.read_text().splitlines()]
+    assert [line["counts"]["added"] for line in lines] == [2, 0]
+    assert lines[0]["directory"] == str(episodes)
+    assert lines[0]["cache_misses"] == 2
+    assert set(lines[0]["phases"]) == set(scan_stats.PHASES)
+
+
+class RecordingHooks(ScanHooks):
+    def __init__(self):
+        self.calls = []
+        self.threads = set()
+
+    def __getattribute__(self, name):
+        if name in ScanHooks.__dict__ and not name.startswith("_"):
+            self.threads.add(threading.current_thread())
+        return super().__getattribute__(name)
+
+    def scan_started(self, directory):
+        self.calls.append(("scan_started", path.basename(directory)))
+
+    def directory_started(self, dir_path, file_names):
+        self.calls.append(("directory_started", path.basename(dir_path), file_names))
+
+    def file_probed(self, event, video, seconds):
+        assert seconds >= 0
+        self.calls.append(("file_probed", event, video.name))
+
+    def file_skipped(self, file_path, reason):
+        self.calls.append(("file_skipped", path.basename(file_path), reason))
+
+    def file_failed(self, event, video, error, seconds):
+        self.calls.append(("file_failed", event, video.name))
+
+    def directory_saved(self, dir_path):
+        self.calls.append(("directory_saved", path.basename(dir_path)))
+
+    def scan_finished(self, directory):
+        self.calls.append(("scan_finished", path.basename(directory)))
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_scan_hooks(episodes, workers):
+    (episodes / "show - 01x03.mkv").write_bytes(b"not a video")
+    hooks = RecordingHooks()
+    target = fileMap.FileMap(
+        str(episodes), progress_bar=False, workers=workers, hooks=[hooks]
+    )
+    target.load()
+    names = ["show - 01x01.mkv", "show - 01x02.mkv", "show - 01x03.mkv"]
+    assert hooks.calls == [
+        ("scan_started", "show"),
+        ("directory_started", "show", names),
+        ("file_probed", fileMap.ScanEvent.ADDED, "show - 01x01.mkv"),
+        ("file_probed", fileMap.ScanEvent.ADDED, "show - 01x02.mkv"),
+        ("file_failed", fileMap.ScanEvent.FAILED, "show - 01x03.mkv"),
+        ("directory_saved", "show"),
+        ("scan_finished", "show"),
+    ]
+    assert hooks.threads == {threading.main_thread()}
+
+    hooks.calls = []
+    target.load(force=True)
+    assert hooks.calls[2:5] == [
+        ("file_skipped", "show - 01x03.mkv", "failed"),
+        ("file_skipped", "show - 01x01.mkv", "unchanged"),
+        ("file_skipped", "show - 01x02.mkv", "unchanged"),
+    ]
+    target.close()
+
+
+def test_aload_scan_hooks(two_seasons):
+    hooks = RecordingHooks()
+    target = fileMap.FileMap(str(two_seasons), progress_bar=False, hooks=[hooks])
+    stats = asyncio.run(target.aload())
+    directory = [
+        "directory_started",
+        "file_probed",
+        "file_probed",
+        "directory_saved",
+    ]
+    assert [call[0] for call in hooks.calls] == [
+        "scan_started",
+        "directory_started",
+        "directory_saved",
+        *directory,
+        *directory,
+        "scan_finished",
+    ]
+    assert [call[1] for call in hooks.calls if call[0] == "directory_saved"] == [
+        "other show",
+        "season 1",
+        "season 2",
+    ]
+    assert hooks.calls[4][1] == fileMap.ScanEvent.ADDED
+    assert hooks.threads == {threading.main_thread()}
+    assert stats.counts["added"] == 4
+    target.close()
+
+
+def test_progress_bar_is_a_hook(episodes):
+    target = fileMap.FileMap(str(episodes))
+    with patch.object(fileMap, "RichProgressHooks") as mock_progress:
+        target.load()
+    mock_progress.return_value.scan_started.assert_called_once_with(str(episodes))
+    assert mock_progress.return_value.file_probed.call_count == 2
+    mock_progress.return_value.scan_finished.assert_called_once_with(str(episodes))
+    assert target.hooks == []
+    target.close()
+
+
+def test_query(episodes):
+    target = fileMap.FileMap(str(episodes.parent), progress_bar=False)
+    target.load()
+    video = target.contents[str(episodes)][0]
+
+    rows = target.query(codec=video.codec, resolution=video.resolution)
+    assert [row.name for row in rows] == ["show - 01x01.mkv", "show - 01x02.mkv"]
+    assert rows[0].to_video() == video
+    assert target.query(codec=video.codec.format_name, min_size=video.size_b + 1) == []
+    assert target.query(quality="720p") == []
+
+    totals = target.totals(by="quality")
+    assert list(totals) == [video.quality]
+    assert totals[video.quality].count == 2
+    assert totals[video.quality].size_b == 2 * video.size_b
+
+    with pytest.raises(ValueError):
+        target.totals(by="name")
+    with pytest.raises(ValueError):
+        target.query(resolution="1081p")
+    with pytest.raises(AttributeError):
+        target.query(quality="1081p")
+    target.close()
+
+
+@pytest.fixture
+def two_seasons(tmp_path, episodes):
+    library = tmp_path / "other show"
+    for season in ("season 1", "season 2"):
+        shutil.copytree(episodes, library / season)
+    return library
+
+
+def test_file_maps_share_cache(two_seasons, episodes):
+    # Fail fast rather than wait if a transaction were left open
+    with patch.object(fileMap, "BUSY_TIMEOUT", 0.5):
+        first = fileMap.FileMap(str(two_seasons), progress_bar=False)
+        second = fileMap.FileMap(str(episodes), progress_bar=False)
+        scan = first.iter_scan()
+        # Pause the first scan while it probes its second directory
+        for _, video in scan:
+            if video.dir_path.endswith("season 2"):
+                break
+
+        start = time.monotonic()
+        second.load()
+        assert time.monotonic() - start < 0.5
+        list(scan)
+        first.close()
+        second.close()
+
+    for library, directories, files in ((two_seasons, 3, 4), (episodes, 1, 2)):
+        storage = fileMap._FileMapStorage(str(library))
+        assert len(storage.load_directories()) == directories
+        assert sum(len(videos) for videos in storage.load().values()) == files
+        storage.close()
+
+
+def test_failed_save_rescans_directory(episodes):
+    target = fileMap.FileMap(str(episodes), progress_bar=False)
+    with patch.object(fileMap._FileMapStorage, "save_videos", return_value=False):
+        target.load()
+    storage = target._get_storage()
+    assert str(episodes) not in storage.load_directories()
+
+    # Without a recorded state, the next scan lists the directory and saves it
+    stats = target.load()
+    assert stats.counts["directories_scanned"] == 1
+    assert len(storage.load()[str(episodes)]) == 2
+    target.close()
@@ -1,4 +1,5 @@
 import os
+import pickle
 import sqlite3
 import tempfile
 from unittest.mock import patch
@@ -6,22 +7,26 @@ from unittest.mock import patch
 import pytest
 
 from video_utils import fileMap
-from video_utils.video import Video
+from video_utils.codec import Codec
+from video_utils.probe import Track
+from video_utils.video import Resolution, Video
 
 
 @pytest.fixture
 def target():
     # Clean up any existing cache files
     cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "video_utils")
-    cache_file = os.path.join(cache_dir, "cache.db")
-    if os.path.exists(cache_file):
-        os.remove(cache_file)
+    for cache_file in ("cache.db", "cache.db-wal", "cache.db-shm"):
+        cache_file = os.path.join(cache_dir, cache_file)
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
 
     with tempfile.TemporaryDirectory() as temp_dir:
         test_dir = os.path.join(temp_dir, "test_videos")
         os.makedirs(test_dir, exist_ok=True)
         storage = fileMap._FileMapStorage(test_dir)
         yield storage
+        storage.close()
 
 
 def test_storage(target):
@@ -30,14 +35,86 @@ def test_storage(target):
 
 @patch("os.path.expanduser", autospec=True)
 @patch("os.makedirs", autospec=True)
-def test_storage_path(mock_makedirs, mock_expanduser, target):
+def test_default_storage_path(mock_makedirs, mock_expanduser):
     mock_expanduser.return_value = "/home/some-user"
     expected_storage_path = "/home/some-user/.cache/video_utils"
-    result = target.storage_path
+    result = fileMap._FileMapStorage._default_storage_path()
     assert result == expected_storage_path + "/cache.db"
     mock_makedirs.assert_called_with(expected_storage_path, exist_ok=True)
 
 
+@patch("os.makedirs", autospec=True)
+def test_storage_path_cached(mock_makedirs, target):
+    assert target.storage_path.endswith("/.cache/video_utils/cache.db")
+    assert not mock_makedirs.called
+
+
+def test_storage_wal_mode(target):
+    journal_mode = target._connection().execute("PRAGMA journal_mode").fetchone()
+    assert journal_mode == ("wal",)
+
+
+def test_storage_batches_commits(target):
+    target.batch_size = 3
+    target.save_videos([Video("a.mkv", target.directory)])
+    target.save_videos([Video("b.mkv", target.directory)])
+    assert target._conn.in_transaction
+
+    target.save_videos([Video("c.mkv", target.directory)])
+    assert not target._conn.in_transaction
+
+    target.save_videos([Video("d.mkv", target.directory)])
+    target.flush()
+    assert not target._conn.in_transaction
+    with sqlite3.connect(target.storage_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM video_cache").fetchone() == (4,)
+
+
+def test_storage_save_only_dirty(target):
+    target.save_videos([Video("a.mkv", target.directory)])
+    target.flush()
+    video = target.load()[target.directory][0]
+    assert not video.dirty
+
+    with patch.object(target, "_connection") as mock_connection:
+        target.save_videos([video])
+        assert not mock_connection.called
+
+    new_video = Video("b.mkv", target.directory)
+    target.save_videos([video, new_video])
+    assert not new_video.dirty
+    assert sorted(v.name for v in target.load()[target.directory]) == [
+        "a.mkv",
+        "b.mkv",
+    ]
+
+
+def test_storage_save_failure(target):
+    video = Video("a.mkv", target.directory)
+    with patch.object(target, "_connection", side_effect=sqlite3.Error("locked")):
+        assert not target.save_videos([video])
+    assert video.dirty
+    assert target.save_videos([video])
+    assert target.save_videos([])
+
+
+def test_storage_save_keeps_created_at(target):
+    video = Video("a.mkv", target.directory, size_b=1)
+    target.save_videos([video])
+    target.flush()
+    query = "SELECT size_b, created_at, updated_at FROM video_cache"
+    _, created_at, _ = target._conn.execute(query).fetchone()
+
+    video.size_b = 2
+    video.dirty = True
+    target.save_videos([video])
+    target.flush()
+    size_b, resaved_created_at, updated_at = target._conn.execute(query).fetchone()
+    assert size_b == 2
+    assert resaved_created_at == created_at
+    assert updated_at >= created_at
+
+
 def test_storage_load_cache(target):
     # Create test video and save it
     test_video = Video("test.mkv", target.directory)
@@ -104,13 +181,376 @@ def test_storage_remove_existing_files(target):
     assert result[target.directory][0].name == "test1.mkv"
 
 
+def test_storage_directories(target):
+    sub_dir = os.path.join(target.directory, "season 1")
+    target.save_directory(target.directory, 123.5, 2, ["season 1", "extras"])
+    target.save_directory(sub_dir, 456.0, 0, [])
+
+    result = target.load_directories()
+    assert result == {
+        target.directory: (123.5, 2, ["season 1", "extras"]),
+        sub_dir: (456.0, 0, []),
+    }
+
+    target.remove_directories({sub_dir})
+    assert list(target.load_directories()) == [target.directory]
+
+
+def test_storage_failures(target):
+    sub_dir = os.path.join(target.directory, "season 1")
+    failure = fileMap.ProbeFailure(10, 1.0, "no video track", 1, 2.0)
+    target.save_failures(target.directory, {"a.mkv": failure})
+    target.save_failures(sub_dir, {"b.mkv": failure, "c.mkv": failure})
+    target.save_failures(f"{target.directory}-extras", {"d.mkv": failure})
+
+    assert target.load_failures() == {
+        target.directory: {"a.mkv": failure},
+        sub_dir: {"b.mkv": failure, "c.mkv": failure},
+    }
+    target.remove_failures({os.path.join(sub_dir, "b.mkv")})
+    assert list(target.load_failures()[sub_dir]) == ["c.mkv"]
+
+
+def test_storage_episodes(target):
+    sub_dir = os.path.join(target.directory, "season 2")
+    target.save_videos(
+        [
+            Video("Show - 01x02 - Second.mkv", target.directory),
+            Video("Show - 01x01 - Pilot.mkv", target.directory),
+            Video("Other Show - 01x01.mkv", target.directory),
+            Video("notes.mkv", target.directory),
+            Video("Show S02E01 720p.mkv", sub_dir),
+        ]
+    )
+    target.save_videos([Video("Show - 01x03.mkv", f"{target.directory}-extras")])
+
+    assert [video.name for video in target.load_episodes("show")] == [
+        "Show - 01x01 - Pilot.mkv",
+        "Show - 01x02 - Second.mkv",
+        "Show S02E01 720p.mkv",
+    ]
+    assert [video.name for video in target.load_episodes("Show", season=2)] == [
+        "Show S02E01 720p.mkv"
+    ]
+    assert target.load_episodes("Missing") == []
+
+
+def test_storage_duplicate_episodes(target):
+    sub_dir = os.path.join(target.directory, "720p")
+    target.save_videos(
+        [
+            Video("Show - 01x01 - Pilot.mkv", target.directory, quality="1080p"),
+            Video("Show - 01x02.mkv", target.directory),
+            Video("show s01e01.mkv", sub_dir, quality="720p"),
+        ]
+    )
+
+    duplicates = target.load_duplicate_episodes()
+    assert len(duplicates) == 1
+    (show_name, season, episode), videos = next(iter(duplicates.items()))
+    assert (show_name.lower(), season, episode) == ("show", 1, 1)
+    assert [video.quality for video in videos] == ["720p", "1080p"]
+
+
+def test_storage_episode_query_plan(target):
+    cursor = target._connection().execute(
+        "EXPLAIN QUERY PLAN SELECT name FROM video_cache WHERE show_name = ? AND season = ?",
+        ("Show", 1),
+    )
+    assert "USING INDEX idx_episode" in " ".join(detail for *_, detail in cursor)
+
+
+def full_video(directory):
+    return Video(
+        "test.mkv",
+        directory,
+        codec=Codec("HEVC"),
+        quality="1080p",
+        size_b=12345,
+        duration=1436031.0,
+        video_track=Track("Video", format="HEVC", width=1920, height=1080),
+        audio_tracks=[Track("Audio", language="ja"), Track("Audio")],
+        text_tracks=[Track("Text", language="en")],
+        resolution=Resolution.P1080,
+    )
+
+
+def test_storage_round_trip(target):
+    target.save_videos([full_video(target.directory)])
+
+    video = target.load()[target.directory][0]
+    assert video.codec == Codec("HEVC")
+    assert video.codec.get_ffmpeg_name() == "libx265"
+    assert video.quality == "1080p"
+    assert video.size_b == 12345
+    assert video.duration == 1436031.0
+    assert video.resolution == Resolution.P1080
+    assert (video.video_track.width, video.video_track.height) == (1920, 1080)
+    assert [track.language for track in video.audio_tracks] == ["ja", None]
+    assert video.subtitle_languages == ["eng"]
+    assert video.schema_version == Video.SCHEMA_VERSION
+
+
+def test_storage_defers_tracks(target):
+    target.save_videos([full_video(target.directory)])
+
+    video = target.load()[target.directory][0]
+    assert video._track_loader is not None
+    assert [track.language for track in video.audio_tracks] == ["ja", None]
+    assert video._track_loader is None
+
+
+def test_storage_list_and_load_directory(target):
+    sub_dir = os.path.join(target.directory, "season 1")
+    target.save_videos([Video("a.mkv", target.directory)])
+    target.save_videos([Video("b.mkv", sub_dir), Video("c.mkv", sub_dir)])
+
+    assert sorted(target.list_directories()) == [target.directory, sub_dir]
+    assert [video.name for video in target.load_directory(sub_dir)] == [
+        "b.mkv",
+        "c.mkv",
+    ]
+    assert target.load_directory("/not-cached") == []
+
+
+def test_storage_scope_excludes_siblings(target):
+    sub_dir = os.path.join(target.directory, "season 1")
+    sibling_dir = f"{target.directory}-extras"
+    target.save_videos([Video("a.mkv", target.directory), Video("b.mkv", sub_dir)])
+    target.save_videos([Video("c.mkv", sibling_dir)])
+    target.save_directory(sub_dir, 1.0, 1, [])
+    target.save_directory(sibling_dir, 1.0, 1, [])
+
+    assert sorted(target.load()) == [target.directory, sub_dir]
+    assert sorted(target.list_directories()) == [target.directory, sub_dir]
+    assert list(target.load_directories()) == [sub_dir]
+
+
+def test_storage_scope_file(target):
+    file_path = os.path.join(target.directory, "a.mkv")
+    with open(file_path, "w"):
+        pass
+    target.save_videos(
+        [Video("a.mkv", target.directory), Video("b.mkv", target.directory)]
+    )
+    target.flush()
+
+    storage = fileMap._FileMapStorage(file_path)
+    assert [video.name for video in storage.load()[target.directory]] == ["a.mkv"]
+
+
+def test_storage_query_plan_uses_index(target):
+    plan = " ".join(target.query_plan())
+    assert "USING INDEX idx_directory" in plan
+    assert "SCAN video_cache" not in plan
+
+
+def test_storage_migrates_pickled_rows(tmp_path):
+    storage_path = str(tmp_path / "cache.db")
+    directory = str(tmp_path)
+    with sqlite3.connect(storage_path) as conn:
+        conn.execute("""
+            CREATE TABLE video_cache (
+                file_path TEXT PRIMARY KEY,
+                directory TEXT NOT NULL,
+                last_modified REAL NOT NULL,
+                video_data BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX idx_directory ON video_cache(directory)")
+        video = full_video(directory)
+        conn.execute(
+            "INSERT INTO video_cache VALUES (?, ?, ?, ?, ?, ?)",
+            (video.full_path, directory, 12345, pickle.dumps(video), 1.0, 2.0),
+        )
+        conn.execute(
+            "INSERT INTO video_cache VALUES (?, ?, ?, ?, ?, ?)",
+            (f"{directory}/broken.mkv", directory, 1, b"not a pickle", 1.0, 2.0),
+        )
+
+    with patch.object(
+        fileMap._FileMapStorage,
+        "storage_path",
+        new_callable=lambda: property(lambda self: storage_path),
+    ):
+        storage = fileMap._FileMapStorage(directory)
+        result = storage.load()
+
+    assert [video.name for video in result[directory]] == ["test.mkv"]
+    assert result[directory][0].quality == "1080p"
+    assert [track.language for track in result[directory][0].audio_tracks] == [
+        "ja",
+        None,
+    ]
+    with sqlite3.connect(storage_path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == (
+            fileMap.STORAGE_VERSION
+        )
+        created_at = conn.execute("SELECT created_at FROM video_cache").fetchone()
+        assert created_at == (1.0,)
+
+
+def test_storage_adds_new_columns(tmp_path):
+    storage_path = str(tmp_path / "cache.db")
+    directory = str(tmp_path)
+    with sqlite3.connect(storage_path) as conn:
+        conn.execute(f"""
+            CREATE TABLE video_cache (
+                file_path TEXT PRIMARY KEY,
+                {", ".join(fileMap.VIDEO_COLUMNS[1:-1])},
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute(
+            "INSERT INTO video_cache (file_path, directory, name, schema_version, "
+            "created_at, updated_at) VALUES (?, ?, ?, 2, 1.0, 1.0)",
+            (f"{directory}/Show - 01x02.mkv", directory, "Show - 01x02.mkv"),
+        )
+        conn.execute("PRAGMA user_version = 2")
+
+    with patch.object(
+        fileMap._FileMapStorage,
+        "storage_path",
+        new_callable=lambda: property(lambda self: storage_path),
+    ):
+        storage = fileMap._FileMapStorage(directory)
+        video = storage.load()[directory][0]
+        assert video.fingerprint is None
+        assert [video.name for video in storage.load_episodes("show")] == [
+            "Show - 01x02.mkv"
+        ]
+
+        video.fingerprint = "abc"
+        video.dirty = True
+        storage.save_videos([video])
+        assert storage.load()[directory][0].fingerprint == "abc"
+        storage.close()
+
+
 def test_database_schema(target):
     # Verify the database schema was created correctly
     with sqlite3.connect(target.storage_path) as conn:
         cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
         tables = [row[0] for row in cursor]
         assert "video_cache" in tables
+        assert "directory_cache" in tables
 
         cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='index'")
         indexes = [row[0] for row in cursor]
         assert "idx_directory" in indexes
+        assert "idx_query" in indexes
+
+
+def query_library(directory):
+    return [
+        Video(
+            "a.mkv",
+            directory,
+            codec=Codec("AVC"),
+            quality="1080p",
+            size_b=5_000,
+            duration=10.0,
+            resolution=Resolution.P1080,
+        ),
+        Video(
+            "b.mkv",
+            directory,
+            codec=Codec("AVC"),
+            quality="720p",
+            size_b=2_000,
+            duration=20.0,
+            resolution=Resolution.P720,
+        ),
+        Video(
+            "c.mkv",
+            directory,
+            codec=Codec("HEVC"),
+            quality="1080p",
+            size_b=9_000,
+            duration=30.0,
+            resolution=Resolution.P1080,
+        ),
+        Video("d.mkv", directory),
+    ]
+
+
+def test_storage_query_videos(target):
+    sub_dir = os.path.join(target.directory, "season 1")
+    target.save_videos(query_library(target.directory) + query_library(sub_dir))
+    target.save_videos(query_library(f"{target.directory}-extras"))
+
+    rows = target.query_videos({"codec": "AVC", "min_size": 3_000})
+    assert [row.file_path for row in rows] == [
+        os.path.join(target.directory, "a.mkv"),
+        os.path.join(sub_dir, "a.mkv"),
+    ]
+    assert (rows[0].quality, rows[0].resolution, rows[0].size_b) == (
+        "1080p",
+        "1080p",
+        5_000,
+    )
+    video = rows[0].to_video()
+    assert video.codec == Codec("AVC")
+    assert video.resolution == Resolution.P1080
+
+    rows = target.query_videos({"quality": "1080p", "max_size": 5_000})
+    assert [row.name for row in rows] == ["a.mkv", "a.mkv"]
+    assert len(target.query_videos({"resolution": "720p"})) == 2
+    assert len(target.query_videos({})) == 8
+
+
+def test_storage_load_totals(target):
+    target.save_videos(query_library(target.directory))
+    target.save_videos(query_library(f"{target.directory}-extras"))
+
+    assert target.load_totals("codec", {}) == {
+        None: fileMap.VideoTotals(1, 0, 0.0),
+        "AVC": fileMap.VideoTotals(2, 7_000, 30.0),
+        "HEVC": fileMap.VideoTotals(1, 9_000, 30.0),
+    }
+    assert target.load_totals("quality", {"min_size": 3_000}) == {
+        "1080p": fileMap.VideoTotals(2, 14_000, 40.0)
+    }
+
+
+def test_storage_video_row_fields():
+    assert fileMap.VideoRow._fields == fileMap.VIDEO_COLUMNS
+
+
+def query_plan(target, sql, params):
+    cursor = target._connection().execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    return " ".join(detail for *_, detail in cursor)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        lambda target: target._videos_query({"codec": "AVC", "quality": "1080p"}),
+        lambda target: target._videos_query({"codec": "AVC", "min_size": 1}),
+        lambda target: target._totals_query("quality", {"codec": "AVC"}),
+        lambda target: target._videos_query({"min_size": 1}),
+    ],
+)
+def test_storage_query_plans_use_indexes(target, query):
+    plan = query_plan(target, *query(target))
+    assert "INDEX idx_query" in plan or "INDEX idx_size" in plan
+    assert "idx_directory" not in plan
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        lambda target: target._videos_query({}),
+        lambda target: target._videos_query({"quality": "1080p"}),
+        lambda target: target._videos_query({"resolution": "720p"}),
+        lambda target: target._totals_query("codec", {}),
+        lambda target: target._totals_query("codec", {"quality": "1080p"}),
+    ],
+)
+def test_storage_unselective_query_plans_use_directory_index(target, query):
+    # These would otherwise scan every library in the shared cache
+    plan = query_plan(target, *query(target))
+    assert "INDEX idx_directory" in plan
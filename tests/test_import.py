@@ -0,0 +1,53 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+import video_utils
+
+HEAVY_MODULES = ("asyncio", "iso639", "multiprocessing", "pymediainfo", "rich")
+
+
+def loaded_modules(statement):
+    code = f"""
+import json, sys
+{statement}
+print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))
+"""
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output)
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "import video_utils",
+        "from video_utils import parse_episode, parse_episodes, validators",
+        "from video_utils import Codec, Video, Resolution, ScanStats",
+        "from video_utils import FileMap, ScanEvent, ScanHooks",
+    ],
+)
+def test_import_is_lazy(statement):
+    assert loaded_modules(statement) == []
+
+
+def test_lazy_attributes():
+    from video_utils import fileMap, video
+
+    assert video_utils.FileMap is fileMap.FileMap
+    assert video_utils.Resolution is video.Resolution
+    assert video_utils.validators.Filter
+    assert callable(video_utils.parse_episode)
+    assert "FileMap" in dir(video_utils)
+    with pytest.raises(AttributeError):
+        _ = video_utils.missing
+
+
+def test_all_lists_lazy_names():
+    lazy = [*video_utils._LAZY_ATTRIBUTES, *video_utils._LAZY_MODULES]
+    assert sorted(video_utils.__all__) == sorted(
+        ["parse_episode", "parse_episodes", *lazy]
+    )
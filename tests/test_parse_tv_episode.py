@@ -1,6 +1,6 @@
 import pytest
 
-from video_utils.parse_episode import parse_episode
+from video_utils.parse_episode import parse_episode, parse_episodes
 
 
 def test_sXXeXX():
@@ -88,3 +88,24 @@ def test_badFilename():
 
     with pytest.raises(ValueError):
         parse_episode(testFilename)
+
+
+def test_parse_episodes():
+    results = parse_episodes(
+        ["Show - 01x02 - Pilot.mkv", "not an episode.mkv", "/tv/Show/Show S02E10.mkv"]
+    )
+    assert results == [
+        {"showName": "Show", "episode": 2, "season": 1, "episodeName": "Pilot"},
+        None,
+        {"showName": "Show", "episode": 10, "season": 2, "episodeName": ""},
+    ]
+
+
+def test_parse_episode_cache():
+    first = parse_episode("Show - 01x02 - Pilot.mkv", cache=True)
+    first["season"] = 5
+    second = parse_episode("Show - 01x02 - Pilot.mkv", cache=True)
+    assert second["season"] == 1
+    assert parse_episodes(["Show - 01x02 - Pilot.mkv"], cache=True) == [
+        parse_episode("Show - 01x02 - Pilot.mkv")
+    ]
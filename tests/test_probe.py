@@ -0,0 +1,199 @@
+import struct
+from os import path
+
+from video_utils import probe
+
+
+def ebml(element_id: int, body: bytes) -> bytes:
+    id_bytes = element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+    return id_bytes + size(len(body)) + body
+
+
+def size(value: int) -> bytes:
+    return (0x01 << 56 | value).to_bytes(8, "big")
+
+
+def uint(value: int) -> bytes:
+    return value.to_bytes(4, "big")
+
+
+def mkv_track(track_type, codec_id, language=None, width=None, height=None):
+    body = ebml(probe.TRACK_TYPE, bytes([track_type]))
+    body += ebml(probe.CODEC_ID, codec_id.encode())
+    if language:
+        body += ebml(probe.LANGUAGE, language.encode())
+    if width:
+        video = ebml(probe.PIXEL_WIDTH, uint(width))
+        video += ebml(probe.PIXEL_HEIGHT, uint(height))
+        body += ebml(probe.VIDEO, video)
+    return ebml(probe.TRACK_ENTRY, body)
+
+
+def mkv(tracks, duration=60000.0, cluster_first=False):
+    header = ebml(probe.EBML, ebml(probe.DOC_TYPE, b"matroska"))
+    info = ebml(probe.TIMECODE_SCALE, uint(1_000_000))
+    if duration is not None:
+        info += ebml(probe.DURATION, struct.pack(">d", duration))
+    info = ebml(probe.INFO, info)
+    tracks = ebml(probe.TRACKS, b"".join(tracks))
+    cluster = ebml(probe.CLUSTER, b"\x00" * 64)
+    children = [info, cluster, tracks] if cluster_first else [info, tracks, cluster]
+    return header + ebml(probe.SEGMENT, b"".join(children))
+
+
+def box(box_type: bytes, body: bytes) -> bytes:
+    return struct.pack(">I4s", len(body) + 8, box_type) + body
+
+
+def mp4_trak(
+    handler, language, sample_type=None, width=0, height=0, version=0, duration=90000
+):
+    if version == 1:
+        mdhd = struct.pack(">B3xQQIQH2x", 1, 0, 0, 1000, duration, language)
+    else:
+        mdhd = struct.pack(">B3xIIIIH2x", 0, 0, 0, 1000, duration, language)
+    hdlr = struct.pack(">I4s4s12x", 0, b"\x00" * 4, handler) + b"\x00"
+    minf = b""
+    if sample_type:
+        entry = box(
+            sample_type,
+            b"\x00" * 8
+            + b"\x00" * 16
+            + struct.pack(">HH", width, height)
+            + b"\x00" * 50,
+        )
+        stsd = box(b"stsd", struct.pack(">II", 0, 1) + entry)
+        minf = box(b"minf", box(b"stbl", stsd + box(b"stts", b"\x00" * 16)))
+    mdia = box(b"mdia", box(b"mdhd", mdhd) + box(b"hdlr", hdlr) + minf)
+    return box(b"trak", box(b"tkhd", b"\x00" * 84) + mdia)
+
+
+def pack_language(language: str) -> int:
+    a, b, c = (ord(char) - 0x60 for char in language)
+    return (a << 10) | (b << 5) | c
+
+
+def mp4(traks, moov_last=True, duration=36000):
+    ftyp = box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2")
+    mvhd = box(b"mvhd", struct.pack(">B3xIIII", 0, 0, 0, 600, duration) + b"\x00" * 80)
+    moov = box(b"moov", mvhd + b"".join(traks))
+    mdat = box(b"mdat", b"\x00" * 1024)
+    return ftyp + (mdat + moov if moov_last else moov + mdat)
+
+
+def write(tmp_path, name, data):
+    file_path = tmp_path / name
+    file_path.write_bytes(data)
+    return str(file_path)
+
+
+def test_probe_mkv_fixture():
+    current_dir = path.dirname(path.abspath(__file__))
+    file_path = path.join(
+        current_dir, "testData", "foo", "test episode - 02x03 - this is 720p.mkv"
+    )
+    metadata = probe.probe(file_path)
+    video_track = metadata.video_tracks[0]
+    assert video_track.format == "HEVC"
+    assert (video_track.width, video_track.height) == (1280, 720)
+    assert [track.language for track in metadata.audio_tracks] == ["eng"]
+
+
+def test_probe_mkv(tmp_path):
+    data = mkv(
+        [
+            mkv_track(1, "V_MPEG4/ISO/AVC", width=1920, height=1080),
+            mkv_track(2, "A_AAC", language="jpn"),
+            mkv_track(2, "A_AC3"),
+            mkv_track(0x11, "S_TEXT/UTF8", language="fre"),
+        ]
+    )
+    metadata = probe.probe(write(tmp_path, "a.mkv", data))
+    video_track = metadata.video_tracks[0]
+    assert video_track.format == "AVC"
+    assert (video_track.width, video_track.height) == (1920, 1080)
+    assert video_track.duration == 60000.0
+    assert [track.language for track in metadata.audio_tracks] == ["jpn", "eng"]
+    assert [track.language for track in metadata.text_tracks] == ["fre"]
+
+
+def test_probe_mkv_unknown_codec(tmp_path):
+    data = mkv([mkv_track(1, "V_MPEG2", width=720, height=576)])
+    assert probe.probe(write(tmp_path, "a.mkv", data)) is None
+
+
+def test_probe_mkv_tracks_after_cluster(tmp_path):
+    data = mkv(
+        [mkv_track(1, "V_MPEGH/ISO/HEVC", width=1920, height=1080)],
+        cluster_first=True,
+    )
+    assert probe.probe(write(tmp_path, "a.mkv", data)) is None
+
+
+def test_probe_mkv_without_duration(tmp_path):
+    data = mkv([mkv_track(1, "V_MPEGH/ISO/HEVC", width=1920, height=1080)], None)
+    assert probe.probe(write(tmp_path, "a.mkv", data)) is None
+
+
+def test_probe_mkv_truncated(tmp_path):
+    data = mkv([mkv_track(1, "V_MPEGH/ISO/HEVC", width=1920, height=1080)])
+    assert probe.probe(write(tmp_path, "a.mkv", data[:60])) is None
+
+
+def test_probe_mkv_not_matroska(tmp_path):
+    assert probe.probe(write(tmp_path, "a.mkv", b"RIFF" + b"\x00" * 64)) is None
+
+
+def test_probe_mp4(tmp_path):
+    data = mp4(
+        [
+            mp4_trak(b"vide", pack_language("und"), b"avc1", 1280, 720),
+            mp4_trak(b"soun", pack_language("eng")),
+            mp4_trak(b"sbtl", pack_language("spa"), version=1),
+        ]
+    )
+    metadata = probe.probe(write(tmp_path, "a.mp4", data))
+    video_track = metadata.video_tracks[0]
+    assert video_track.format == "AVC"
+    assert (video_track.width, video_track.height) == (1280, 720)
+    assert video_track.duration == 90000.0
+    assert [track.language for track in metadata.audio_tracks] == ["eng"]
+    assert [track.language for track in metadata.text_tracks] == ["spa"]
+
+
+def test_probe_mov_moov_first(tmp_path):
+    data = mp4([mp4_trak(b"vide", 0, b"hvc1", 3840, 2160)], moov_last=False)
+    metadata = probe.probe(write(tmp_path, "a.mov", data))
+    assert metadata.video_tracks[0].format == "HEVC"
+    assert metadata.video_tracks[0].width == 3840
+
+
+def test_probe_mp4_track_duration_from_mvhd(tmp_path):
+    data = mp4([mp4_trak(b"vide", 0, b"avc1", 1280, 720, duration=0)])
+    metadata = probe.probe(write(tmp_path, "a.mp4", data))
+    assert metadata.video_tracks[0].duration == 60000.0
+
+
+def test_probe_mp4_fragmented(tmp_path):
+    # Fragmented MP4s leave both durations 0 in moov
+    data = mp4([mp4_trak(b"vide", 0, b"avc1", 1280, 720, duration=0)], duration=0)
+    assert probe.probe(write(tmp_path, "a.mp4", data)) is None
+
+
+def test_probe_mp4_unknown_codec(tmp_path):
+    data = mp4([mp4_trak(b"vide", 0, b"mp4v", 640, 480)])
+    assert probe.probe(write(tmp_path, "a.mp4", data)) is None
+
+
+def test_probe_mp4_no_moov(tmp_path):
+    data = box(b"ftyp", b"isom") + box(b"mdat", b"\x00" * 64)
+    assert probe.probe(write(tmp_path, "a.mp4", data)) is None
+
+
+def test_probe_unsupported_extension(tmp_path):
+    data = mkv([mkv_track(1, "V_MPEGH/ISO/HEVC", width=1920, height=1080)])
+    assert probe.probe(write(tmp_path, "a.avi", data)) is None
+
+
+def test_probe_missing_file():
+    assert probe.probe("/not-a-real-path/foo.mkv") is None
@@ -0,0 +1,71 @@
+import os
+import time
+from os import path
+
+import pytest
+from mock import patch
+
+from video_utils import fileMap
+from video_utils.probe_pool import ProbePool, ProbeTimeout, media_info_metadata
+
+TEST_VIDEO = path.join(
+    path.dirname(path.abspath(__file__)),
+    "testData",
+    "foo",
+    "test episode - 01x01 - another in 1080p.mkv",
+)
+
+
+@pytest.fixture
+def pool():
+    pool = ProbePool(timeout=10)
+    yield pool
+    pool.close()
+
+
+def test_media_info_metadata():
+    metadata = media_info_metadata(TEST_VIDEO)
+    video_track = metadata.video_tracks[0]
+    assert video_track.format == "HEVC"
+    assert (video_track.width, video_track.height) == (1920, 1080)
+
+
+def test_pool_parses_in_worker(pool):
+    assert pool(TEST_VIDEO).video_tracks[0].format == "HEVC"
+    assert len(pool._idle) == 1
+    worker = pool._idle[0]
+    pool(TEST_VIDEO)
+    assert pool._idle == [worker]
+
+
+def test_pool_reports_errors(pool):
+    pool._parse = os.path.getsize
+    with pytest.raises(RuntimeError, match="FileNotFoundError"):
+        pool("/not-a-real-path.mkv")
+    assert len(pool._idle) == 1
+
+
+def test_pool_kills_hung_worker():
+    pool = ProbePool(timeout=0.5, parse=time.sleep)
+    start = time.monotonic()
+    with pytest.raises(ProbeTimeout):
+        pool(60)
+    assert time.monotonic() - start < 10
+    assert pool._idle == []
+
+    pool.timeout = 10
+    assert pool(0) is None
+    pool.close()
+
+
+def test_filemap_reports_timeouts(tmp_path):
+    (tmp_path / "hangs.mkv").write_bytes(b"not a video")
+    target = fileMap.FileMap(str(tmp_path), progress_bar=False, probe_timeout=5)
+    with patch.object(
+        fileMap.Video, "refresh", autospec=True, side_effect=ProbeTimeout
+    ) as mock_refresh:
+        events = [(event, video.name) for event, video in target.iter_scan()]
+    assert mock_refresh.call_args.args[1] is target._probe_pool
+    assert events == [(fileMap.ScanEvent.TIMED_OUT, "hangs.mkv")]
+    assert str(tmp_path / "hangs.mkv") in target.failures
+    target.close()
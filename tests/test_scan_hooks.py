@@ -0,0 +1,33 @@
+from video_utils.fileMap import ScanEvent
+from video_utils.scan_hooks import RichProgressHooks, ScanHooks
+
+
+def test_scan_hooks_do_nothing():
+    hooks = ScanHooks()
+    hooks.scan_started("/videos")
+    hooks.directory_started("/videos", ["a.mkv"])
+    hooks.file_probed(ScanEvent.ADDED, None, 0.1)
+    hooks.file_skipped("/videos/a.mkv", "unchanged")
+    hooks.file_failed(ScanEvent.FAILED, None, RuntimeError(), 0.1)
+    hooks.directory_saved("/videos")
+    hooks.scan_finished("/videos")
+
+
+def test_rich_progress_hooks():
+    hooks = RichProgressHooks()
+    hooks.scan_started("/videos")
+    progress = hooks._progress
+    hooks.directory_started("/videos/a", ["1.mkv", "2.mkv"])
+    hooks.file_probed(ScanEvent.ADDED, None, 0.1)
+    hooks.file_skipped("/videos/a/2.mkv", "failed")
+    hooks.directory_started("/videos/b", ["3.mkv"])
+    hooks.file_failed(ScanEvent.FAILED, None, RuntimeError(), 0.1)
+    task = progress.tasks[0]
+    assert (task.completed, task.total) == (3, 3)
+    assert task.description == "Processing /videos/b..."
+
+    hooks.scan_finished("/videos")
+    assert task.description == "Scanned /videos"
+    assert hooks._progress is None
+    # Safe to call again, e.g. when a scan fails before starting
+    hooks.scan_finished("/videos")
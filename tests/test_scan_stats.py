@@ -0,0 +1,40 @@
+import json
+import time
+
+from video_utils.scan_stats import ScanStats
+
+
+def test_nested_phases_are_exclusive():
+    stats = ScanStats("/videos")
+    with stats.phase("save"):
+        time.sleep(0.02)
+        with stats.phase("commit"):
+            time.sleep(0.05)
+    stats.finish()
+    assert 0.02 <= stats.phases["save"] < 0.05
+    assert stats.phases["commit"] >= 0.05
+    assert stats.total_time >= stats.phases["save"] + stats.phases["commit"]
+
+
+def test_slowest_files():
+    stats = ScanStats("/videos")
+    for i in range(20):
+        stats.record_probe(f"/videos/{i}.mkv", i, 100)
+    assert stats.counts["probes"] == 20
+    assert stats.bytes_probed == 2000
+    assert [file_path for file_path, _ in stats.slowest_files] == [
+        f"/videos/{i}.mkv" for i in range(19, 9, -1)
+    ]
+
+
+def test_to_json():
+    stats = ScanStats("/videos")
+    stats.count("unchanged", 3)
+    stats.count("added")
+    stats.record_probe("/videos/a.mkv", 0.5, None)
+    stats.finish()
+    result = json.loads(stats.to_json())
+    assert result["cache_hits"] == 3
+    assert result["cache_misses"] == 1
+    assert result["slowest_files"] == [{"path": "/videos/a.mkv", "seconds": 0.5}]
+    assert "\n" not in stats.to_json()
@@ -3,9 +3,10 @@ import pickle
 from os import path
 
 import pytest
-from mock import patch
+from mock import MagicMock, patch
 
 from video_utils import Codec, Video, Resolution
+from video_utils.video import FINGERPRINT_BLOCK
 
 
 def test_minimal():
@@ -96,16 +97,18 @@ def stat_return():
         return None
 
     setattr(mock_st_size, "st_size", 12345)
+    setattr(mock_st_size, "st_mtime", 1000.0)
+    setattr(mock_st_size, "st_ino", 42)
     return mock_st_size
 
 
-@patch("video_utils.video.MediaInfo", autospec=True)
+@patch("pymediainfo.MediaInfo.parse")
 @patch("video_utils.validators.Validator", autospec=True)
 @patch("video_utils.video.Video.get_current_size", autospec=True, return_value=12345)
 @patch("video_utils.video.Video._needs_refresh", autospec=True, return_value=True)
 def test_refresh(mock_needs_refresh, mock_get_size, mock_validator, mock_media_info):
     expected_codec = Codec("HEVC")
-    mock_media_info.parse.return_value = metadata_return()
+    mock_media_info.return_value = metadata_return()
     mock_validator().quality_similar_to.return_value = "1080p"
 
     v = Video("foo.mkv", "/not-a-real-path/bar")
@@ -118,13 +121,39 @@ def test_refresh(mock_needs_refresh, mock_get_size, mock_validator, mock_media_i
     assert v.resolution == Resolution.P1080
 
 
-@patch("video_utils.video.MediaInfo.parse")
+@patch("pymediainfo.MediaInfo.parse")
+def test_refresh_fast_probe(mock_media_info):
+    current_dir = path.dirname(path.abspath(__file__))
+    test_data_dir = path.join(current_dir, "testData", "foo")
+    v = Video("test episode - 02x03 - this is 720p.mkv", test_data_dir)
+    v.refresh()
+
+    assert not mock_media_info.called
+    assert v.codec == Codec("HEVC")
+    assert v.quality == "720p"
+    assert v.resolution == Resolution.P720
+    assert v.audio_languages == ["eng"]
+
+
+@patch("pymediainfo.MediaInfo.parse")
 @patch("video_utils.validators.Validator", autospec=True)
 @patch("video_utils.video.Video._needs_refresh", autospec=True, return_value=False)
 def test_refresh_not_required(mock_needs_refresh, mock_validator, mock_parse):
     v = Video("foo.mkv", "/not-a-real-path/bar")
-    v.refresh()
+    v.dirty = False
+    assert v.refresh() is False
     assert mock_parse.called is False
+    assert v.dirty is False
+
+
+def test_refresh_marks_dirty():
+    current_dir = path.dirname(path.abspath(__file__))
+    test_data_dir = path.join(current_dir, "testData", "foo")
+    v = Video("test episode - 02x03 - this is 720p.mkv", test_data_dir)
+    assert v.dirty is True
+    v.dirty = False
+    assert v.refresh() is True
+    assert v.dirty is True
 
 
 @patch("video_utils.video.Video.get_current_size", autospec=True, return_value=12345)
@@ -155,7 +184,7 @@ def test_get_current_size(mock_stat):
     assert v.get_current_size() == 12345
 
 
-@patch("video_utils.video.MediaInfo", autospec=True)
+@patch("pymediainfo.MediaInfo.parse")
 @patch("os.stat", autospec=True)
 @patch("video_utils.validators.Validator", autospec=True)
 def test_refresh_failure(mock_validator, mock_stat, mock_media_info):
@@ -163,7 +192,7 @@ def test_refresh_failure(mock_validator, mock_stat, mock_media_info):
     metadata = metadata_return()
     for track in metadata.tracks:
         track.track_type = "not-video"
-    mock_media_info.parse.return_value = metadata
+    mock_media_info.return_value = metadata
     mock_validator().quality_similar_to.return_value = "1080p"
 
     v = Video("foo.mkv", "/not-a-real-path/bar")
@@ -171,32 +200,63 @@ def test_refresh_failure(mock_validator, mock_stat, mock_media_info):
         v.refresh()
 
 
-@patch("video_utils.video.MediaInfo", autospec=True)
+@patch("pymediainfo.MediaInfo.parse")
 @patch("os.stat", autospec=True)
 @patch("video_utils.validators.Validator", autospec=True)
 def test_subtitle_languages(mock_validator, mock_stat, mock_media_info):
     mock_stat.return_value = stat_return()
     metadata = metadata_return()
-    mock_media_info.parse.return_value = metadata
+    mock_media_info.return_value = metadata
 
     v = Video("foo.mkv", "/not-a-real-path/bar")
     v.refresh()
     assert v.subtitle_languages == ["eng", "eng"]
 
 
-@patch("video_utils.video.MediaInfo", autospec=True)
+@patch("pymediainfo.MediaInfo.parse")
 @patch("os.stat", autospec=True)
 @patch("video_utils.validators.Validator", autospec=True)
 def test_audio_languages(mock_validator, mock_stat, mock_media_info):
     mock_stat.return_value = stat_return()
     metadata = metadata_return()
-    mock_media_info.parse.return_value = metadata
+    mock_media_info.return_value = metadata
 
     v = Video("foo.mkv", "/not-a-real-path/bar")
     v.refresh()
     assert v.audio_languages == ["jpn"]
 
 
+def test_defer_tracks():
+    loader = MagicMock(return_value=("video", ["audio"], None))
+    v = Video("foo.mkv", "/not-a-real-path/bar")
+    v.defer_tracks(loader)
+    assert not loader.called
+    assert v.audio_tracks == ["audio"]
+    assert v.video_track == "video"
+    assert v.text_tracks is None
+    assert loader.call_count == 1
+
+
+def test_defer_tracks_overridden_by_setter():
+    v = Video("foo.mkv", "/not-a-real-path/bar")
+    v.defer_tracks(lambda: ("video", ["audio"], ["text"]))
+    v.audio_tracks = []
+    assert v.audio_tracks == []
+    assert v.text_tracks == ["text"]
+
+
+def test_unpickle_legacy_video():
+    state = Video("foo.mkv", "/not-a-real-path/bar").__getstate__()
+    for key in ("video_track", "audio_tracks", "text_tracks"):
+        state[key] = state.pop(f"_{key}")
+    state["audio_tracks"] = ["audio"]
+
+    v = Video.__new__(Video)
+    v.__setstate__(state)
+    assert v.audio_tracks == ["audio"]
+    assert v.video_track is None
+
+
 def test_resolution_init():
     v = Video("foo.mkv", "/not-a-real-path/bar", resolution=Resolution.P720)
     assert v.resolution == Resolution.P720
@@ -246,3 +306,67 @@ def test_schema_version_init():
 def test_schema_version_explicit():
     v = Video("foo.mkv", "/not-a-real-path/bar", schema_version=1)
     assert v.schema_version == 1
+
+
+def test_get_current_fingerprint(tmp_path):
+    block = FINGERPRINT_BLOCK
+    (tmp_path / "a.mkv").write_bytes(b"a" * block * 3)
+    (tmp_path / "b.mkv").write_bytes(b"a" * block * 3)
+    (tmp_path / "c.mkv").write_bytes(b"a" * block * 3 + b"b")
+    fingerprints = [
+        Video(name, str(tmp_path)).get_current_fingerprint()
+        for name in ("a.mkv", "b.mkv", "c.mkv")
+    ]
+    assert fingerprints[0] == fingerprints[1]
+    assert fingerprints[0] != fingerprints[2]
+    assert Video("missing.mkv", str(tmp_path)).get_current_fingerprint() is None
+
+
+def test_refresh_backfills_fingerprint(tmp_path):
+    (tmp_path / "a.mkv").write_bytes(b"data")
+    v = Video("a.mkv", str(tmp_path), size_b=4)
+    v.dirty = False
+    assert v.refresh() is False
+    assert v.fingerprint is not None
+    assert v.dirty
+
+
+def test_refresh_records_stat(tmp_path):
+    (tmp_path / "a.mkv").write_bytes(b"data")
+    stat = os.stat(tmp_path / "a.mkv")
+    v = Video("a.mkv", str(tmp_path), size_b=4, fingerprint="abc")
+    v.dirty = False
+    assert v.refresh() is False
+    assert (v.mtime, v.inode) == (stat.st_mtime, stat.st_ino)
+    assert v.dirty
+
+    v.dirty = False
+    v.refresh()
+    assert not v.dirty
+
+
+def test_video_slots():
+    v = Video("foo.mkv", "/not-a-real-path/bar")
+    with pytest.raises(AttributeError):
+        _ = v.__dict__
+
+
+def test_video_pickle():
+    v = Video("foo.mkv", "/not-a-real-path/bar", codec=Codec("HEVC"), quality="1080p")
+    v.dirty = False
+    unpickled = pickle.loads(pickle.dumps(v))
+    assert unpickled.full_path == v.full_path
+    assert unpickled.codec is Codec("HEVC")
+    assert unpickled.quality == "1080p"
+    assert unpickled.dirty is False
+
+
+def test_video_interns_values():
+    a = Video(
+        "a.mkv", "".join(["/not-a-real-path/", "bar"]), quality="".join(["S", "D"])
+    )
+    b = Video(
+        "b.mkv", "".join(["/not-a-real-path/", "bar"]), quality="".join(["S", "D"])
+    )
+    assert a.dir_path is b.dir_path
+    assert a.quality is b.quality
@@ -0,0 +1,184 @@
+import os
+import shutil
+import threading
+import time
+from os import path
+
+import pytest
+from mock import patch
+
+from video_utils import fileMap
+from video_utils.watch import InotifySource, PollingSource
+
+SOURCE_VIDEO = path.join(
+    path.dirname(path.abspath(__file__)),
+    "testData",
+    "foo",
+    "test episode - 01x01 - another in 1080p.mkv",
+)
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def show(tmp_path):
+    show_dir = tmp_path / "show"
+    show_dir.mkdir()
+    shutil.copy(SOURCE_VIDEO, show_dir / "show - 01x01.mkv")
+    return show_dir
+
+
+@pytest.fixture
+def watching(show):
+    events = []
+    stop = threading.Event()
+    target = fileMap.FileMap(str(show), progress_bar=False)
+
+    def start(**kwargs):
+        thread = threading.Thread(
+            target=target.watch,
+            args=(lambda event, video: events.append((event, video.name)), stop),
+            kwargs={"settle": 0.2, **kwargs},
+        )
+        thread.start()
+        # The initial load has finished once the first video is in contents
+        assert wait_for(lambda: target._index.get(str(show)))
+        return events
+
+    yield target, start
+    stop.set()
+    wait_for(lambda: threading.active_count() == 1)
+    target.close()
+
+
+def test_watch_added_and_renamed(show, watching):
+    target, start = watching
+    events = start()
+
+    shutil.copy(SOURCE_VIDEO, show / "show - 01x02.mkv.part")
+    os.rename(show / "show - 01x02.mkv.part", show / "show - 01x02.mkv")
+    assert wait_for(lambda: events)
+    assert events == [(fileMap.ScanEvent.ADDED, "show - 01x02.mkv")]
+
+    events.clear()
+    with patch("video_utils.video.probe") as mock_probe:
+        os.rename(show / "show - 01x01.mkv", show / "renamed.mkv")
+        assert wait_for(lambda: len(events) == 2)
+    mock_probe.assert_not_called()
+    assert events == [
+        (fileMap.ScanEvent.REMOVED, "show - 01x01.mkv"),
+        (fileMap.ScanEvent.ADDED, "renamed.mkv"),
+    ]
+    assert sorted(target._index[str(show)]) == ["renamed.mkv", "show - 01x02.mkv"]
+
+
+def test_watch_directories(show, watching):
+    target, start = watching
+    events = start()
+
+    season = show.parent / "season 1"
+    season.mkdir()
+    shutil.copy(SOURCE_VIDEO, season / "show - 01x02.mkv")
+    os.rename(season, show / "season 1")
+    assert wait_for(lambda: events)
+    assert events == [(fileMap.ScanEvent.ADDED, "show - 01x02.mkv")]
+
+    # Files created in the moved-in directory are watched too
+    events.clear()
+    shutil.copy(SOURCE_VIDEO, show / "season 1" / "show - 01x03.mkv")
+    assert wait_for(lambda: events)
+    assert events == [(fileMap.ScanEvent.ADDED, "show - 01x03.mkv")]
+
+    events.clear()
+    shutil.rmtree(show / "season 1")
+    assert wait_for(lambda: len(events) == 2)
+    assert {event for event, _ in events} == {fileMap.ScanEvent.REMOVED}
+    assert target.diff() == fileMap.FileMapDiff(set(), set(), set())
+
+
+def test_watch_sees_files_added_during_load(show, watching):
+    target, start = watching
+    load = fileMap.FileMap.load
+
+    def load_then_add(self, *args, **kwargs):
+        stats = load(self, *args, **kwargs)
+        # Arrives after the load listed the directory
+        shutil.copy(SOURCE_VIDEO, show / "show - 01x02.mkv")
+        return stats
+
+    with patch.object(fileMap.FileMap, "load", load_then_add):
+        events = start()
+        assert wait_for(lambda: events)
+    assert events == [(fileMap.ScanEvent.ADDED, "show - 01x02.mkv")]
+    assert sorted(target._index[str(show)]) == ["show - 01x01.mkv", "show - 01x02.mkv"]
+
+
+def test_watch_polling(show, watching):
+    _, start = watching
+    events = start(use_inotify=False, poll_interval=0.1)
+
+    shutil.copy(SOURCE_VIDEO, show / "show - 01x02.mkv")
+    (show / "show - 01x01.mkv").unlink()
+    assert wait_for(lambda: len(events) == 2)
+    assert sorted(events, key=lambda e: e[1]) == [
+        (fileMap.ScanEvent.REMOVED, "show - 01x01.mkv"),
+        (fileMap.ScanEvent.ADDED, "show - 01x02.mkv"),
+    ]
+
+
+def test_watch_polling_settles_for_a_poll(show):
+    stop = threading.Event()
+    timeouts = []
+
+    class Source:
+        def __init__(self, diff, interval):
+            pass
+
+        def wait(self, timeout):
+            timeouts.append(timeout)
+            if len(timeouts) == 1:
+                return {str(show / "show - 01x01.mkv")}
+            stop.set()
+            return set()
+
+        def close(self):
+            pass
+
+    target = fileMap.FileMap(str(show), progress_bar=False)
+    with patch("video_utils.watch.PollingSource", Source):
+        target.watch(
+            lambda *_: None, stop, settle=0.2, use_inotify=False, poll_interval=5
+        )
+    # Long enough for the next poll to see whether the file is still changing
+    assert timeouts[1] == 5
+    target.close()
+
+
+def test_inotify_source_coalesces_writes(tmp_path):
+    source = InotifySource(str(tmp_path))
+    with open(tmp_path / "a.mkv", "wb") as f:
+        for _ in range(10):
+            f.write(b"\0" * 1024)
+            f.flush()
+    assert source.wait(1) == {str(tmp_path / "a.mkv")}
+    assert source.wait(0.1) == set()
+    source.close()
+
+
+def test_polling_source_reports_new_states(tmp_path):
+    file_path = str(tmp_path / "a.mkv")
+    source = PollingSource(lambda: [file_path], interval=0.1)
+    assert source.wait(1) == {file_path}
+    assert source.wait(0.01) == set()
+    assert source.wait(1) == set()
+
+    (tmp_path / "a.mkv").write_bytes(b"data")
+    assert source.wait(1) == {file_path}
+    assert source.wait(1) == set()